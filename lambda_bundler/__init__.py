@@ -1,6 +1,7 @@
 """Module that exposes the methods from the submodules"""
 import logging
-from lambda_bundler.bundler import build_layer_package, build_lambda_package
+from lambda_bundler.bundler import build_layer_package, build_lambda_package, build_many, build_spec, \
+    write_package, build_layer_packages, build_with_shared_layer, BuildSession, LayerSpec, PackageSpec, SharedLayerBuild
 
 LOGGER = logging.getLogger("lambda_bundler")
 LOGGER.setLevel(logging.DEBUG)
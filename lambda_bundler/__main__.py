@@ -0,0 +1,6 @@
+"""Allows running the command line interface with python -m lambda_bundler."""
+import sys
+
+from lambda_bundler.cli import main
+
+sys.exit(main())
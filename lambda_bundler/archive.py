@@ -0,0 +1,766 @@
+"""
+Contains the zip writer that assembles the archives of the lambda_bundler.
+
+Compressing the entries is the expensive part of building an archive. zlib
+releases the GIL while it works, so the entries are compressed by a pool of
+threads and handed to a single writer that appends them in a stable order.
+"""
+import collections
+import concurrent.futures
+import contextlib
+import hashlib
+import io
+import logging
+import os
+import shutil
+import stat as stat_module
+import struct
+import tempfile
+import time
+import typing
+import zipfile
+import zlib
+
+import lambda_bundler.budget as budget
+import lambda_bundler.cache as cache
+import lambda_bundler.compression as compression
+import lambda_bundler.tracing as tracing
+import lambda_bundler.util as util
+
+LOGGER = logging.getLogger("lambda_bundler")
+
+# Compressed data that exceeds this size is spooled to disk instead of memory
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+# Read and copy files in chunks of this size
+CHUNK_SIZE = 1024 * 1024
+
+# Size of the chunks a ChunkedStream hands on, multipart uploads to S3 need at least 5 MiB per part
+SINK_CHUNK_SIZE = 8 * 1024 * 1024
+
+# The earliest timestamp the zip format can represent
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+# The standard way to pin timestamps in reproducible builds
+SOURCE_DATE_EPOCH_ENV = "SOURCE_DATE_EPOCH"
+
+# Creator system of the entries, the permissions are stored the unix way
+_UNIX_SYSTEM = 3
+
+_LOCAL_FILE_HEADER = struct.Struct("<4s2B4HL2L2H")
+_DATA_DESCRIPTOR_FLAG = 0x08
+_CENTRAL_DIRECTORY = struct.Struct("<4s4B4HL2L5H2L")
+_CENTRAL_DIRECTORY_SIGNATURE = b"PK\001\002"
+_END_OF_CENTRAL_DIRECTORY = struct.Struct("<4s4H2LH")
+_END_OF_CENTRAL_DIRECTORY_SIGNATURE = b"PK\005\006"
+_ZIP64_END_OF_CENTRAL_DIRECTORY = struct.Struct("<4sQ2H2L4Q")
+_ZIP64_END_OF_CENTRAL_DIRECTORY_SIGNATURE = b"PK\006\006"
+_ZIP64_LOCATOR = struct.Struct("<4sLQL")
+_ZIP64_LOCATOR_SIGNATURE = b"PK\006\007"
+_ZIP64_EXTRA_ID = 1
+_ZIP64_VERSION = 45
+_UTF8_FLAG = 0x800
+_MS_DOS_DIRECTORY_FLAG = 0x10
+
+class CompressedEntry(typing.NamedTuple):
+    """An archive entry whose data has already been compressed."""
+    zip_info: zipfile.ZipInfo
+    data: typing.Optional[typing.BinaryIO]
+
+def get_worker_count(workers: int = None) -> int:
+    """
+    Returns the number of threads that compress entries in parallel.
+
+    :param workers: The requested number of workers, defaults to None which means one per CPU.
+    :type workers: int, optional
+    :return: The number of workers to use.
+    :rtype: int
+    """
+    return workers or os.cpu_count() or 1
+
+def get_fixed_date_time() -> typing.Tuple[int, int, int, int, int, int]:
+    """
+    Returns the timestamp of all entries in reproducible archives, which is the one
+    in SOURCE_DATE_EPOCH if it's set and the earliest one a zip can store otherwise.
+
+    :return: The timestamp as year, month, day, hour, minute and second.
+    :rtype: typing.Tuple[int, int, int, int, int, int]
+    """
+
+    source_date_epoch = os.environ.get(SOURCE_DATE_EPOCH_ENV)
+    if not source_date_epoch:
+        return ZIP_EPOCH
+    return max(time.gmtime(int(source_date_epoch))[:6], ZIP_EPOCH)
+
+def normalize_mode(mode: int, is_directory: bool = False) -> int:
+    """
+    Returns the permissions of an entry in reproducible archives, which only
+    depend on whether the entry is a directory or an executable file.
+
+    :param mode: The mode of the file as returned by os.stat.
+    :type mode: int
+    :param is_directory: Whether the entry is a directory, defaults to False
+    :type is_directory: bool, optional
+    :return: The normalized mode.
+    :rtype: int
+    """
+
+    if is_directory:
+        return stat_module.S_IFDIR | 0o755
+    if mode & 0o111:
+        return stat_module.S_IFREG | 0o755
+    return stat_module.S_IFREG | 0o644
+
+def create_zip_info(arcname: str, stat: os.stat_result, is_directory: bool = False) -> zipfile.ZipInfo:
+    """
+    Creates the ZipInfo for a file or directory from the result of os.stat. In
+    reproducible mode the timestamp is fixed and the permissions are normalized.
+
+    :param arcname: Name of the entry in the archive.
+    :type arcname: str
+    :param stat: Result of os.stat for the file or directory.
+    :type stat: os.stat_result
+    :param is_directory: Whether the entry is a directory, defaults to False
+    :type is_directory: bool, optional
+    :return: The ZipInfo for the entry.
+    :rtype: zipfile.ZipInfo
+    """
+
+    if util.is_reproducible():
+        zip_info = zipfile.ZipInfo(arcname, get_fixed_date_time())
+        zip_info.external_attr = normalize_mode(stat.st_mode, is_directory) << 16
+        zip_info.create_system = _UNIX_SYSTEM
+    else:
+        # Timestamps before 1980 can't be stored in a zip
+        zip_info = zipfile.ZipInfo(arcname, max(time.localtime(stat.st_mtime)[:6], ZIP_EPOCH))
+        zip_info.external_attr = (stat.st_mode & 0xFFFF) << 16
+
+    zip_info.CRC = zip_info.file_size = zip_info.compress_size = 0
+
+    if is_directory:
+        zip_info.external_attr |= _MS_DOS_DIRECTORY_FLAG
+    else:
+        zip_info.compress_type = zipfile.ZIP_DEFLATED
+
+    return zip_info
+
+def _get_compression_settings(compress_type: int, level: typing.Optional[int]) -> str:
+    if compress_type == zipfile.ZIP_STORED:
+        return "stored"
+    # zlib treats the default level as 6
+    return f"deflate{6 if level == zlib.Z_DEFAULT_COMPRESSION else level}"
+
+def compress_source(entry: util.SourceEntry,
+                    level: int = None,
+                    content_hash: str = None) -> CompressedEntry:
+    """
+    Compresses a file or directory that has been found by one of the walk functions.
+    If the content_hash of the file is known, the compressed data is taken from or
+    added to the entry cache.
+
+    :param entry: The entry to compress.
+    :type entry: util.SourceEntry
+    :param level: The zlib compression level, defaults to None which means the compression policy decides.
+    :type level: int, optional
+    :param content_hash: The sha256 of the file content, defaults to None
+    :type content_hash: str, optional
+    :return: The compressed entry, the caller has to close its data.
+    :rtype: CompressedEntry
+    """
+
+    zip_info = create_zip_info(entry.arcname, entry.stat, entry.is_directory)
+
+    if entry.is_directory:
+        return CompressedEntry(zip_info, None)
+
+    if level is None:
+        zip_info.compress_type, level = compression.choose_compression(
+            entry.path, entry.stat.st_size, compression.get_policy()
+        )
+
+    settings = _get_compression_settings(zip_info.compress_type, level)
+
+    if content_hash:
+        cached_entry = cache.open_compressed_entry(content_hash, settings)
+        if cached_entry is not None:
+            zip_info.CRC = cached_entry.crc
+            zip_info.file_size = cached_entry.file_size
+            zip_info.compress_size = cached_entry.compress_size
+            return CompressedEntry(zip_info, cached_entry.data)
+
+    crc = 0
+    file_size = 0
+    file_hash = hashlib.sha256()
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS) if level is not None else None
+
+    with contextlib.ExitStack() as stack:
+        data = stack.enter_context(tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE))
+
+        with open(entry.path, "rb") as handle:
+            for chunk in iter(lambda: handle.read(CHUNK_SIZE), b""):
+                crc = zlib.crc32(chunk, crc)
+                file_size += len(chunk)
+                file_hash.update(chunk)
+                data.write(compressor.compress(chunk) if compressor is not None else chunk)
+
+        if compressor is not None:
+            data.write(compressor.flush())
+
+        zip_info.CRC = crc
+        zip_info.file_size = file_size
+        zip_info.compress_size = data.tell()
+        data.seek(0)
+
+        # Don't cache content that changed after it has been hashed
+        if content_hash == file_hash.hexdigest():
+            cache.store_compressed_entry(content_hash, settings, crc, file_size, data)
+
+        # The caller closes the data
+        stack.pop_all()
+
+    return CompressedEntry(zip_info, data)
+
+def compress_bytes(arcname: str, content: bytes, mode: int = 0o644) -> CompressedEntry:
+    """
+    Compresses a file that only exists in memory, e.g. generated metadata.
+
+    :param arcname: Name of the entry in the archive.
+    :type arcname: str
+    :param content: Content of the file.
+    :type content: bytes
+    :param mode: Permissions of the file, defaults to 0o644
+    :type mode: int, optional
+    :return: The compressed entry, the caller has to close its data.
+    :rtype: CompressedEntry
+    """
+
+    now = time.time()
+    stat = os.stat_result((stat_module.S_IFREG | mode, 0, 0, 1, 0, 0, len(content), now, now, now))
+    zip_info = create_zip_info(arcname, stat)
+
+    compressor = zlib.compressobj(compression.get_policy().level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    compressed_content = compressor.compress(content) + compressor.flush()
+
+    zip_info.CRC = zlib.crc32(content)
+    zip_info.file_size = len(content)
+    zip_info.compress_size = len(compressed_content)
+    return CompressedEntry(zip_info, io.BytesIO(compressed_content))
+
+def _compress_hashed_source(hashed_entry: typing.Tuple[util.SourceEntry, str]) -> CompressedEntry:
+    entry, content_hash = hashed_entry
+    return compress_source(entry, content_hash=content_hash)
+
+def _ordered_parallel_map(function: typing.Callable, items: typing.Iterable,
+                          workers: int) -> typing.Iterator:
+
+    if workers <= 1:
+        yield from map(function, items)
+        return
+
+    # Only keep a few results in flight, so memory usage stays bounded
+    # no matter how many items there are.
+    # The threads compress with the settings of the session that started them
+    bound_function = util.bind_active(function)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+
+        for item in items:
+            pending.append(executor.submit(bound_function, item))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+def _encode_filename(zip_info: zipfile.ZipInfo) -> typing.Tuple[bytes, int]:
+    try:
+        return zip_info.filename.encode("ascii"), zip_info.flag_bits
+    except UnicodeEncodeError:
+        return zip_info.filename.encode("utf-8"), zip_info.flag_bits | _UTF8_FLAG
+
+def _strip_zip64_extra(extra: bytes) -> bytes:
+    stripped = b""
+    position = 0
+    while position + 4 <= len(extra):
+        field_id, field_size = struct.unpack("<HH", extra[position:position + 4])
+        if field_id != _ZIP64_EXTRA_ID:
+            stripped += extra[position:position + 4 + field_size]
+        position += 4 + field_size
+    return stripped
+
+def _remove_if_exists(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class _LimitedReader:
+    """Reads at most size bytes from the current position of a stream."""
+
+    def __init__(self, stream: typing.BinaryIO, size: int):
+        self._stream = stream
+        self._remaining = size
+
+    def read(self, size: int = -1) -> bytes:
+        """Reads up to size bytes, all remaining bytes if size is negative."""
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._stream.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self) -> None:
+        """The underlying stream is closed by its owner."""
+
+class ChunkedStream:
+    """
+    Writable binary stream that hands the data written to it to a function in chunks,
+    e.g. to upload the parts of an archive while the rest is still being compressed.
+    All chunks have chunk_size bytes except the last one, which is handed on by close.
+    """
+
+    def __init__(self, callback: typing.Callable[[bytes], None], chunk_size: int = SINK_CHUNK_SIZE):
+        """
+        :param callback: Function that's called with each chunk.
+        :type callback: typing.Callable[[bytes], None]
+        :param chunk_size: Size of the chunks, defaults to SINK_CHUNK_SIZE
+        :type chunk_size: int, optional
+        """
+        self._callback = callback
+        self._chunk_size = chunk_size
+        self._buffer = bytearray()
+        self._position = 0
+        self.closed = False
+
+    def write(self, data: bytes) -> int:
+        """Adds data to the stream, full chunks are handed on right away."""
+        self._buffer += data
+        self._position += len(data)
+        while len(self._buffer) >= self._chunk_size:
+            chunk = bytes(self._buffer[:self._chunk_size])
+            del self._buffer[:self._chunk_size]
+            self._callback(chunk)
+        return len(data)
+
+    def tell(self) -> int:
+        """Returns the number of bytes written."""
+        return self._position
+
+    def flush(self) -> None:
+        """Chunks are only handed on once they're full, see close."""
+
+    def close(self) -> None:
+        """Hands on the remaining data as the last chunk."""
+        if self.closed:
+            return
+        self.closed = True
+        if self._buffer:
+            self._callback(bytes(self._buffer))
+            self._buffer = bytearray()
+
+    def __enter__(self) -> "ChunkedStream":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # The rest of a failed archive isn't handed on
+        if exc_type is None:
+            self.close()
+
+class ZipWriter:
+    """
+    Writes a zip archive from entries that have been compressed beforehand.
+    Use it as a context manager, the central directory is written on exit.
+    """
+
+    def __init__(self, stream: typing.BinaryIO,
+                 existing_entries: typing.List[zipfile.ZipInfo] = None,
+                 offset: int = 0, owns_stream: bool = False,
+                 size_budget: budget.SizeBudget = None):
+        """
+        :param stream: The writable binary stream the archive is written to.
+        :type stream: typing.BinaryIO
+        :param existing_entries: Entries that are already in the stream, defaults to None
+        :type existing_entries: typing.List[zipfile.ZipInfo], optional
+        :param offset: The position in the archive the stream is at, defaults to 0
+        :type offset: int, optional
+        :param owns_stream: Whether the writer closes the stream on exit, defaults to False
+        :type owns_stream: bool, optional
+        :param size_budget: Budget the archive has to fit into, defaults to None which means no budget.
+        :type size_budget: budget.SizeBudget, optional
+        """
+        self._stream = stream
+        self._entries = list(existing_entries or [])
+        self._names = set(zip_info.filename for zip_info in self._entries)
+        self._offset = offset
+        self._owns_stream = owns_stream
+        self._tracker = None
+        self._replaced_path = None
+
+        if size_budget is not None:
+            self._tracker = budget.SizeTracker(size_budget, getattr(stream, "name", "The archive"))
+            for zip_info in self._entries:
+                self._tracker.add(zip_info, compressed_bytes=_CENTRAL_DIRECTORY.size + len(zip_info.filename))
+            self._tracker.compressed_bytes += offset
+            self._tracker.check()
+
+    @classmethod
+    def create(cls, path_to_zip: str, size_budget: budget.SizeBudget = None) -> "ZipWriter":
+        """
+        Returns a writer for a new archive at path_to_zip, an existing file is replaced.
+
+        :param path_to_zip: Path to the archive.
+        :type path_to_zip: str
+        :param size_budget: Budget the archive has to fit into, defaults to None which means no budget.
+        :type size_budget: budget.SizeBudget, optional
+        :return: The writer.
+        :rtype: ZipWriter
+        """
+        with contextlib.ExitStack() as stack:
+            stream = stack.enter_context(open(path_to_zip, "wb"))
+            writer = cls(stream, owns_stream=True, size_budget=size_budget)
+            # The writer closes the stream from now on
+            stack.pop_all()
+
+        return writer
+
+    @classmethod
+    def append(cls, path_to_zip: str, size_budget: budget.SizeBudget = None) -> "ZipWriter":
+        """
+        Returns a writer that adds entries to the existing archive at path_to_zip. The
+        entries are added to a copy next to it that replaces the archive on exit, so
+        the archive stays intact if writing fails, e.g. because it exceeds the budget.
+
+        :param path_to_zip: Path to the archive.
+        :type path_to_zip: str
+        :param size_budget: Budget the archive has to fit into, defaults to None which means no budget.
+        :type size_budget: budget.SizeBudget, optional
+        :return: The writer.
+        :rtype: ZipWriter
+        """
+
+        with zipfile.ZipFile(path_to_zip) as existing_zip:
+            existing_entries = existing_zip.infolist()
+            # New entries overwrite the old central directory
+            offset = existing_zip.start_dir
+
+        temporary_path = cache.get_temporary_path(path_to_zip)
+        with contextlib.ExitStack() as stack:
+            stack.callback(_remove_if_exists, temporary_path)
+            shutil.copyfile(path_to_zip, temporary_path)
+            shutil.copymode(path_to_zip, temporary_path)
+
+            stream = stack.enter_context(open(temporary_path, "r+b"))
+            stream.seek(offset)
+            writer = cls(stream, existing_entries, offset, owns_stream=True, size_budget=size_budget)
+            writer._replaced_path = path_to_zip
+
+            # The writer closes the stream and moves or removes the copy from now on
+            stack.pop_all()
+
+        return writer
+
+    def __enter__(self) -> "ZipWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        complete = False
+        try:
+            if exc_type is None:
+                self._write_central_directory()
+                complete = True
+        finally:
+            if self._owns_stream:
+                self._stream.close()
+            if self._replaced_path is not None:
+                if complete:
+                    os.replace(self._stream.name, self._replaced_path)
+                else:
+                    _remove_if_exists(self._stream.name)
+
+    def __contains__(self, arcname: str) -> bool:
+        return arcname in self._names
+
+    @property
+    def size(self) -> int:
+        """The number of bytes in the archive so far, including the central directory once it's written."""
+        return self._offset
+
+    def _write(self, data: bytes) -> None:
+        self._stream.write(data)
+        self._offset += len(data)
+
+    def write(self, entry: CompressedEntry) -> None:
+        """
+        Appends the compressed entry to the archive.
+
+        :param entry: The entry to append.
+        :type entry: CompressedEntry
+        :return: Nothing.
+        :rtype: None
+        """
+
+        zip_info = entry.zip_info
+        zip_info.header_offset = self._offset
+
+        zip64 = max(zip_info.file_size, zip_info.compress_size) > zipfile.ZIP64_LIMIT
+        header = zip_info.FileHeader(zip64)
+
+        if self._tracker is not None:
+            # Abort before the data of an entry that doesn't fit is written
+            self._tracker.add(zip_info, compressed_bytes=len(header) + zip_info.compress_size
+                              + _CENTRAL_DIRECTORY.size + len(zip_info.filename))
+
+        self._write(header)
+
+        if entry.data is not None:
+            for chunk in iter(lambda: entry.data.read(CHUNK_SIZE), b""):
+                self._write(chunk)
+
+        self._entries.append(zip_info)
+        self._names.add(zip_info.filename)
+
+    def _write_central_directory(self) -> None:
+
+        start_of_central_directory = self._offset
+
+        for zip_info in self._entries:
+
+            dosdate = (zip_info.date_time[0] - 1980) << 9 | zip_info.date_time[1] << 5 | zip_info.date_time[2]
+            dostime = zip_info.date_time[3] << 11 | zip_info.date_time[4] << 5 | (zip_info.date_time[5] // 2)
+
+            zip64_fields = []
+            file_size, compress_size = zip_info.file_size, zip_info.compress_size
+            if max(file_size, compress_size) > zipfile.ZIP64_LIMIT:
+                zip64_fields += [file_size, compress_size]
+                file_size = compress_size = 0xFFFFFFFF
+
+            header_offset = zip_info.header_offset
+            if header_offset > zipfile.ZIP64_LIMIT:
+                zip64_fields.append(header_offset)
+                header_offset = 0xFFFFFFFF
+
+            extra = _strip_zip64_extra(zip_info.extra)
+            extract_version, create_version = zip_info.extract_version, zip_info.create_version
+            if zip64_fields:
+                extra = struct.pack(f"<HH{len(zip64_fields)}Q", _ZIP64_EXTRA_ID,
+                                    8 * len(zip64_fields), *zip64_fields) + extra
+                extract_version = max(extract_version, _ZIP64_VERSION)
+                create_version = max(create_version, _ZIP64_VERSION)
+
+            filename, flag_bits = _encode_filename(zip_info)
+            self._write(_CENTRAL_DIRECTORY.pack(
+                _CENTRAL_DIRECTORY_SIGNATURE, create_version, zip_info.create_system,
+                extract_version, zip_info.reserved, flag_bits, zip_info.compress_type,
+                dostime, dosdate, zip_info.CRC, compress_size, file_size, len(filename),
+                len(extra), len(zip_info.comment), 0, zip_info.internal_attr,
+                zip_info.external_attr, header_offset
+            ))
+            self._write(filename + extra + zip_info.comment)
+
+        self._write_end_of_central_directory(start_of_central_directory)
+
+        if self._owns_stream:
+            # Appending may have produced a shorter archive than before
+            self._stream.truncate()
+
+    def _write_end_of_central_directory(self, start_of_central_directory: int) -> None:
+
+        end_of_central_directory = self._offset
+        count = len(self._entries)
+        size = end_of_central_directory - start_of_central_directory
+
+        if count > zipfile.ZIP_FILECOUNT_LIMIT or start_of_central_directory > zipfile.ZIP64_LIMIT \
+                or size > zipfile.ZIP64_LIMIT:
+            self._write(_ZIP64_END_OF_CENTRAL_DIRECTORY.pack(
+                _ZIP64_END_OF_CENTRAL_DIRECTORY_SIGNATURE, 44, _ZIP64_VERSION, _ZIP64_VERSION,
+                0, 0, count, count, size, start_of_central_directory
+            ))
+            self._write(_ZIP64_LOCATOR.pack(
+                _ZIP64_LOCATOR_SIGNATURE, 0, end_of_central_directory, 1
+            ))
+            count = min(count, 0xFFFF)
+            size = min(size, 0xFFFFFFFF)
+            start_of_central_directory = min(start_of_central_directory, 0xFFFFFFFF)
+
+        self._write(_END_OF_CENTRAL_DIRECTORY.pack(
+            _END_OF_CENTRAL_DIRECTORY_SIGNATURE, 0, 0, count, count,
+            size, start_of_central_directory, 0
+        ))
+
+def _write_compressed(writer: ZipWriter, compressed_entries: typing.Iterable[CompressedEntry]) -> None:
+    # Entries are compressed while they're consumed, so the span covers both
+    with tracing.span("compress", files=0, bytes=0, compressed_bytes=0) as attributes:
+        for compressed_entry in compressed_entries:
+            try:
+                writer.write(compressed_entry)
+            finally:
+                if compressed_entry.data is not None:
+                    compressed_entry.data.close()
+            attributes["files"] += 1
+            attributes["bytes"] += compressed_entry.zip_info.file_size
+            attributes["compressed_bytes"] += compressed_entry.zip_info.compress_size
+
+def write_sources(writer: ZipWriter, entries: typing.Iterable[util.SourceEntry],
+                  workers: int = None) -> None:
+    """
+    Compresses the entries in parallel and appends them to the archive in their original order.
+
+    :param writer: The writer of the archive.
+    :type writer: ZipWriter
+    :param entries: The files and empty directories to add.
+    :type entries: typing.Iterable[util.SourceEntry]
+    :param workers: Number of threads that compress entries, defaults to None which means one per CPU.
+    :type workers: int, optional
+    :return: Nothing.
+    :rtype: None
+    """
+
+    _write_compressed(writer, _ordered_parallel_map(compress_source, entries, get_worker_count(workers)))
+
+def write_hashed_sources(writer: ZipWriter,
+                         hashed_entries: typing.Iterable[typing.Tuple[util.SourceEntry, str]],
+                         workers: int = None) -> None:
+    """
+    Like write_sources, but for entries with a known content hash (see cache.hash_sources).
+    Files that have been compressed before are taken from the entry cache.
+
+    :param writer: The writer of the archive.
+    :type writer: ZipWriter
+    :param hashed_entries: The (entry, content hash) tuples to add.
+    :type hashed_entries: typing.Iterable[typing.Tuple[util.SourceEntry, str]]
+    :param workers: Number of threads that compress entries, defaults to None which means one per CPU.
+    :type workers: int, optional
+    :return: Nothing.
+    :rtype: None
+    """
+
+    _write_compressed(
+        writer,
+        _ordered_parallel_map(_compress_hashed_source, hashed_entries, get_worker_count(workers))
+    )
+
+def copy_entries(writer: ZipWriter, path_to_zip: str, prefix: str = None,
+                 include: typing.Callable[[str], bool] = None,
+                 rename: typing.Callable[[str], typing.Optional[str]] = None) -> None:
+    """
+    Copies the entries of the archive at path_to_zip to the writer without decompressing
+    and compressing them again. Entries that are already in the writer are skipped.
+
+    :param writer: The writer of the target archive.
+    :type writer: ZipWriter
+    :param path_to_zip: Path to the archive to copy from.
+    :type path_to_zip: str
+    :param prefix: Directory the entries are placed in, defaults to None
+    :type prefix: str, optional
+    :param include: Function that decides by the name of an entry if it's copied, defaults to None which copies all.
+    :type include: typing.Callable[[str], bool], optional
+    :param rename: Function that returns the new name of an entry or None to skip it, defaults to None
+                   which keeps the names. Include and prefix apply to the new name.
+    :type rename: typing.Callable[[str], typing.Optional[str]], optional
+    :return: Nothing.
+    :rtype: None
+    """
+
+    with zipfile.ZipFile(path_to_zip) as source_zip:
+        source_entries = []
+        for source_info in source_zip.infolist():
+            name = source_info.filename if rename is None else rename(source_info.filename)
+            if name is not None and (include is None or include(name)):
+                source_entries.append((name, source_info))
+
+    reproducible = util.is_reproducible()
+    with open(path_to_zip, "rb") as handle, \
+        tracing.span("copy_entries", source=path_to_zip, files=0, compressed_bytes=0) as attributes:
+        for name, source_info in source_entries:
+
+            arcname = f"{prefix}/{name}" if prefix else name
+            if arcname in writer:
+                LOGGER.debug("Skipping duplicate entry '%s' from '%s'", arcname, path_to_zip)
+                continue
+
+            handle.seek(source_info.header_offset)
+            local_header = _LOCAL_FILE_HEADER.unpack(handle.read(_LOCAL_FILE_HEADER.size))
+            handle.seek(local_header[-2] + local_header[-1], os.SEEK_CUR)
+
+            zip_info = zipfile.ZipInfo(arcname, source_info.date_time)
+            zip_info.compress_type = source_info.compress_type
+            zip_info.external_attr = source_info.external_attr
+            zip_info.create_system = source_info.create_system
+            if reproducible:
+                # Archives from elsewhere may have been built differently
+                zip_info.date_time = get_fixed_date_time()
+                zip_info.external_attr = normalize_mode(source_info.external_attr >> 16, source_info.is_dir()) << 16
+                zip_info.external_attr |= _MS_DOS_DIRECTORY_FLAG if source_info.is_dir() else 0
+                zip_info.create_system = _UNIX_SYSTEM
+            # The sizes are known upfront, so there is no data descriptor after the data
+            zip_info.flag_bits = source_info.flag_bits & ~_DATA_DESCRIPTOR_FLAG
+            zip_info.CRC = source_info.CRC
+            zip_info.file_size = source_info.file_size
+            zip_info.compress_size = source_info.compress_size
+
+            writer.write(CompressedEntry(zip_info, _LimitedReader(handle, source_info.compress_size)))
+            attributes["files"] += 1
+            attributes["compressed_bytes"] += source_info.compress_size
+
+def zip_directory(directory: str, path_to_zip: str, workers: int = None,
+                  size_budget: budget.SizeBudget = None) -> str:
+    """
+    Creates a zip archive at path_to_zip with the content of directory.
+
+    :param directory: The directory to archive.
+    :type directory: str
+    :param path_to_zip: Path to the archive.
+    :type path_to_zip: str
+    :param workers: Number of threads that compress entries, defaults to None which means one per CPU.
+    :type workers: int, optional
+    :param size_budget: Budget the archive has to fit into, defaults to None which means no budget.
+    :type size_budget: budget.SizeBudget, optional
+    :raises budget.BudgetExceededError: If the archive grows beyond the budget.
+    :return: Path to the archive.
+    :rtype: str
+    """
+
+    LOGGER.debug("Zipping '%s' to '%s'", directory, path_to_zip)
+
+    with ZipWriter.create(path_to_zip, size_budget) as writer:
+        write_sources(writer, util.walk_directory(directory), workers)
+
+    return path_to_zip
+
+def extend_zip(path_to_zip: str, code_directories: typing.List[str],
+               exclude_patterns: typing.List[str] = None, workers: int = None,
+               size_budget: budget.SizeBudget = None) -> None:
+    """
+    This functions extends an existing zip archive with code from the code_directories
+    while ignoring the exclude_patterns.
+
+    :param path_to_zip: The path to the zip file to edit.
+    :type path_to_zip: str
+    :param code_directories: A list of directories that should be included in the zip.
+    :type code_directories: typing.List[str]
+    :param exclude_patterns: A list of glob patterns to exclude from the zip, defaults to None
+    :type exclude_patterns: typing.List[str], optional
+    :param workers: Number of threads that compress entries, defaults to None which means one per CPU.
+    :type workers: int, optional
+    :param size_budget: Budget the archive has to fit into, defaults to None which means no budget.
+    :type size_budget: budget.SizeBudget, optional
+    :raises budget.BudgetExceededError: If the archive grows beyond the budget.
+    :return: Nothing.
+    :rtype: None
+    """
+
+    # Build the exclude patterns
+    exclude_patterns = exclude_patterns or []
+    exclude_patterns = exclude_patterns + util.DEFAULT_EXCLUDE_LIST
+
+    LOGGER.debug("Extending '%s' with code from %s", path_to_zip, code_directories)
+
+    hashed_entries = [
+        hashed_entry for directory in code_directories
+        for hashed_entry in cache.hash_sources(directory, exclude_patterns)
+    ]
+
+    with ZipWriter.append(path_to_zip, size_budget) as writer:
+        write_hashed_sources(writer, hashed_entries, workers)
+
+    LOGGER.debug("Zip extended.")
@@ -0,0 +1,135 @@
+"""
+Contains the shared cache backends. A shared cache lets multiple machines, e.g.
+CI runners, reuse the artifacts one of them has built. The build directory acts
+as a near cache in front of it.
+"""
+import abc
+import logging
+import os
+import pathlib
+import shutil
+import typing
+import uuid
+
+import lambda_bundler.util as util
+
+LOGGER = logging.getLogger("lambda_bundler")
+
+SHARED_CACHE_DIR_ENV = "LAMBDA_BUNDLER_SHARED_CACHE_DIR"
+
+class CacheBackend(abc.ABC):
+    """
+    Interface of shared caches, artifacts are identified by a key that is
+    unique for their content and the environment they've been built in.
+    """
+
+    @abc.abstractmethod
+    def lookup(self, key: str) -> bool:
+        """
+        Checks if the cache has an artifact for key.
+
+        :param key: The key of the artifact.
+        :type key: str
+        :return: Whether the artifact exists.
+        :rtype: bool
+        """
+
+    @abc.abstractmethod
+    def fetch(self, key: str, destination_path: str) -> bool:
+        """
+        Copies the artifact for key to destination_path.
+
+        :param key: The key of the artifact.
+        :type key: str
+        :param destination_path: The path to write the artifact to.
+        :type destination_path: str
+        :return: Whether the artifact exists and has been copied.
+        :rtype: bool
+        """
+
+    @abc.abstractmethod
+    def publish(self, key: str, source_path: str) -> None:
+        """
+        Stores the artifact at source_path under key, so others can fetch it.
+
+        :param key: The key of the artifact.
+        :type key: str
+        :param source_path: The path to the artifact.
+        :type source_path: str
+        :return: Nothing.
+        :rtype: None
+        """
+
+class DirectoryBackend(CacheBackend):
+    """
+    Shared cache in a directory, e.g. on a network file system that is mounted
+    on all machines.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def __repr__(self) -> str:
+        return f"DirectoryBackend({self.directory!r})"
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.zip")
+
+    def lookup(self, key: str) -> bool:
+        return os.path.isfile(self._get_path(key))
+
+    def fetch(self, key: str, destination_path: str) -> bool:
+        try:
+            shutil.copyfile(self._get_path(key), destination_path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def publish(self, key: str, source_path: str) -> None:
+
+        path = self._get_path(key)
+        if os.path.exists(path):
+            # Someone else has built the same artifact in the meantime
+            return
+
+        pathlib.Path(os.path.dirname(path)).mkdir(parents=True, exist_ok=True)
+
+        # Copy to a temporary file first, others must never see a partial artifact
+        temporary_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            shutil.copyfile(source_path, temporary_path)
+            os.replace(temporary_path, path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+_BACKEND: typing.Optional[CacheBackend] = None
+
+def set_backend(backend: typing.Optional[CacheBackend]) -> None:
+    """
+    Sets the shared cache backend of this process, it takes precedence over
+    the LAMBDA_BUNDLER_SHARED_CACHE_DIR environment variable.
+
+    :param backend: The backend or None to fall back to the environment variable.
+    :type backend: typing.Optional[CacheBackend]
+    :return: Nothing.
+    :rtype: None
+    """
+
+    global _BACKEND # pylint: disable=global-statement
+    _BACKEND = backend
+
+def get_backend() -> typing.Optional[CacheBackend]:
+    """
+    Returns the shared cache backend, which is the one that has been set or a
+    DirectoryBackend for the directory in LAMBDA_BUNDLER_SHARED_CACHE_DIR.
+
+    :return: The backend or None if there is no shared cache.
+    :rtype: typing.Optional[CacheBackend]
+    """
+
+    if _BACKEND is not None:
+        return _BACKEND
+
+    directory = util.get_setting(SHARED_CACHE_DIR_ENV)
+    return DirectoryBackend(directory) if directory else None
@@ -0,0 +1,266 @@
+"""
+Contains the size analysis of archives and the budgets they have to fit into.
+Lambda rejects packages that exceed its limits only when they're deployed, so
+archives are checked while they're written and the build aborts early.
+"""
+import collections
+import logging
+import os
+import typing
+import zipfile
+
+import lambda_bundler.cache as cache
+import lambda_bundler.util as util
+
+LOGGER = logging.getLogger("lambda_bundler")
+
+MAX_ZIPPED_BYTES_ENV = "LAMBDA_BUNDLER_MAX_ZIPPED_BYTES"
+MAX_UNZIPPED_BYTES_ENV = "LAMBDA_BUNDLER_MAX_UNZIPPED_BYTES"
+
+# Limits of Lambda for directly uploaded and for extracted deployment packages. Packages
+# that are deployed from S3, like the CDK does, may be larger zipped, so only the limit
+# for the extracted package, which applies to every deployment, is enforced by default.
+LAMBDA_MAX_ZIPPED_BYTES = 50 * 1024 * 1024
+LAMBDA_MAX_UNZIPPED_BYTES = 250 * 1024 * 1024
+
+# Values of the environment variables that disable a limit
+_UNLIMITED_VALUES = {"none", "off", "unlimited"}
+
+# Layers install their packages in this directory
+_LAYER_PREFIX = "python/"
+
+# Size of the central directory record of an entry without its name
+_CENTRAL_DIRECTORY_RECORD_SIZE = 46
+
+# Number of packages that are named in the error message
+_LARGEST_PACKAGE_COUNT = 5
+
+class SizeBudget(typing.NamedTuple):
+    """The sizes an archive may not exceed, None means there is no limit."""
+    max_compressed_bytes: typing.Optional[int]
+    max_uncompressed_bytes: typing.Optional[int]
+
+UNLIMITED = SizeBudget(None, None)
+
+class BudgetExceededError(Exception):
+    """Raised when an archive grows beyond its size budget."""
+
+    def __init__(self, message: str, compressed_bytes: int, uncompressed_bytes: int,
+                 size_budget: SizeBudget):
+        super().__init__(message)
+        self.compressed_bytes = compressed_bytes
+        self.uncompressed_bytes = uncompressed_bytes
+        self.size_budget = size_budget
+
+    def __reduce__(self):
+        # Errors of worker processes are pickled, only the message would be passed to __init__ otherwise
+        return (self.__class__, (self.args[0], self.compressed_bytes, self.uncompressed_bytes, self.size_budget))
+
+class SizeEntry(typing.NamedTuple):
+    """The sizes of a package, directory or file in an archive."""
+    name: str
+    compressed_bytes: int
+    uncompressed_bytes: int
+    file_count: int
+
+class SizeReport(collections.namedtuple("SizeReport",
+                                        ["path", "compressed_bytes", "uncompressed_bytes", "file_count",
+                                         "packages", "directories", "files"])):
+    """
+    The sizes of an archive broken down by top-level package, directory and file.
+    The packages, directories and files are lists of SizeEntry.
+    """
+    __slots__ = ()
+
+    def to_dict(self) -> dict:
+        """
+        Returns the report as a dictionary that can be serialized to JSON.
+
+        :return: The report.
+        :rtype: dict
+        """
+
+        report = self._asdict()
+        for key in ["packages", "directories", "files"]:
+            report[key] = [entry._asdict() for entry in report[key]]
+        return report
+
+def _parse_limit(environment_variable: str, default: int) -> typing.Optional[int]:
+
+    value = util.get_setting(environment_variable, "").strip()
+    if not value:
+        return default
+    if value.lower() in _UNLIMITED_VALUES:
+        return None
+
+    try:
+        return cache.parse_size(value)
+    except ValueError:
+        LOGGER.warning("Ignoring %s, '%s' is not a size like 50M or 250M", environment_variable, value)
+        return default
+
+def get_budget() -> SizeBudget:
+    """
+    Returns the size budget from the LAMBDA_BUNDLER_MAX_ZIPPED_BYTES and
+    LAMBDA_BUNDLER_MAX_UNZIPPED_BYTES environment variables. There is no zipped
+    limit by default, the unzipped one defaults to the limit of Lambda. Set them
+    to none to disable a limit.
+
+    :return: The budget.
+    :rtype: SizeBudget
+    """
+
+    return SizeBudget(
+        max_compressed_bytes=_parse_limit(MAX_ZIPPED_BYTES_ENV, None),
+        max_uncompressed_bytes=_parse_limit(MAX_UNZIPPED_BYTES_ENV, LAMBDA_MAX_UNZIPPED_BYTES)
+    )
+
+def get_package_name(arcname: str) -> str:
+    """
+    Returns the top-level package, module or file an entry belongs to. The
+    python directory of layers is skipped.
+
+    :param arcname: Name of the entry in the archive.
+    :type arcname: str
+    :return: The name of the top-level package.
+    :rtype: str
+    """
+
+    if arcname.startswith(_LAYER_PREFIX) and arcname != _LAYER_PREFIX:
+        arcname = arcname[len(_LAYER_PREFIX):]
+    return arcname.split("/")[0]
+
+def _format_largest(package_sizes: typing.Dict[str, int]) -> str:
+    largest = sorted(package_sizes.items(), key=lambda item: (-item[1], item[0]))[:_LARGEST_PACKAGE_COUNT]
+    return ", ".join(f"{name} ({size} bytes)" for name, size in largest)
+
+class SizeTracker:
+    """
+    Keeps running totals of the entries written to an archive and raises a
+    BudgetExceededError as soon as they cross the budget.
+    """
+
+    def __init__(self, size_budget: SizeBudget, name: str = "archive"):
+        """
+        :param size_budget: The budget of the archive.
+        :type size_budget: SizeBudget
+        :param name: Name of the archive in error messages, defaults to archive
+        :type name: str, optional
+        """
+        self.size_budget = size_budget
+        self.name = name
+        self.compressed_bytes = 0
+        self.uncompressed_bytes = 0
+        self._uncompressed_package_bytes = collections.Counter()
+
+    def add(self, zip_info: zipfile.ZipInfo, compressed_bytes: int = None) -> None:
+        """
+        Adds an entry to the totals.
+
+        :param zip_info: The entry, its sizes have to be set.
+        :type zip_info: zipfile.ZipInfo
+        :param compressed_bytes: Bytes the entry takes up in the archive, defaults to None
+                                 which means its compressed size plus the central directory record.
+        :type compressed_bytes: int, optional
+        :raises BudgetExceededError: If a total exceeds the budget.
+        :return: Nothing.
+        :rtype: None
+        """
+
+        if compressed_bytes is None:
+            compressed_bytes = zip_info.compress_size + _CENTRAL_DIRECTORY_RECORD_SIZE + len(zip_info.filename)
+
+        self.compressed_bytes += compressed_bytes
+        self.uncompressed_bytes += zip_info.file_size
+        self._uncompressed_package_bytes[get_package_name(zip_info.filename)] += zip_info.file_size
+        self.check()
+
+    def check(self) -> None:
+        """
+        Checks the totals against the budget.
+
+        :raises BudgetExceededError: If a total exceeds the budget.
+        :return: Nothing.
+        :rtype: None
+        """
+
+        max_compressed_bytes, max_uncompressed_bytes = self.size_budget
+
+        if max_uncompressed_bytes is not None and self.uncompressed_bytes > max_uncompressed_bytes:
+            message = f"{self.name} exceeds the budget of {max_uncompressed_bytes} uncompressed bytes " \
+                      f"with {self.uncompressed_bytes} bytes"
+        elif max_compressed_bytes is not None and self.compressed_bytes > max_compressed_bytes:
+            message = f"{self.name} exceeds the budget of {max_compressed_bytes} compressed bytes " \
+                      f"with {self.compressed_bytes} bytes"
+        else:
+            return
+
+        message += f", the largest packages are {_format_largest(self._uncompressed_package_bytes)}"
+        raise BudgetExceededError(message, self.compressed_bytes, self.uncompressed_bytes, self.size_budget)
+
+def _to_entries(compressed: typing.Dict[str, int], uncompressed: typing.Dict[str, int],
+                file_counts: typing.Dict[str, int]) -> typing.List[SizeEntry]:
+    entries = [SizeEntry(name, compressed[name], uncompressed[name], file_counts[name]) for name in file_counts]
+    return sorted(entries, key=lambda entry: (-entry.compressed_bytes, entry.name))
+
+def analyze_archive(path_to_zip: str) -> SizeReport:
+    """
+    Reports the compressed and uncompressed bytes of the archive at path_to_zip per
+    top-level package, directory and file. The entries are sorted by their compressed size.
+
+    :param path_to_zip: Path to the archive.
+    :type path_to_zip: str
+    :return: The report.
+    :rtype: SizeReport
+    """
+
+    sizes = {
+        kind: (collections.Counter(), collections.Counter(), collections.Counter())
+        for kind in ["packages", "directories", "files"]
+    }
+
+    def add(kind: str, name: str, zip_info: zipfile.ZipInfo) -> None:
+        compressed, uncompressed, file_counts = sizes[kind]
+        compressed[name] += zip_info.compress_size
+        uncompressed[name] += zip_info.file_size
+        file_counts[name] += 1
+
+    with zipfile.ZipFile(path_to_zip) as zip_file:
+        zip_infos = [zip_info for zip_info in zip_file.infolist() if not zip_info.is_dir()]
+
+    for zip_info in zip_infos:
+        add("packages", get_package_name(zip_info.filename), zip_info)
+        add("files", zip_info.filename, zip_info)
+
+        parts = zip_info.filename.split("/")[:-1]
+        for index in range(1, len(parts) + 1):
+            add("directories", "/".join(parts[:index]) + "/", zip_info)
+
+    return SizeReport(
+        path=path_to_zip,
+        compressed_bytes=os.path.getsize(path_to_zip),
+        uncompressed_bytes=sum(zip_info.file_size for zip_info in zip_infos),
+        file_count=len(zip_infos),
+        **{kind: _to_entries(*counters) for kind, counters in sizes.items()}
+    )
+
+def check_archive(path_to_zip: str, size_budget: SizeBudget) -> None:
+    """
+    Checks an archive that has already been built against the budget, e.g. one from the cache.
+
+    :param path_to_zip: Path to the archive.
+    :type path_to_zip: str
+    :param size_budget: The budget.
+    :type size_budget: SizeBudget
+    :raises BudgetExceededError: If the archive exceeds the budget.
+    :return: Nothing.
+    :rtype: None
+    """
+
+    tracker = SizeTracker(size_budget, path_to_zip)
+    with zipfile.ZipFile(path_to_zip) as zip_file:
+        for zip_info in zip_file.infolist():
+            tracker.add(zip_info, compressed_bytes=0)
+
+    tracker.compressed_bytes = os.path.getsize(path_to_zip)
+    tracker.check()
@@ -1,62 +1,835 @@
 """
 Contains functions to bundle python dependencies.
 """
+import collections
+import concurrent.futures
+import functools
 import logging
+import os
+import shutil
+import threading
 import typing
 
+import lambda_bundler.archive as archive
+import lambda_bundler.budget as budget
+import lambda_bundler.cache as cache
+import lambda_bundler.compression as compression
 import lambda_bundler.dependencies as dependencies
+import lambda_bundler.layers as layers
+import lambda_bundler.targets as targets
+import lambda_bundler.tracing as tracing
 import lambda_bundler.util as util
 
+# Where write_package writes an archive, a function is called with its chunks
+Sink = typing.Union[typing.BinaryIO, typing.Callable[[bytes], None]]
+
 LOGGER = logging.getLogger("lambda_bundler")
 
-@util.return_empty_if_skip_install
-def build_layer_package(requirement_files: typing.List[str]) -> str:
+def _to_tuple(values: typing.Optional[typing.Iterable[str]]) -> typing.Optional[typing.Tuple[str, ...]]:
+    return None if values is None else tuple(values)
+
+class LayerSpec(collections.namedtuple("LayerSpec", ["requirement_files"])):
+    """Describes a layer for build_many, the arguments are the ones of build_layer_package."""
+    __slots__ = ()
+
+    def __new__(cls, requirement_files: typing.Iterable[str]):
+        # Tuples keep the spec hashable, so it can be a key of the result
+        return super().__new__(cls, _to_tuple(requirement_files))
+
+class PackageSpec(collections.namedtuple("PackageSpec",
+                                         ["code_directories", "requirement_files", "exclude_patterns",
+                                          "handler_modules", "dynamic_imports"])):
+    """Describes a package for build_many, the arguments are the ones of build_lambda_package."""
+    __slots__ = ()
+
+    def __new__(cls, code_directories: typing.Iterable[str],
+                requirement_files: typing.Iterable[str] = None,
+                exclude_patterns: typing.Iterable[str] = None,
+                handler_modules: typing.Iterable[str] = None,
+                dynamic_imports: typing.Iterable[str] = None):
+        # Tuples keep the spec hashable, so it can be a key of the result
+        return super().__new__(
+            cls,
+            _to_tuple(code_directories),
+            _to_tuple(requirement_files),
+            _to_tuple(exclude_patterns),
+            _to_tuple(handler_modules),
+            _to_tuple(dynamic_imports)
+        )
+
+class SharedLayerBuild(typing.NamedTuple):
+    """The result of build_with_shared_layer."""
+    layer_path: typing.Optional[str]
+    shared_distributions: typing.List[dependencies.Distribution]
+    package_paths: typing.Dict[PackageSpec, str]
+    layer_users: typing.List[PackageSpec]
+    bytes_saved: int
+
+class _SharedLayerPlan(typing.NamedTuple):
+    """The distributions of each function and which of them are moved to the shared layer."""
+    requirements_by_spec: typing.Dict[PackageSpec, str]
+    distributions_by_spec: typing.Dict[PackageSpec, typing.List[dependencies.Distribution]]
+    shared_distributions: typing.List[dependencies.Distribution]
+    layer_users: typing.List[PackageSpec]
+
+def _get_bytes_saved(plan: _SharedLayerPlan, layer_requirements: str, layer_path: str, workers: int) -> int:
+
+    # Each user would have bundled its shared distributions, instead the layer is uploaded once
+    distribution_sizes = {
+        distribution: os.path.getsize(dependencies.create_or_return_zipped_distribution(
+            distribution, layer_requirements, util.get_build_dir(), workers
+        ))
+        for distribution in plan.shared_distributions
+    }
+    return sum(
+        distribution_sizes[distribution]
+        for spec in plan.layer_users
+        for distribution in set(plan.shared_distributions) & set(plan.distributions_by_spec[spec])
+    ) - os.path.getsize(layer_path)
+
+def _write_spec(writer: archive.ZipWriter, spec: PackageSpec, requirements_zip: typing.Optional[str],
+                workers: int) -> None:
+    dependencies.write_lambda_package(
+        writer=writer,
+        code_directories=list(spec.code_directories),
+        requirements_zip=requirements_zip,
+        exclude_patterns=util.to_list(spec.exclude_patterns),
+        handler_modules=util.to_list(spec.handler_modules),
+        dynamic_imports=util.to_list(spec.dynamic_imports),
+        workers=workers
+    )
+
+def _in_session(method: typing.Callable) -> typing.Callable:
+
+    @functools.wraps(method)
+    def wrapped(self, *args, **kwargs):
+        with util.activate(self.settings, self.files):
+            return method(self, *args, **kwargs)
+
+    return wrapped
+
+class BuildSession:
     """
-    Builds the zip archive for a lambda layer from a list of requirement files.
+    Holds the configuration of builds and what they have in common. Sessions with
+    different configurations can build in the same process at the same time, each
+    in its own threads. Requirement files are only read and merged again when their
+    stat data changes, so many builds that share a handful of requirement files do
+    the work for each file once.
 
-    :param requirement_files: List of paths to requirement files.
-    :type requirement_files: typing.List[str]
-    :return: Path to the packaged zip.
-    :rtype: str
+    Used as a context manager, the limits of the build directory are enforced once
+    when the block ends instead of after every build. That only applies to the builds
+    of the thread that entered the block, other threads sharing the session aren't held up.
     """
 
-    collected_dependencies = dependencies.collect_and_merge_requirements(
-        *requirement_files
-    )
+    def __init__(self, build_dir: str = None, workers: int = None, compression_preset: str = None,
+                 target: targets.Target = None, settings: typing.Dict[str, str] = None, manage_limits: bool = True):
+        """
+        :param build_dir: The build directory, defaults to None which means the one from the environment.
+        :type build_dir: str, optional
+        :param workers: Number of threads that compress each archive, defaults to None which means one per CPU.
+        :type workers: int, optional
+        :param compression_preset: One of the compression presets, defaults to None which means the one
+                                   from the environment.
+        :type compression_preset: str, optional
+        :param target: The target dependencies are installed for, defaults to None which means the one from
+                       the environment, see targets.get_target.
+        :type target: targets.Target, optional
+        :param settings: Values of other LAMBDA_BUNDLER_* environment variables for this session,
+                         defaults to None which means the ones from the environment.
+        :type settings: typing.Dict[str, str], optional
+        :param manage_limits: Whether the session enforces the limits of the build directory, defaults to True.
+                              The sessions of the worker processes of build_many leave it to the one that started them.
+        :type manage_limits: bool, optional
+        :raises ValueError: If the compression preset doesn't exist.
+        """
 
-    return dependencies.create_or_return_zipped_dependencies(
-        requirements_information=collected_dependencies,
-        output_directory_path=util.get_build_dir(),
-        prefix_in_zip="python"
-    )
+        self.settings = dict(settings or {})
+        if build_dir is not None:
+            self.settings[util.BUILD_DIR_ENV] = build_dir
+        if compression_preset is not None:
+            self.settings[compression.COMPRESSION_PRESET_ENV] = compression.get_policy(compression_preset).name
+        if target is not None:
+            self.settings.update(target.as_settings())
+        self.workers = workers
+        self.files = util.FileCache()
+
+        self._lock = threading.Lock()
+        # The merged requirements and the stat keys of the files they were read from by the requirement files
+        self._merged_requirements = {}
+        self._manage_limits = manage_limits
+        # How deep each thread is nested in the session as a context manager and if it deferred the limits
+        self._deferrals = threading.local()
+
+    def __enter__(self) -> "BuildSession":
+        self._deferrals.depth = getattr(self._deferrals, "depth", 0) + 1
+        return self
+
+    def __exit__(self, *exception_info) -> None:
+        self._release_limits()
+
+    def enforce_limits(self) -> None:
+        """
+        Enforces the limits of the build directory like cache.enforce_limits. If the
+        session is used as a context manager, it's done once when the block ends.
+        """
+
+        if not self._manage_limits:
+            return
+
+        if getattr(self._deferrals, "depth", 0):
+            self._deferrals.pending = True
+            return
+        cache.enforce_limits()
+
+    def _release_limits(self) -> None:
+
+        self._deferrals.depth -= 1
+        if self._deferrals.depth or not getattr(self._deferrals, "pending", False):
+            return
+
+        self._deferrals.pending = False
+        with util.activate(self.settings, self.files):
+            cache.enforce_limits()
+
+    @_in_session
+    def merge_requirements(self, requirement_files: typing.List[str]) -> str:
+        """
+        Reads and merges the requirement files like dependencies.collect_and_merge_requirements.
+        The result is reused until one of the files, or the files they include, changes.
+
+        :param requirement_files: List of paths to requirement files.
+        :type requirement_files: typing.List[str]
+        :return: Merged requirements in the form of a multiline string.
+        :rtype: str
+        """
+
+        key = tuple(os.path.abspath(path) for path in requirement_files)
+        with self._lock:
+            known = self._merged_requirements.get(key)
+        if known is not None and all(
+                self.files.get_stat_key(path) == stat_key for path, stat_key in known[0].items()
+        ):
+            return known[1]
+
+        with self.files.record_reads() as reads:
+            merged_requirements = dependencies.collect_and_merge_requirements(*requirement_files)
+
+        # Only what has been read from the files can be reused
+        if all(path in reads for path in key):
+            with self._lock:
+                self._merged_requirements[key] = (dict(reads), merged_requirements)
+        return merged_requirements
+
+    @_in_session
+    @util.return_empty_if_skip_install
+    @tracing.traced("build_layer_package")
+    def build_layer_package(self, requirement_files: typing.List[str], workers: int = None,
+                            size_budget: budget.SizeBudget = None) -> str:
+        """
+        Builds the zip archive for a lambda layer from a list of requirement files.
+
+        :param requirement_files: List of paths to requirement files.
+        :type requirement_files: typing.List[str]
+        :param workers: Number of threads that compress the archive, defaults to None which means the
+                        workers of the session.
+        :type workers: int, optional
+        :param size_budget: Budget the archive has to fit into, defaults to None which means the one from
+                            the environment or the limits of Lambda (see budget.get_budget).
+        :type size_budget: budget.SizeBudget, optional
+        :raises budget.BudgetExceededError: If the archive exceeds the budget, the build aborts as soon as it does.
+        :return: Path to the packaged zip.
+        :rtype: str
+        """
+        size_budget = size_budget or budget.get_budget()
+
+        collected_dependencies = self.merge_requirements(requirement_files)
+
+        path_to_zip = dependencies.create_or_return_zipped_dependencies(
+            requirements_information=collected_dependencies,
+            output_directory_path=util.get_build_dir(),
+            prefix_in_zip="python",
+            workers=workers or self.workers,
+            size_budget=size_budget
+        )
+
+        # Cached archives may have been built with another budget
+        budget.check_archive(path_to_zip, size_budget)
+
+        self.enforce_limits()
+        return path_to_zip
+
+    @_in_session
+    @util.return_empty_if_skip_install
+    @tracing.traced("build_lambda_package")
+    def build_lambda_package(self, code_directories: typing.List[str], # pylint: disable=too-many-arguments
+                             requirement_files: typing.List[str] = None,
+                             exclude_patterns: typing.List[str] = None,
+                             workers: int = None,
+                             handler_modules: typing.List[str] = None,
+                             dynamic_imports: typing.List[str] = None,
+                             size_budget: budget.SizeBudget = None) -> str:
+        """
+        This function builds a lambda deployment package out of one or
+        more code directories and optionally bundles dependencies in
+        the package.
+
+        :param code_directories: List of paths to the code directories.
+        :type code_directories: typing.List[str]
+        :param requirement_files: List of paths to requirement files, defaults to None
+        :type requirement_files: typing.List[str], optional
+        :param exclude_patterns: Glob patterns of files to exclude from the code_directories, defaults to None
+        :type exclude_patterns: typing.List[str], optional
+        :param workers: Number of threads that compress the archive, defaults to None which means the
+                        workers of the session.
+        :type workers: int, optional
+        :param handler_modules: Names of the modules with the handlers like lambda.handler, if set only the
+                                modules of the dependencies they can import are bundled, defaults to None
+        :type handler_modules: typing.List[str], optional
+        :param dynamic_imports: Modules the handlers import dynamically, names or glob patterns, defaults to None
+        :type dynamic_imports: typing.List[str], optional
+        :param size_budget: Budget the archive has to fit into, defaults to None which means the one from
+                            the environment or the limits of Lambda (see budget.get_budget).
+        :type size_budget: budget.SizeBudget, optional
+        :raises budget.BudgetExceededError: If the archive exceeds the budget, the build aborts as soon as it does.
+        :return: Path to the .zip archive.
+        :rtype: str
+        """
+        size_budget = size_budget or budget.get_budget()
+
+        if requirement_files is None:
+
+            path_to_zip = dependencies.build_lambda_package_without_dependencies(
+                code_directories=code_directories,
+                exclude_patterns=exclude_patterns,
+                workers=workers or self.workers,
+                size_budget=size_budget
+            )
+        else:
+
+            path_to_zip = dependencies.build_lambda_package_with_dependencies(
+                code_directories=code_directories,
+                requirement_files=requirement_files,
+                exclude_patterns=exclude_patterns,
+                workers=workers or self.workers,
+                handler_modules=handler_modules,
+                dynamic_imports=dynamic_imports,
+                size_budget=size_budget
+            )
+
+        # Cached archives may have been built with another budget
+        budget.check_archive(path_to_zip, size_budget)
+
+        self.enforce_limits()
+        return path_to_zip
+
+    @_in_session
+    @tracing.traced("build_layer_packages")
+    def build_layer_packages(self, requirement_files: typing.List[str], max_layers: int = layers.MAX_LAYERS,
+                             workers: int = None, size_budget: budget.SizeBudget = None) -> typing.List[str]:
+        """
+        Builds the dependencies in requirement_files into up to max_layers layers, so
+        dependencies that are too large for one layer can still be deployed. Each
+        distribution is installed and measured on its own and the layers are cached
+        by their distributions, so layers whose distributions didn't change are reused.
+        If pip can't resolve the requirements upfront, a single layer is built.
+
+        :param requirement_files: List of paths to requirement files.
+        :type requirement_files: typing.List[str]
+        :param max_layers: Maximum number of layers, defaults to layers.MAX_LAYERS
+        :type max_layers: int, optional
+        :param workers: Number of threads that compress the archives, defaults to None which means the
+                        workers of the session.
+        :type workers: int, optional
+        :param size_budget: Budget the layers have to fit into, defaults to None which means the one from
+                            the environment or the limits of Lambda (see budget.get_budget). The compressed
+                            limit applies to each layer and defaults to budget.LAMBDA_MAX_ZIPPED_BYTES, the
+                            uncompressed limit applies to all of them together.
+        :type size_budget: budget.SizeBudget, optional
+        :raises budget.BudgetExceededError: If the dependencies don't fit into max_layers layers or exceed
+                                            the uncompressed limit together.
+        :return: Paths to the zip archives of the layers, the empty archive if LAMBDA_BUNDLER_SKIP_INSTALL is set.
+        :rtype: typing.List[str]
+        """
+
+        size_budget = size_budget or budget.get_budget()
+        workers = workers or self.workers
+
+        # build_layer_package returns the empty archive without resolving anything
+        if util.is_skip_install():
+            return [self.build_layer_package(requirement_files, workers, size_budget)]
+
+        requirements_information = self.merge_requirements(requirement_files)
+        distributions = layers.resolve_requirements(requirements_information)
+        if distributions is None:
+            LOGGER.warning("Unable to resolve the distributions upfront, building a single layer")
+            return [self.build_layer_package(requirement_files, workers, size_budget)]
+
+        layer_budget = layers.get_layer_budget(size_budget)
+        sizes = {}
+        for distribution in distributions:
+            distribution_zip = dependencies.create_or_return_zipped_distribution(
+                distribution, requirements_information, util.get_build_dir(), workers
+            )
+            sizes[distribution] = (
+                os.path.getsize(distribution_zip), budget.analyze_archive(distribution_zip).uncompressed_bytes
+            )
+
+        layer_paths = []
+        for group in layers.pack_layers(sizes, max_layers, layer_budget):
+            layer_path = self._build_layer(group.distributions, requirements_information, workers)
+            budget.check_archive(layer_path, layer_budget)
+            layer_paths.append(layer_path)
+
+        LOGGER.info("Packed %s distributions into %s layers", len(distributions), len(layer_paths))
+        self.enforce_limits()
+        return layer_paths
+
+    @_in_session
+    @tracing.traced("build_with_shared_layer")
+    def build_with_shared_layer(self, specs: typing.Iterable[PackageSpec],
+                                min_share: float = layers.DEFAULT_MIN_SHARE,
+                                workers: int = None,
+                                size_budget: budget.SizeBudget = None) -> SharedLayerBuild:
+        """
+        Builds the packages of many functions and a layer with the dependencies most of
+        them have in common. The functions in layer_users need the layer, their packages
+        only bundle the dependencies that aren't in it. Functions whose requirements
+        pip can't resolve upfront and functions without requirements are built as usual.
+        The layer is installed with the options, like index URLs, of all its users.
+
+        :param specs: The packages to build.
+        :type specs: typing.Iterable[PackageSpec]
+        :param min_share: Share of the functions that has to use a distribution in the same version
+                          for it to be moved to the layer, defaults to layers.DEFAULT_MIN_SHARE
+        :type min_share: float, optional
+        :param workers: Number of threads that compress each archive, defaults to None which means the
+                        workers of the session.
+        :type workers: int, optional
+        :param size_budget: Budget the layer and each package together have to fit into, defaults to None which
+                            means the one from the environment or the limits of Lambda (see budget.get_budget).
+        :type size_budget: budget.SizeBudget, optional
+        :raises budget.BudgetExceededError: If the layer or a package with the layer exceeds the budget.
+        :return: The paths to the archives and the number of bytes less to upload compared to bundling everything,
+                 no layer and the empty archive for each package if LAMBDA_BUNDLER_SKIP_INSTALL is set.
+        :rtype: SharedLayerBuild
+        """
+
+        specs = list(dict.fromkeys(specs))
+        size_budget = size_budget or budget.get_budget()
+        workers = workers or self.workers
+
+        # The limits of the build directory are enforced once all archives are built
+        with self:
+
+            # Nothing is installed, so there is nothing to share either
+            if util.is_skip_install():
+                package_paths = {spec: self.build_spec(spec, workers, size_budget) for spec in specs}
+                return SharedLayerBuild(None, [], package_paths, [], 0)
+
+            plan = self._plan_shared_layer(specs, min_share)
+            LOGGER.info(
+                "Moving %s distributions used by %s of %s functions to a shared layer",
+                len(plan.shared_distributions), len(plan.layer_users), len(specs)
+            )
+
+            # Only the options are used, so the layer can be installed from the indexes of every user
+            layer_requirements = dependencies.merge_requirement_files(
+                *[plan.requirements_by_spec[spec] for spec in plan.layer_users]
+            )
+
+            layer_path = None
+            if plan.shared_distributions:
+                layer_path = self._build_layer(plan.shared_distributions, layer_requirements, workers)
+                budget.check_archive(layer_path, size_budget)
+
+            package_paths = self._build_shared_layer_packages(specs, plan, layer_path, workers, size_budget)
+
+            bytes_saved = 0
+            if layer_path is not None:
+                bytes_saved = _get_bytes_saved(plan, layer_requirements, layer_path, workers)
+                LOGGER.info("The shared layer saves uploading %s bytes", bytes_saved)
+
+            self.enforce_limits()
+
+        return SharedLayerBuild(layer_path, plan.shared_distributions, package_paths, plan.layer_users, bytes_saved)
+
+    def _plan_shared_layer(self, specs: typing.List[PackageSpec], min_share: float) -> _SharedLayerPlan:
+
+        # Functions with the same merged requirements are resolved once
+        requirements_by_spec = {
+            spec: self.merge_requirements(list(spec.requirement_files))
+            for spec in specs if spec.requirement_files is not None
+        }
+        resolved = {
+            requirements_information: layers.resolve_requirements(requirements_information)
+            for requirements_information in set(requirements_by_spec.values())
+        }
+        distributions_by_spec = {
+            spec: resolved[requirements_information]
+            for spec, requirements_information in requirements_by_spec.items()
+            if resolved[requirements_information] is not None
+        }
+
+        shared_distributions = layers.choose_shared_distributions(list(distributions_by_spec.values()), min_share)
+        layer_users = [
+            spec for spec, distributions in distributions_by_spec.items()
+            if set(shared_distributions) & set(distributions)
+        ]
+        return _SharedLayerPlan(requirements_by_spec, distributions_by_spec, shared_distributions, layer_users)
+
+    def _build_shared_layer_packages(self, specs: typing.List[PackageSpec], plan: _SharedLayerPlan,
+                                     layer_path: typing.Optional[str], workers: int,
+                                     size_budget: budget.SizeBudget) -> typing.Dict[PackageSpec, str]:
+
+        layer_key, package_budget = "", size_budget
+        if layer_path is not None:
+            layer_key = os.path.basename(layer_path)
+
+            # Lambda limits the size of a function together with its layers
+            if size_budget.max_uncompressed_bytes is not None:
+                package_budget = size_budget._replace(
+                    max_uncompressed_bytes=size_budget.max_uncompressed_bytes
+                    - budget.analyze_archive(layer_path).uncompressed_bytes
+                )
+
+        package_paths = {}
+        for spec in specs:
+            if spec not in plan.distributions_by_spec:
+                package_paths[spec] = self.build_spec(spec, workers, size_budget)
+                continue
+
+            residual_distributions = [
+                distribution for distribution in plan.distributions_by_spec[spec]
+                if distribution not in plan.shared_distributions
+            ]
+            requirements_zip = dependencies.create_or_return_zipped_distributions(
+                distributions=residual_distributions,
+                requirements_information=plan.requirements_by_spec[spec],
+                output_directory_path=util.get_build_dir(),
+                workers=workers
+            )
+            package_paths[spec] = self._build_layered_package(
+                spec, requirements_zip, layer_key if spec in plan.layer_users else "",
+                workers, package_budget if spec in plan.layer_users else size_budget
+            )
+        return package_paths
+
+    def _build_layer(self, distributions: typing.List[dependencies.Distribution], requirements_information: str,
+                     workers: int) -> str:
+        return dependencies.create_or_return_zipped_distributions(
+            distributions=distributions,
+            requirements_information=requirements_information,
+            output_directory_path=util.get_build_dir(),
+            prefix_in_zip="python",
+            workers=workers
+        )
+
+    def _build_layered_package(self, spec: PackageSpec, requirements_zip: str, layer_key: str,
+                               workers: int, size_budget: budget.SizeBudget) -> str:
+
+        # The layer is part of the name, so packages for different layers don't replace each other
+        target_zip_name = util.hash_string(
+            "".join(spec.code_directories) + "".join(spec.requirement_files) + layer_key
+        ) + ".zip"
+        zip_path = os.path.join(util.get_build_dir(), target_zip_name)
+
+        def build(temporary_path: str) -> None:
+            with archive.ZipWriter.create(temporary_path, size_budget) as writer:
+                _write_spec(writer, spec, requirements_zip, workers)
+
+        # The name doesn't reflect the content of the code, so it's always built
+        return cache.build_once(zip_path, build, reuse_existing=False)
+
+    @_in_session
+    @util.return_empty_if_skip_install
+    def _build_dependencies(self, requirements_information: str, prefix_in_zip: typing.Optional[str],
+                            workers: int) -> str:
+        return dependencies.create_or_return_zipped_dependencies(
+            requirements_information=requirements_information,
+            output_directory_path=util.get_build_dir(),
+            prefix_in_zip=prefix_in_zip,
+            workers=workers,
+            # Layers are deployed as they are, the dependencies of packages are extended with code first
+            size_budget=budget.get_budget() if prefix_in_zip is not None else None
+        )
+
+    @_in_session
+    def build_spec(self, spec: typing.Union[LayerSpec, PackageSpec], workers: int = None,
+                   size_budget: budget.SizeBudget = None) -> str:
+        """
+        Builds a layer or package with build_layer_package or build_lambda_package.
+
+        :param spec: The layer or package to build.
+        :type spec: typing.Union[LayerSpec, PackageSpec]
+        :param workers: Number of threads that compress the archive, defaults to None which means the
+                        workers of the session.
+        :type workers: int, optional
+        :param size_budget: Budget the archive has to fit into, defaults to None which means the one from
+                            the environment or the limits of Lambda (see budget.get_budget).
+        :type size_budget: budget.SizeBudget, optional
+        :raises budget.BudgetExceededError: If the archive exceeds the budget.
+        :return: Path to the .zip archive.
+        :rtype: str
+        """
+
+        if isinstance(spec, LayerSpec):
+            return self.build_layer_package(
+                requirement_files=list(spec.requirement_files),
+                workers=workers,
+                size_budget=size_budget
+            )
+
+        return self.build_lambda_package(
+            code_directories=list(spec.code_directories),
+            requirement_files=util.to_list(spec.requirement_files),
+            exclude_patterns=util.to_list(spec.exclude_patterns),
+            workers=workers,
+            handler_modules=util.to_list(spec.handler_modules),
+            dynamic_imports=util.to_list(spec.dynamic_imports),
+            size_budget=size_budget
+        )
+
+    @_in_session
+    @tracing.traced("write_package")
+    def write_package(self, sink: Sink, spec: typing.Union[LayerSpec, PackageSpec], workers: int = None,
+                      size_budget: budget.SizeBudget = None) -> int:
+        """
+        Builds a layer or package like build_layer_package and build_lambda_package,
+        but writes the archive to sink instead of the build directory. Packages are
+        written while they're compressed, so no copy of them ends up on disk and an
+        upload can start before the archive is complete. Only the dependencies are
+        cached in the build directory, layers are streamed from there.
+
+        :param sink: A writable binary stream like an open file or io.BytesIO, or a function that's called
+                     with chunks of archive.SINK_CHUNK_SIZE bytes, e.g. the parts of a multipart upload.
+                     Functions aren't called with the rest of an archive that fails to build.
+        :type sink: Sink
+        :param spec: The layer or package to build.
+        :type spec: typing.Union[LayerSpec, PackageSpec]
+        :param workers: Number of threads that compress the archive, defaults to None which means the
+                        workers of the session.
+        :type workers: int, optional
+        :param size_budget: Budget the archive has to fit into, defaults to None which means the one from
+                            the environment or the limits of Lambda (see budget.get_budget).
+        :type size_budget: budget.SizeBudget, optional
+        :raises budget.BudgetExceededError: If the archive exceeds the budget, the build aborts as soon as it does.
+        :return: The number of bytes written to sink, 0 if LAMBDA_BUNDLER_SKIP_INSTALL is set.
+        :rtype: int
+        """
+        if util.is_skip_install():
+            # Like the empty archive the other builds return, there's nothing to bundle the code with
+            LOGGER.info("Skipping installation of dependencies.")
+            return 0
+
+        size_budget = size_budget or budget.get_budget()
+        workers = workers or self.workers
+
+        if callable(sink):
+            with archive.ChunkedStream(sink) as stream:
+                return self._write_package(stream, spec, workers, size_budget)
+        return self._write_package(sink, spec, workers, size_budget)
+
+    def _write_package(self, stream: typing.BinaryIO, spec: typing.Union[LayerSpec, PackageSpec], workers: int,
+                       size_budget: budget.SizeBudget) -> int:
+
+        if isinstance(spec, LayerSpec):
+            path_to_zip = self.build_layer_package(list(spec.requirement_files), workers, size_budget)
+            with open(path_to_zip, "rb") as handle:
+                shutil.copyfileobj(handle, stream, archive.CHUNK_SIZE)
+            return os.path.getsize(path_to_zip)
+
+        requirements_zip = None
+        if spec.requirement_files is not None:
+            requirements_zip = self._build_dependencies(
+                self.merge_requirements(spec.requirement_files), None, workers
+            )
+
+        with archive.ZipWriter(stream, size_budget=size_budget) as writer:
+            _write_spec(writer, spec, requirements_zip, workers)
+
+        self.enforce_limits()
+        return writer.size
+
+    def _run_all(self, executor: typing.Optional[concurrent.futures.Executor],
+                 calls: typing.List[typing.Tuple[str, tuple]]) -> typing.List:
+
+        if executor is None:
+            return [getattr(self, method_name)(*arguments) for method_name, arguments in calls]
+
+        futures = [
+            executor.submit(_call_in_worker_session, self.settings, method_name, arguments)
+            for method_name, arguments in calls
+        ]
+        return [future.result() for future in futures]
+
+    @_in_session
+    @tracing.traced("build_many")
+    def build_many(self, specs: typing.Iterable[typing.Union[LayerSpec, PackageSpec]],
+                   max_workers: int = None,
+                   workers: int = None) -> typing.Dict[typing.Union[LayerSpec, PackageSpec], str]:
+        """
+        Builds many layers and packages in parallel processes. Dependencies are
+        installed once per distinct set of merged requirements, no matter how many
+        specs share them, before the specs that need them are built. The limits of
+        the build directory are enforced once at the end.
+
+        :param specs: The LayerSpecs and PackageSpecs to build.
+        :type specs: typing.Iterable[typing.Union[LayerSpec, PackageSpec]]
+        :param max_workers: Number of processes that build in parallel, defaults to None which means one per CPU.
+        :type max_workers: int, optional
+        :param workers: Number of threads that compress each archive, defaults to None which means the workers
+                        of the session or spreads the CPUs across the processes.
+        :type workers: int, optional
+        :return: Mapping from each spec to the path of its zip archive.
+        :rtype: typing.Dict[typing.Union[LayerSpec, PackageSpec], str]
+        """
+
+        specs = list(dict.fromkeys(specs))
+        max_workers = max_workers or os.cpu_count() or 1
+        workers = workers or self.workers or max(1, (os.cpu_count() or 1) // max_workers)
+
+        # Identical merged requirements share one dependency archive
+        dependency_keys = {}
+        for spec in specs:
+            if spec.requirement_files is not None:
+                prefix_in_zip = "python" if isinstance(spec, LayerSpec) else None
+                requirements_information = self.merge_requirements(spec.requirement_files)
+                dependency_keys[(requirements_information, prefix_in_zip)] = None
+
+        code_only_specs = [spec for spec in specs if spec.requirement_files is None]
+        specs_with_dependencies = [spec for spec in specs if spec.requirement_files is not None]
+
+        LOGGER.debug("Building %s specs with %s distinct sets of dependencies", len(specs), len(dependency_keys))
+
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers) if max_workers > 1 else None
+        try:
+            with self:
+                # First install the dependencies and zip the code-only packages, then build
+                # everything that needs the dependencies from the now warm cache.
+                first_results = self._run_all(
+                    executor,
+                    [("_build_dependencies", key + (workers,)) for key in dependency_keys]
+                    + [("build_spec", (spec, workers)) for spec in code_only_specs]
+                )
+                second_results = self._run_all(
+                    executor,
+                    [("build_spec", (spec, workers)) for spec in specs_with_dependencies]
+                )
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        paths = first_results[len(dependency_keys):] + second_results
+        return dict(zip(code_only_specs + specs_with_dependencies, paths))
+
+# Sessions of the worker processes of build_many by the settings of the session that started them
+_WORKER_SESSIONS = {}
+
+def _call_in_worker_session(settings: typing.Dict[str, str], method_name: str, arguments: tuple) -> typing.Any:
+
+    key = tuple(sorted(settings.items()))
+    if key not in _WORKER_SESSIONS:
+        # The session that started the build enforces the limits once it's done
+        _WORKER_SESSIONS[key] = BuildSession(settings=settings, manage_limits=False)
+    return getattr(_WORKER_SESSIONS[key], method_name)(*arguments)
+
+_DEFAULT_SESSION = BuildSession()
+
+def get_default_session() -> BuildSession:
+    """
+    Returns the session the functions of this module build with, it's configured by the environment.
+
+    :return: The default session.
+    :rtype: BuildSession
+    """
+    return _DEFAULT_SESSION
+
+def build_layer_package(requirement_files: typing.List[str], workers: int = None,
+                        size_budget: budget.SizeBudget = None) -> str:
+    """
+    Builds the zip archive for a lambda layer from a list of requirement files
+    with the default session, see BuildSession.build_layer_package.
+
+    :return: Path to the packaged zip.
+    :rtype: str
+    """
+    return _DEFAULT_SESSION.build_layer_package(requirement_files, workers, size_budget)
 
-@util.return_empty_if_skip_install
 def build_lambda_package(code_directories: typing.List[str],
                          requirement_files: typing.List[str] = None,
-                         exclude_patterns: typing.List[str] = None) -> str:
-    """
-    This function builds a lambda deployment package out of one or
-    more code directories and optionally bundles dependencies in
-    the package.
-
-    :param code_directories: List of paths to the code directories.
-    :type code_directories: typing.List[str]
-    :param requirement_files: List of paths to requirement files, defaults to None
-    :type requirement_files: typing.List[str], optional
-    :param exclude_patterns: Glob patterns of files to exclude from the code_directories, defaults to None
-    :type exclude_patterns: typing.List[str], optional
+                         exclude_patterns: typing.List[str] = None,
+                         workers: int = None,
+                         handler_modules: typing.List[str] = None,
+                         dynamic_imports: typing.List[str] = None,
+                         size_budget: budget.SizeBudget = None) -> str:
+    """
+    Builds a lambda deployment package out of one or more code directories and optionally
+    its dependencies with the default session, see BuildSession.build_lambda_package.
+
     :return: Path to the .zip archive.
     :rtype: str
     """
-    if requirement_files is None:
-
-        return dependencies.build_lambda_package_without_dependencies(
-            code_directories=code_directories,
-            exclude_patterns=exclude_patterns
-        )
-
-    return dependencies.build_lambda_package_with_dependencies(
+    return _DEFAULT_SESSION.build_lambda_package(
         code_directories=code_directories,
         requirement_files=requirement_files,
-        exclude_patterns=exclude_patterns
+        exclude_patterns=exclude_patterns,
+        workers=workers,
+        handler_modules=handler_modules,
+        dynamic_imports=dynamic_imports,
+        size_budget=size_budget
     )
+
+def build_spec(spec: typing.Union[LayerSpec, PackageSpec], workers: int = None,
+               size_budget: budget.SizeBudget = None) -> str:
+    """
+    Builds a layer or package with the default session, see BuildSession.build_spec.
+
+    :return: Path to the .zip archive.
+    :rtype: str
+    """
+    return _DEFAULT_SESSION.build_spec(spec, workers, size_budget)
+
+def write_package(sink: Sink, spec: typing.Union[LayerSpec, PackageSpec], workers: int = None,
+                  size_budget: budget.SizeBudget = None) -> int:
+    """
+    Builds a layer or package and writes the archive to sink with the default
+    session, see BuildSession.write_package.
+
+    :return: The number of bytes written to sink.
+    :rtype: int
+    """
+    return _DEFAULT_SESSION.write_package(sink, spec, workers, size_budget)
+
+def build_layer_packages(requirement_files: typing.List[str], max_layers: int = layers.MAX_LAYERS,
+                         workers: int = None, size_budget: budget.SizeBudget = None) -> typing.List[str]:
+    """
+    Builds the dependencies in requirement_files into up to max_layers layers with
+    the default session, see BuildSession.build_layer_packages.
+
+    :return: Paths to the zip archives of the layers.
+    :rtype: typing.List[str]
+    """
+    return _DEFAULT_SESSION.build_layer_packages(requirement_files, max_layers, workers, size_budget)
+
+def build_with_shared_layer(specs: typing.Iterable[PackageSpec], min_share: float = layers.DEFAULT_MIN_SHARE,
+                            workers: int = None, size_budget: budget.SizeBudget = None) -> SharedLayerBuild:
+    """
+    Builds the packages of many functions and a layer with the dependencies most of
+    them have in common with the default session, see BuildSession.build_with_shared_layer.
+
+    :return: The paths to the archives and the number of bytes less to upload compared to bundling everything.
+    :rtype: SharedLayerBuild
+    """
+    return _DEFAULT_SESSION.build_with_shared_layer(specs, min_share, workers, size_budget)
+
+def build_many(specs: typing.Iterable[typing.Union[LayerSpec, PackageSpec]],
+               max_workers: int = None,
+               workers: int = None) -> typing.Dict[typing.Union[LayerSpec, PackageSpec], str]:
+    """
+    Builds many layers and packages in parallel processes with the default
+    session, see BuildSession.build_many.
+
+    :return: Mapping from each spec to the path of its zip archive.
+    :rtype: typing.Dict[typing.Union[LayerSpec, PackageSpec], str]
+    """
+    return _DEFAULT_SESSION.build_many(specs, max_workers, workers)
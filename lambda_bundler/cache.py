@@ -0,0 +1,772 @@
+"""
+Contains the caching primitives that allow the lambda_bundler to skip work.
+
+Several processes may share a build directory. Artifacts are therefore written
+to a temporary file and moved in place once they are complete, and builds of
+the same artifact are serialized with a lock file next to it.
+"""
+import contextlib
+import json
+import logging
+import os
+import pathlib
+import re
+import shutil
+import struct
+import time
+import typing
+import uuid
+
+if os.name == "nt":  # pragma: no cover - Windows
+    import msvcrt # pylint: disable=import-error
+else:
+    import fcntl
+
+import lambda_bundler.backends as backends
+import lambda_bundler.tracing as tracing
+import lambda_bundler.util as util
+
+LOGGER = logging.getLogger("lambda_bundler")
+
+MANIFEST_DIRECTORY_NAME = "manifests"
+ENTRY_DIRECTORY_NAME = "entries"
+INDEX_FILE_NAME = "index.json"
+
+# Upper limit for the size of the build directory, e.g. 10G
+MAX_BYTES_ENV = "LAMBDA_BUNDLER_CACHE_MAX_BYTES"
+
+# Artifacts used more recently than this are never evicted, they may be in use
+EVICTION_GRACE_PERIOD_SECONDS = 600
+
+# Temporary files older than this belong to builds that crashed
+ORPHAN_MAX_AGE_SECONDS = 3600
+
+# Names of the files get_temporary_path creates
+_TEMPORARY_FILE_PATTERN = re.compile(r"\.[0-9a-f]{32}\.tmp$")
+
+# Directories in the build directory that belong to the cache itself
+_RESERVED_DIRECTORY_NAMES = {
+    MANIFEST_DIRECTORY_NAME,
+    ENTRY_DIRECTORY_NAME,
+    "distributions",
+    util.WHEELHOUSE_DIRECTORY_NAME,
+    util.PIP_CACHE_DIRECTORY_NAME
+}
+
+_SIZE_SUFFIXES = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+# Cached entries start with the CRC and the uncompressed size of their data
+_ENTRY_HEADER = struct.Struct("<LQ")
+
+_END_OF_CENTRAL_DIRECTORY_SIGNATURE = b"PK\005\006"
+_END_OF_CENTRAL_DIRECTORY_SIZE = 22
+_MAX_ZIP_COMMENT_SIZE = 0xFFFF
+
+class CacheStatistics(typing.NamedTuple):
+    """Statistics about the usage of the build directory."""
+    hits: int
+    misses: int
+    artifacts: int
+    bytes_stored: int
+    bytes_saved: int
+
+class CachedEntry(typing.NamedTuple):
+    """Compressed data from the entry cache, data is positioned at its start."""
+    crc: int
+    file_size: int
+    compress_size: int
+    data: typing.BinaryIO
+
+def get_temporary_path(path: str) -> str:
+    """
+    Returns a unique path next to path, to write a file that is moved to path once it's complete.
+
+    :param path: The final path of the file.
+    :type path: str
+    :return: Path for the temporary file.
+    :rtype: str
+    """
+    return f"{path}.{uuid.uuid4().hex}.tmp"
+
+if os.name == "nt":  # pragma: no cover - Windows
+
+    def _acquire(handle: typing.BinaryIO, blocking: bool = True) -> bool:
+        # msvcrt gives up after 10 seconds, we wait as long as the other build takes
+        handle.seek(0)
+        while True:
+            try:
+                msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+
+    def _release(handle: typing.BinaryIO) -> None:
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+else:
+
+    def _acquire(handle: typing.BinaryIO, blocking: bool = True) -> bool:
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _release(handle: typing.BinaryIO) -> None:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+@contextlib.contextmanager
+def lock(path: str, blocking: bool = True) -> typing.Iterator[bool]:
+    """
+    Context manager that holds an exclusive lock for path across processes, until
+    it's released other processes that want to build path have to wait.
+
+    :param path: The path of the artifact to lock, the lock file is created next to it.
+    :type path: str
+    :param blocking: Whether to wait for the lock, defaults to True
+    :type blocking: bool, optional
+    :return: Context manager that yields whether the lock is held.
+    :rtype: typing.Iterator[bool]
+    """
+
+    pathlib.Path(os.path.dirname(path) or ".").mkdir(parents=True, exist_ok=True)
+
+    with open(f"{path}.lock", "a+b") as handle:
+        acquired = _acquire(handle, blocking)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                _release(handle)
+
+def _get_sidecar_path(artifact_path: str) -> str:
+    return f"{artifact_path}.json"
+
+def publish(temporary_path: str, artifact_path: str) -> str:
+    """
+    Moves the complete artifact from temporary_path to artifact_path and records its
+    size in a sidecar file, which is what is_valid_artifact checks.
+
+    :param temporary_path: Path the artifact has been written to.
+    :type temporary_path: str
+    :param artifact_path: The final path of the artifact.
+    :type artifact_path: str
+    :return: The artifact_path.
+    :rtype: str
+    """
+
+    os.replace(temporary_path, artifact_path)
+
+    sidecar_path = _get_sidecar_path(artifact_path)
+    temporary_sidecar_path = get_temporary_path(sidecar_path)
+    with open(temporary_sidecar_path, "w") as handle:
+        json.dump({"size": os.path.getsize(artifact_path)}, handle)
+    os.replace(temporary_sidecar_path, sidecar_path)
+
+    return artifact_path
+
+def has_end_of_central_directory(path: str) -> bool:
+    """
+    Checks if the file at path ends with the end of central directory record
+    of a zip archive, which is written last.
+
+    :param path: Path to the file.
+    :type path: str
+    :return: Whether the file ends like a complete zip archive.
+    :rtype: bool
+    """
+
+    try:
+        with open(path, "rb") as handle:
+            size = handle.seek(0, os.SEEK_END)
+            tail_size = min(size, _END_OF_CENTRAL_DIRECTORY_SIZE + _MAX_ZIP_COMMENT_SIZE)
+            handle.seek(size - tail_size)
+            tail = handle.read(tail_size)
+    except OSError:
+        return False
+
+    position = tail.rfind(_END_OF_CENTRAL_DIRECTORY_SIGNATURE)
+    if position < 0 or position + _END_OF_CENTRAL_DIRECTORY_SIZE > len(tail):
+        return False
+
+    # The record ends with the length of the comment that follows it
+    comment_size = struct.unpack("<H", tail[position + 20:position + 22])[0]
+    return position + _END_OF_CENTRAL_DIRECTORY_SIZE + comment_size == len(tail)
+
+def is_valid_artifact(artifact_path: str) -> bool:
+    """
+    Checks quickly if artifact_path is a complete zip archive that has been published,
+    without reading all of it. The size has to match the one in the sidecar file and
+    the archive has to end with an end of central directory record.
+
+    :param artifact_path: Path to the artifact.
+    :type artifact_path: str
+    :return: Whether the artifact can be used.
+    :rtype: bool
+    """
+
+    try:
+        with open(_get_sidecar_path(artifact_path)) as handle:
+            recorded_size = json.load(handle)["size"]
+        size = os.path.getsize(artifact_path)
+    except (OSError, ValueError, KeyError, TypeError):
+        return False
+
+    if size != recorded_size:
+        LOGGER.warning("Ignoring '%s', its size doesn't match the recorded one", artifact_path)
+        return False
+
+    return has_end_of_central_directory(artifact_path)
+
+def _fetch_shared(shared_key: str, temporary_path: str) -> bool:
+
+    backend = backends.get_backend()
+    if backend is None:
+        return False
+
+    try:
+        if not backend.fetch(shared_key, temporary_path):
+            return False
+    except OSError as error:
+        LOGGER.warning("Unable to fetch '%s' from %s: %s", shared_key, backend, error)
+        return False
+
+    if not has_end_of_central_directory(temporary_path):
+        LOGGER.warning("Ignoring '%s' from %s, it's not a complete zip archive", shared_key, backend)
+        return False
+
+    LOGGER.debug("Fetched '%s' from %s", shared_key, backend)
+    return True
+
+def _publish_shared(shared_key: str, artifact_path: str) -> None:
+
+    backend = backends.get_backend()
+    if backend is None:
+        return
+
+    # The shared cache is an optimization, the build succeeded anyway
+    try:
+        backend.publish(shared_key, artifact_path)
+    except OSError as error:
+        LOGGER.warning("Unable to publish '%s' to %s: %s", shared_key, backend, error)
+
+def build_once(artifact_path: str, build: typing.Callable[[str], None],
+               reuse_existing: bool = True, shared_key: str = None) -> str:
+    """
+    Builds the artifact at artifact_path unless a valid one exists. The build function
+    receives a temporary path to write the artifact to, it's published once the function
+    returns. Concurrent calls for the same artifact wait for the one that builds it.
+    If shared_key is set, the artifact is fetched from and published to the shared cache.
+
+    :param artifact_path: The final path of the artifact.
+    :type artifact_path: str
+    :param build: Function that writes the artifact to the path it's called with.
+    :type build: typing.Callable[[str], None]
+    :param reuse_existing: Whether an existing artifact can be returned, defaults to True
+    :type reuse_existing: bool, optional
+    :param shared_key: Key of the artifact in the shared cache, defaults to None which means it's not shared.
+    :type shared_key: str, optional
+    :return: The artifact_path.
+    :rtype: str
+    """
+
+    with tracing.span("cache_lookup", artifact=artifact_path) as attributes:
+        attributes["hit"] = reuse_existing and is_valid_artifact(artifact_path)
+
+    if attributes["hit"]:
+        LOGGER.debug("Using cached artifact %s", artifact_path)
+        record_access(artifact_path, hit=True)
+        return artifact_path
+
+    with lock(artifact_path):
+
+        # Another process may have built it while we waited for the lock
+        if reuse_existing and is_valid_artifact(artifact_path):
+            LOGGER.debug("Using artifact %s that has been built concurrently", artifact_path)
+            record_access(artifact_path, hit=True)
+            return artifact_path
+
+        temporary_path = get_temporary_path(artifact_path)
+        try:
+            fetched = False
+            if shared_key is not None:
+                with tracing.span("fetch_shared", key=shared_key) as attributes:
+                    fetched = attributes["hit"] = _fetch_shared(shared_key, temporary_path)
+            if not fetched:
+                with tracing.span("build", artifact=artifact_path):
+                    build(temporary_path)
+            with tracing.span("publish", artifact=artifact_path):
+                publish(temporary_path, artifact_path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+        if shared_key is not None and not fetched:
+            _publish_shared(shared_key, artifact_path)
+
+    record_access(artifact_path, hit=fetched)
+    return artifact_path
+
+def _get_manifest_path(code_directory: str) -> str:
+    directory_hash = util.hash_string(os.path.abspath(code_directory))
+    return os.path.join(util.get_build_dir(), MANIFEST_DIRECTORY_NAME, f"{directory_hash}.json")
+
+def _stat_key(stat: os.stat_result) -> typing.List[int]:
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+def load_manifest(code_directory: str) -> typing.Dict[str, list]:
+    """
+    Loads the stat manifest of code_directory. The manifest maps the archive name
+    of each file to its size, mtime_ns, inode and the sha256 of its content.
+
+    :param code_directory: Path to the code directory.
+    :type code_directory: str
+    :return: The manifest or an empty dictionary if there is none.
+    :rtype: typing.Dict[str, list]
+    """
+
+    try:
+        with open(_get_manifest_path(code_directory)) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {}
+
+def store_manifest(code_directory: str, manifest: typing.Dict[str, list]) -> None:
+    """
+    Persists the stat manifest of code_directory. The manifest is written to a
+    temporary file first and then moved in place, so readers never see a partial one.
+
+    :param code_directory: Path to the code directory.
+    :type code_directory: str
+    :param manifest: The manifest to store.
+    :type manifest: typing.Dict[str, list]
+    :return: Nothing.
+    :rtype: None
+    """
+
+    manifest_path = _get_manifest_path(code_directory)
+    pathlib.Path(os.path.dirname(manifest_path)).mkdir(parents=True, exist_ok=True)
+
+    temporary_path = get_temporary_path(manifest_path)
+    with open(temporary_path, "w") as handle:
+        json.dump(manifest, handle)
+    os.replace(temporary_path, manifest_path)
+
+def hash_sources(code_directory: str,
+                 exclude_patterns: typing.List[str]) -> typing.List[typing.Tuple[util.SourceEntry, str]]:
+    """
+    Returns every entry of code_directory together with the sha256 of its content.
+    Files whose size, mtime and inode match the persisted manifest aren't read again.
+
+    :param code_directory: Path to the code directory.
+    :type code_directory: str
+    :param exclude_patterns: Glob patterns of files/directories to skip.
+    :type exclude_patterns: typing.List[str]
+    :return: List of (entry, content hash) tuples, directories have an empty hash.
+    :rtype: typing.List[typing.Tuple[util.SourceEntry, str]]
+    """
+
+    with tracing.span("hash", directory=code_directory, files=0, hashed_files=0, hashed_bytes=0) as attributes:
+
+        manifest = load_manifest(code_directory)
+        updated_manifest = {}
+        hashed_entries = []
+
+        for entry in util.walk_sources([code_directory], exclude_patterns):
+
+            if entry.is_directory:
+                hashed_entries.append((entry, ""))
+                continue
+
+            stat_key = _stat_key(entry.stat)
+            known = manifest.get(entry.arcname)
+
+            if known is not None and known[:-1] == stat_key:
+                content_hash = known[-1]
+            else:
+                content_hash = util.hash_file(entry.path)
+                attributes["hashed_files"] += 1
+                attributes["hashed_bytes"] += entry.stat.st_size
+
+            updated_manifest[entry.arcname] = stat_key + [content_hash]
+            hashed_entries.append((entry, content_hash))
+            attributes["files"] += 1
+
+        if updated_manifest != manifest:
+            LOGGER.debug("Updating the manifest of '%s'", code_directory)
+            store_manifest(code_directory, updated_manifest)
+
+    return hashed_entries
+
+def fingerprint_sources(code_directories: typing.List[str],
+                        exclude_patterns: typing.List[str]) -> str:
+    """
+    Computes a fingerprint of the content that ends up in an archive of the
+    code_directories. It changes whenever a file is added, removed, renamed,
+    edited or changes its permissions.
+
+    :param code_directories: List of directories to fingerprint.
+    :type code_directories: typing.List[str]
+    :param exclude_patterns: Glob patterns of files/directories to skip.
+    :type exclude_patterns: typing.List[str]
+    :return: Hexdigest that identifies the content.
+    :rtype: str
+    """
+
+    return fingerprint_entries([
+        hashed_entry for directory in code_directories
+        for hashed_entry in hash_sources(directory, exclude_patterns)
+    ])
+
+def fingerprint_entries(hashed_entries: typing.List[typing.Tuple[util.SourceEntry, str]]) -> str:
+    """
+    Computes the fingerprint of entries that have already been hashed by hash_sources.
+
+    :param hashed_entries: List of (entry, content hash) tuples.
+    :type hashed_entries: typing.List[typing.Tuple[util.SourceEntry, str]]
+    :return: Hexdigest that identifies the content.
+    :rtype: str
+    """
+
+    lines = [
+        f"{entry.arcname}:{entry.stat.st_mode:o}:{content_hash}"
+        for entry, content_hash in hashed_entries
+    ]
+
+    return util.hash_string("\n".join(lines))
+
+def _get_entry_path(content_hash: str, settings: str) -> str:
+    return os.path.join(util.get_build_dir(), ENTRY_DIRECTORY_NAME, content_hash[:2],
+                        f"{content_hash}-{settings}")
+
+def open_compressed_entry(content_hash: str, settings: str) -> typing.Optional[CachedEntry]:
+    """
+    Returns the compressed data of a file from the entry cache.
+
+    :param content_hash: The sha256 of the uncompressed file content.
+    :type content_hash: str
+    :param settings: Identifies the compression method and level.
+    :type settings: str
+    :return: The cached entry, the caller has to close its data, or None if it isn't cached.
+    :rtype: typing.Optional[CachedEntry]
+    """
+
+    entry_path = _get_entry_path(content_hash, settings)
+    with contextlib.ExitStack() as stack:
+        try:
+            handle = stack.enter_context(open(entry_path, "rb"))
+        except OSError:
+            return None
+
+        # The modification time tells the eviction when the entry has been used last
+        os.utime(entry_path)
+
+        crc, file_size = _ENTRY_HEADER.unpack(handle.read(_ENTRY_HEADER.size))
+        compress_size = os.fstat(handle.fileno()).st_size - _ENTRY_HEADER.size
+
+        # The caller closes the handle
+        stack.pop_all()
+
+    return CachedEntry(crc, file_size, compress_size, handle)
+
+def store_compressed_entry(content_hash: str, settings: str, crc: int,
+                           file_size: int, data: typing.BinaryIO) -> None:
+    """
+    Stores the compressed data of a file in the entry cache, so other builds can
+    insert it into their archives without compressing the file again.
+
+    :param content_hash: The sha256 of the uncompressed file content.
+    :type content_hash: str
+    :param settings: Identifies the compression method and level.
+    :type settings: str
+    :param crc: The CRC-32 of the uncompressed file content.
+    :type crc: int
+    :param file_size: The size of the uncompressed file content.
+    :type file_size: int
+    :param data: The compressed data, it's read from the current position and rewound afterwards.
+    :type data: typing.BinaryIO
+    :return: Nothing.
+    :rtype: None
+    """
+
+    entry_path = _get_entry_path(content_hash, settings)
+    pathlib.Path(os.path.dirname(entry_path)).mkdir(parents=True, exist_ok=True)
+
+    start = data.tell()
+    temporary_path = get_temporary_path(entry_path)
+    with open(temporary_path, "wb") as handle:
+        handle.write(_ENTRY_HEADER.pack(crc, file_size))
+        shutil.copyfileobj(data, handle)
+    os.replace(temporary_path, entry_path)
+
+    data.seek(start)
+
+def _get_index_path() -> str:
+    return os.path.join(util.get_build_dir(), INDEX_FILE_NAME)
+
+def _load_index() -> dict:
+    try:
+        with open(_get_index_path()) as handle:
+            index = json.load(handle)
+    except (OSError, ValueError):
+        index = {}
+
+    index.setdefault("artifacts", {})
+    index.setdefault("statistics", {"hits": 0, "misses": 0, "bytes_saved": 0})
+    return index
+
+@contextlib.contextmanager
+def _update_index() -> typing.Iterator[dict]:
+
+    index_path = _get_index_path()
+    with lock(index_path):
+        index = _load_index()
+        yield index
+
+        temporary_path = get_temporary_path(index_path)
+        with open(temporary_path, "w") as handle:
+            json.dump(index, handle)
+        os.replace(temporary_path, index_path)
+
+def _get_index_key(artifact_path: str) -> typing.Optional[str]:
+    try:
+        relative_path = os.path.relpath(artifact_path, util.get_build_dir())
+    except ValueError:
+        # Different drives on Windows
+        return None
+    return None if relative_path.startswith("..") else relative_path
+
+def record_access(artifact_path: str, hit: bool) -> None:
+    """
+    Records that artifact_path has been used in the cache index. Only artifacts
+    in the build directory are recorded.
+
+    :param artifact_path: Path to the artifact.
+    :type artifact_path: str
+    :param hit: Whether the artifact came from the cache or has just been built.
+    :type hit: bool
+    :return: Nothing.
+    :rtype: None
+    """
+
+    index_key = _get_index_key(artifact_path)
+    if index_key is None:
+        return
+
+    size = os.path.getsize(artifact_path)
+
+    with _update_index() as index:
+        index["artifacts"][index_key] = {"size": size, "last_access": time.time()}
+
+        statistics = index["statistics"]
+        if hit:
+            statistics["hits"] += 1
+            statistics["bytes_saved"] += size
+        else:
+            statistics["misses"] += 1
+
+def parse_size(value: str) -> int:
+    """
+    Parses a size like 500M or 10G into bytes, the suffixes K, M, G and T are supported.
+
+    :param value: The size.
+    :type value: str
+    :raises ValueError: If the value isn't a size.
+    :return: The size in bytes.
+    :rtype: int
+    """
+
+    value = value.strip().upper().rstrip("B")
+    multiplier = _SIZE_SUFFIXES.get(value[-1:], 1)
+    return int(value.rstrip("".join(_SIZE_SUFFIXES))) * multiplier
+
+def get_max_bytes() -> typing.Optional[int]:
+    """
+    Returns the size limit of the build directory from the LAMBDA_BUNDLER_CACHE_MAX_BYTES
+    environment variable.
+
+    :return: The limit in bytes or None if there is no limit.
+    :rtype: typing.Optional[int]
+    """
+
+    value = util.get_setting(MAX_BYTES_ENV, "").strip()
+    if not value:
+        return None
+
+    try:
+        return parse_size(value)
+    except ValueError:
+        LOGGER.warning("Ignoring %s, '%s' is not a size like 500M or 10G", MAX_BYTES_ENV, value)
+        return None
+
+def _remove(path: str) -> bool:
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+        return True
+    except OSError as error:
+        # Windows doesn't allow removing files that are open
+        LOGGER.debug("Unable to remove '%s': %s", path, error)
+        return False
+
+def _remove_orphan(path: str) -> int:
+
+    if os.path.isdir(path):
+        size = sum(entry.stat.st_size for entry in util.walk_directory(path) if not entry.is_directory)
+    else:
+        size = os.path.getsize(path)
+
+    LOGGER.info("Removing orphaned '%s'", path)
+    return size if _remove(path) else 0
+
+def remove_orphans() -> int:
+    """
+    Removes what crashed builds left behind in the build directory: build directories
+    nobody holds the lock for and old temporary files. Everything else, e.g. directories
+    somebody else created in the build directory, is left alone.
+
+    :return: Number of bytes that have been freed.
+    :rtype: int
+    """
+
+    build_dir = util.get_build_dir()
+    freed_bytes = 0
+    now = time.time()
+
+    for directory in [build_dir, os.path.join(build_dir, "distributions")]:
+        if not os.path.isdir(directory):
+            continue
+
+        for entry in os.scandir(directory):
+            if entry.name in _RESERVED_DIRECTORY_NAMES or entry.name.endswith(".lock"):
+                continue
+
+            if entry.is_dir():
+                # Build directories are named like the zip archive they produce and
+                # are in use as long as somebody holds its lock
+                if os.path.exists(f"{entry.path}.zip.lock"):
+                    with lock(f"{entry.path}.zip", blocking=False) as acquired:
+                        if acquired:
+                            freed_bytes += _remove_orphan(entry.path)
+
+            elif _TEMPORARY_FILE_PATTERN.search(entry.name) and now - entry.stat().st_mtime > ORPHAN_MAX_AGE_SECONDS:
+                freed_bytes += _remove_orphan(entry.path)
+
+    return freed_bytes
+
+def _get_evictable_directories(build_dir: str) -> typing.List[str]:
+
+    # Files in these directories can be fetched or built again, their modification time is their last use
+    directories = [
+        os.path.join(build_dir, ENTRY_DIRECTORY_NAME),
+        os.path.join(build_dir, util.PIP_CACHE_DIRECTORY_NAME)
+    ]
+    # Wheels in a wheelhouse of the user or that can't be downloaded again are kept
+    if util.get_setting(util.WHEELHOUSE_ENV) is None and not util.is_offline():
+        directories.append(os.path.join(build_dir, util.WHEELHOUSE_DIRECTORY_NAME))
+    return directories
+
+def _get_eviction_candidates(index: dict) -> typing.List[typing.Tuple[float, str, int, bool]]:
+
+    build_dir = util.get_build_dir()
+    candidates = [
+        (record["last_access"], os.path.join(build_dir, index_key), record["size"], True)
+        for index_key, record in index["artifacts"].items()
+    ]
+
+    for directory in _get_evictable_directories(build_dir):
+        if os.path.isdir(directory):
+            # Files in hidden directories, like the ones wheels are built in, are still being written
+            candidates += [
+                (entry.stat.st_mtime, entry.path, entry.stat.st_size, False)
+                for entry in util.walk_directory(directory)
+                if not entry.is_directory and not entry.path.endswith(".tmp") and not entry.arcname.startswith(".")
+            ]
+
+    return sorted(candidates)
+
+def _evict_artifact(path: str) -> bool:
+
+    # Somebody holding the lock is about to rebuild or read the artifact
+    with lock(path, blocking=False) as acquired:
+        if not acquired or not _remove(path):
+            return False
+
+        sidecar_path = _get_sidecar_path(path)
+        if os.path.exists(sidecar_path):
+            _remove(sidecar_path)
+        return True
+
+def enforce_limits(max_bytes: int = None) -> int:
+    """
+    Removes orphaned build leftovers and evicts the least recently used artifacts
+    and compressed entries until the build directory is below max_bytes.
+
+    :param max_bytes: The size limit, defaults to None which means the one from get_max_bytes.
+    :type max_bytes: int, optional
+    :return: Number of bytes that have been freed.
+    :rtype: int
+    """
+
+    freed_bytes = remove_orphans()
+
+    max_bytes = max_bytes if max_bytes is not None else get_max_bytes()
+    if max_bytes is None:
+        return freed_bytes
+
+    with _update_index() as index:
+
+        # Drop records of artifacts that have been deleted by someone else
+        build_dir = util.get_build_dir()
+        index["artifacts"] = {
+            index_key: record for index_key, record in index["artifacts"].items()
+            if os.path.exists(os.path.join(build_dir, index_key))
+        }
+
+        candidates = _get_eviction_candidates(index)
+        total_bytes = sum(candidate[2] for candidate in candidates)
+        grace_period_start = time.time() - EVICTION_GRACE_PERIOD_SECONDS
+
+        for last_access, path, size, is_artifact in candidates:
+            if total_bytes <= max_bytes or last_access > grace_period_start:
+                break
+
+            evicted = _evict_artifact(path) if is_artifact else _remove(path)
+            if not evicted:
+                continue
+
+            LOGGER.debug("Evicted '%s'", path)
+            index["artifacts"].pop(_get_index_key(path), None)
+            total_bytes -= size
+            freed_bytes += size
+
+    if total_bytes > max_bytes:
+        LOGGER.warning("The build directory exceeds %s bytes, but everything in it has been used recently", max_bytes)
+
+    return freed_bytes
+
+def get_statistics() -> CacheStatistics:
+    """
+    Returns statistics about the usage of the build directory.
+
+    :return: The statistics.
+    :rtype: CacheStatistics
+    """
+
+    index = _load_index()
+    build_dir = util.get_build_dir()
+    bytes_stored = 0
+    if os.path.isdir(build_dir):
+        bytes_stored = sum(entry.stat.st_size for entry in util.walk_directory(build_dir) if not entry.is_directory)
+
+    return CacheStatistics(
+        hits=index["statistics"]["hits"],
+        misses=index["statistics"]["misses"],
+        artifacts=len(index["artifacts"]),
+        bytes_stored=bytes_stored,
+        bytes_saved=index["statistics"]["bytes_saved"]
+    )
@@ -0,0 +1,212 @@
+"""
+Command line interface of the lambda bundler.
+"""
+import argparse
+import json
+import logging
+import sys
+import typing
+
+import lambda_bundler.budget as budget
+import lambda_bundler.cache as cache
+import lambda_bundler.watch as watch
+
+LOGGER = logging.getLogger("lambda_bundler")
+
+def _format_bytes(byte_count: int) -> str:
+    for unit in ["B", "KB", "MB", "GB"]:
+        if byte_count < 1024:
+            return f"{byte_count:.1f} {unit}" if unit != "B" else f"{byte_count} {unit}"
+        byte_count /= 1024
+    return f"{byte_count:.1f} TB"
+
+def _parse_size(value: str) -> int:
+    try:
+        return cache.parse_size(value)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(f"'{value}' is not a size like 500M or 10G") from error
+
+def cache_stats(arguments: argparse.Namespace) -> int:
+    """
+    Prints the statistics of the build directory.
+
+    :param arguments: The parsed command line arguments.
+    :type arguments: argparse.Namespace
+    :return: The exit code.
+    :rtype: int
+    """
+
+    statistics = cache.get_statistics()
+
+    if arguments.json:
+        print(json.dumps(statistics._asdict(), indent=2))
+        return 0
+
+    lookups = statistics.hits + statistics.misses
+    hit_rate = statistics.hits / lookups if lookups else 0.0
+
+    print(f"Artifacts:    {statistics.artifacts}")
+    print(f"Hits:         {statistics.hits}")
+    print(f"Misses:       {statistics.misses}")
+    print(f"Hit rate:     {hit_rate:.1%}")
+    print(f"Bytes stored: {_format_bytes(statistics.bytes_stored)}")
+    print(f"Bytes saved:  {_format_bytes(statistics.bytes_saved)}")
+    return 0
+
+def cache_prune(arguments: argparse.Namespace) -> int:
+    """
+    Removes orphaned build leftovers and evicts artifacts until the build directory
+    fits into the size limit.
+
+    :param arguments: The parsed command line arguments.
+    :type arguments: argparse.Namespace
+    :return: The exit code.
+    :rtype: int
+    """
+
+    freed_bytes = cache.enforce_limits(max_bytes=arguments.max_bytes)
+    print(f"Freed {_format_bytes(freed_bytes)}")
+    return 0
+
+def _parse_limit(value: str) -> typing.Optional[int]:
+    if value.strip().lower() == "none":
+        return None
+    return _parse_size(value)
+
+def size(arguments: argparse.Namespace) -> int:
+    """
+    Prints the compressed and uncompressed sizes of an archive per top-level package
+    and checks them against the budget.
+
+    :param arguments: The parsed command line arguments.
+    :type arguments: argparse.Namespace
+    :return: The exit code, 1 if the archive exceeds the budget.
+    :rtype: int
+    """
+
+    report = budget.analyze_archive(arguments.path)
+
+    size_budget = budget.SizeBudget(arguments.max_zipped, arguments.max_unzipped)
+
+    try:
+        budget.check_archive(arguments.path, size_budget)
+        exceeded = None
+    except budget.BudgetExceededError as error:
+        exceeded = str(error)
+
+    if arguments.json:
+        print(json.dumps(dict(report.to_dict(), budget=size_budget._asdict(), exceeded=exceeded), indent=2))
+    else:
+        print(f"Compressed:   {_format_bytes(report.compressed_bytes)}")
+        print(f"Uncompressed: {_format_bytes(report.uncompressed_bytes)}")
+        print(f"Files:        {report.file_count}")
+        print()
+        for entry in report.packages[:arguments.top]:
+            print(f"{_format_bytes(entry.compressed_bytes):>10} {_format_bytes(entry.uncompressed_bytes):>10}  {entry.name}")
+
+    if exceeded is not None:
+        print(exceeded, file=sys.stderr)
+        return 1
+    return 0
+
+def watch_config(arguments: argparse.Namespace) -> int:
+    """
+    Builds the functions and layers of a config and rebuilds them whenever their
+    code or requirements change.
+
+    :param arguments: The parsed command line arguments.
+    :type arguments: argparse.Namespace
+    :return: The exit code.
+    :rtype: int
+    """
+
+    try:
+        specs = watch.load_config(arguments.config)
+    except (OSError, ValueError) as error:
+        print(error, file=sys.stderr)
+        return 1
+
+    if arguments.once:
+        artifacts = watch.build_specs(specs, specs)
+        return 0 if len(artifacts) == len(specs) else 1
+
+    try:
+        watch.watch(specs, polling=arguments.polling, debounce_seconds=arguments.debounce)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def _create_parser() -> argparse.ArgumentParser:
+
+    parser = argparse.ArgumentParser(
+        prog="lambda-bundler",
+        description="Bundle python code and dependencies for AWS Lambda."
+    )
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    cache_parser = commands.add_parser("cache", help="Inspect and clean up the build directory.")
+    cache_commands = cache_parser.add_subparsers(dest="cache_command")
+    cache_commands.required = True
+
+    stats_parser = cache_commands.add_parser("stats", help="Show hits, misses and the size of the build directory.")
+    stats_parser.add_argument("--json", action="store_true", help="Print the statistics as JSON.")
+    stats_parser.set_defaults(function=cache_stats)
+
+    prune_parser = cache_commands.add_parser("prune", help="Evict least recently used artifacts.")
+    prune_parser.add_argument(
+        "--max-bytes",
+        type=_parse_size,
+        default=None,
+        help=f"Size limit like 500M or 10G, defaults to ${cache.MAX_BYTES_ENV}."
+    )
+    prune_parser.set_defaults(function=cache_prune)
+
+    size_parser = commands.add_parser("size", help="Analyze the size of an archive and check it against the budget.")
+    size_parser.add_argument("path", help="Path to the archive.")
+    size_parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    default_budget = budget.get_budget()
+    size_parser.add_argument(
+        "--max-zipped",
+        type=_parse_limit,
+        default=default_budget.max_compressed_bytes,
+        help=f"Compressed size limit like 50M or none, defaults to ${budget.MAX_ZIPPED_BYTES_ENV} or none."
+    )
+    size_parser.add_argument(
+        "--max-unzipped",
+        type=_parse_limit,
+        default=default_budget.max_uncompressed_bytes,
+        help=f"Uncompressed size limit like 250M or none, defaults to ${budget.MAX_UNZIPPED_BYTES_ENV} or 250M."
+    )
+    size_parser.add_argument("--top", type=int, default=20, help="Number of packages to show, defaults to 20.")
+    size_parser.set_defaults(function=size)
+
+    watch_parser = commands.add_parser("watch", help="Rebuild functions and layers when their files change.")
+    watch_parser.add_argument("config", help="Path to the JSON config of the functions and layers.")
+    watch_parser.add_argument("--polling", action="store_true", help="Poll for changes instead of using inotify.")
+    watch_parser.add_argument(
+        "--debounce",
+        type=float,
+        default=watch.DEFAULT_DEBOUNCE_SECONDS,
+        help=f"Seconds without changes before a rebuild starts, defaults to {watch.DEFAULT_DEBOUNCE_SECONDS}."
+    )
+    watch_parser.add_argument("--once", action="store_true", help="Build everything once and exit.")
+    watch_parser.set_defaults(function=watch_config)
+
+    return parser
+
+def main(argv: typing.List[str] = None) -> int:
+    """
+    Entry point of the lambda-bundler command.
+
+    :param argv: The command line arguments, defaults to None which means sys.argv.
+    :type argv: typing.List[str], optional
+    :return: The exit code.
+    :rtype: int
+    """
+
+    arguments = _create_parser().parse_args(argv)
+    return arguments.function(arguments)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Contains the compression policy that decides per archive entry whether and
+how hard it's compressed.
+"""
+import collections
+import math
+import os
+import typing
+import zipfile
+
+import lambda_bundler.util as util
+
+COMPRESSION_PRESET_ENV = "LAMBDA_BUNDLER_COMPRESSION"
+
+# Formats that are compressed already, deflating them again only costs time
+STORED_EXTENSIONS = frozenset([
+    ".7z", ".bz2", ".egg", ".gif", ".gz", ".jar", ".jpeg", ".jpg", ".lz4", ".mp3",
+    ".mp4", ".png", ".tgz", ".webp", ".whl", ".woff", ".woff2", ".xz", ".zip", ".zst",
+])
+
+# Files smaller than this are always deflated, their entropy can't be estimated
+MIN_SAMPLE_SIZE = 4 * 1024
+
+# Number of bytes at the start of a file the entropy is estimated from
+SAMPLE_SIZE = 16 * 1024
+
+# Bits per byte above which content is considered compressed or random
+ENTROPY_THRESHOLD = 7.5
+
+class CompressionPolicy(typing.NamedTuple):
+    """Describes how entries are compressed."""
+    name: str
+    level: int
+
+PRESETS = {policy.name: policy for policy in [
+    # Quick builds during development
+    CompressionPolicy("fast", 1),
+    CompressionPolicy("default", 6),
+    # Smallest archives for releases, takes the longest
+    CompressionPolicy("max", 9),
+]}
+
+def get_policy(preset: str = None) -> CompressionPolicy:
+    """
+    Returns the compression policy for preset or the one in the LAMBDA_BUNDLER_COMPRESSION
+    environment variable, which is one of fast, default and max.
+
+    :param preset: Name of the preset, defaults to None which means the environment variable.
+    :type preset: str, optional
+    :raises ValueError: If the preset doesn't exist.
+    :return: The policy.
+    :rtype: CompressionPolicy
+    """
+
+    name = (preset or util.get_setting(COMPRESSION_PRESET_ENV) or "default").strip().lower()
+    if name not in PRESETS:
+        raise ValueError(f"Unknown compression preset '{name}', choose one of {', '.join(PRESETS)}")
+    return PRESETS[name]
+
+def get_entropy(sample: bytes) -> float:
+    """
+    Returns the Shannon entropy of sample in bits per byte, 8 means random.
+
+    :param sample: The bytes to analyze.
+    :type sample: bytes
+    :return: The entropy between 0 and 8.
+    :rtype: float
+    """
+
+    if not sample:
+        return 0.0
+
+    counts = collections.Counter(sample)
+    return -sum(count / len(sample) * math.log2(count / len(sample)) for count in counts.values())
+
+def choose_compression(path: str, size: int,
+                       policy: CompressionPolicy) -> typing.Tuple[int, typing.Optional[int]]:
+    """
+    Chooses how the file at path is compressed. Empty files, known compressed formats
+    and large files whose first block looks random are stored, everything else is
+    deflated with the level of the policy.
+
+    :param path: Path to the file.
+    :type path: str
+    :param size: Size of the file.
+    :type size: int
+    :param policy: The compression policy.
+    :type policy: CompressionPolicy
+    :return: The compression method and level, the level is None for stored files.
+    :rtype: typing.Tuple[int, typing.Optional[int]]
+    """
+
+    if size == 0 or os.path.splitext(path)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED, None
+
+    if size >= MIN_SAMPLE_SIZE:
+        with open(path, "rb") as handle:
+            if get_entropy(handle.read(SAMPLE_SIZE)) > ENTROPY_THRESHOLD:
+                return zipfile.ZIP_STORED, None
+
+    return zipfile.ZIP_DEFLATED, policy.level
@@ -1,4 +1,7 @@
 """This module contains code to install dependencies in a target directory"""
+import calendar
+import concurrent.futures
+import json
 import logging
 import os
 import pathlib
@@ -8,45 +11,404 @@ import sys
 import tempfile
 import typing
 
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.utils import canonicalize_name
+
+import lambda_bundler.archive as archive
+import lambda_bundler.budget as budget
+import lambda_bundler.cache as cache
+import lambda_bundler.compression as compression
+import lambda_bundler.requirements as requirements
+import lambda_bundler.slimming as slimming
+import lambda_bundler.targets as targets
+import lambda_bundler.tracing as tracing
+import lambda_bundler.treeshake as treeshake
 import lambda_bundler.util as util
+import lambda_bundler.wheels as wheels
 
 LOGGER = logging.getLogger("lambda_bundler")
 
-def install_dependencies(path_to_requirements: str, path_to_target_directory: str) -> str:
+DISTRIBUTION_DIRECTORY_NAME = "distributions"
+
+# Number of pip processes that install distributions at the same time
+MAX_PARALLEL_INSTALLS = 4
+
+class Distribution(typing.NamedTuple):
+    """A distribution pip resolved from a set of requirements."""
+    name: str
+    version: str
+    requirement: str
+    cache_key: typing.Optional[str]
+    # Normalized names of the distributions it depends on, including optional ones
+    requires: typing.Tuple[str, ...] = ()
+
+def _get_pip_options() -> typing.List[str]:
+
+    # pip looks for wheels in the wheelhouse first and keeps the wheels it
+    # builds from source distributions in its cache between builds
+    options = ["--find-links", util.get_wheelhouse_dir()]
+    if "PIP_CACHE_DIR" not in os.environ:
+        options += ["--cache-dir", os.path.join(util.get_build_dir(), util.PIP_CACHE_DIRECTORY_NAME)]
+    if util.is_offline():
+        options.append("--no-index")
+    return options
+
+def _get_pip_environment() -> typing.Dict[str, str]:
+
+    environment = dict(os.environ)
+    if util.is_reproducible():
+        # Wheels built from source and the bytecode pip compiles don't embed the build time
+        year, month, day, hour, minute, second = archive.get_fixed_date_time()
+        fixed_timestamp = calendar.timegm((year, month, day, hour, minute, second, 0, 0, 0))
+        environment.setdefault(archive.SOURCE_DATE_EPOCH_ENV, str(fixed_timestamp))
+    return environment
+
+def _run_pip(call: typing.List[str], target: typing.Optional[targets.Target]) -> bytes:
+
+    if target is None:
+        return subprocess.check_output(call, env=_get_pip_environment())
+
+    try:
+        return subprocess.check_output(call, env=_get_pip_environment(), stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError as error:
+        output = (error.output or b"").decode("utf-8", errors="replace")
+        LOGGER.debug("pip failed for the target %s: %s", target.tag, output)
+        targets.check_pip_output(output, target)
+        raise
+
+def build_wheels(path_to_requirements: str, with_dependencies: bool = True) -> typing.List[str]:
+    """
+    Builds or downloads the wheels for the requirements in path_to_requirements and
+    adds the ones that are missing to the wheelhouse, so they are never built again.
+    If there is a target, only wheels for the target are downloaded.
+
+    :param path_to_requirements: Path to the requirements.txt with the dependencies.
+    :type path_to_requirements: str
+    :param with_dependencies: Whether to include transitive dependencies as well, defaults to True
+    :type with_dependencies: bool, optional
+    :raises targets.NoCompatibleWheelError: If a requirement has no wheel for the target.
+    :return: The paths of the wheels in the wheelhouse.
+    :rtype: typing.List[str]
+    """
+
+    target = targets.get_target()
+    wheelhouse = util.get_wheelhouse_dir()
+    pathlib.Path(wheelhouse).mkdir(parents=True, exist_ok=True)
+
+    # Wheels are built in a private directory and moved into the wheelhouse
+    # when they are complete, concurrent installs may read them at any time.
+    with tempfile.TemporaryDirectory(dir=wheelhouse, prefix=".") as wheel_directory:
+
+        LOGGER.debug("Building wheels for '%s'", path_to_requirements)
+        if target is None:
+            call = [sys.executable, "-m", "pip", "wheel", "-r", path_to_requirements,
+                    "-w", wheel_directory] + _get_pip_options()
+        else:
+            # Wheels can't be built for another platform, but downloaded
+            call = [sys.executable, "-m", "pip", "download", "-r", path_to_requirements,
+                    "-d", wheel_directory] + _get_pip_options() + target.get_pip_options()
+        if not with_dependencies:
+            call.append("--no-deps")
+        with tracing.span("pip_wheel", requirements=path_to_requirements) as attributes:
+            _run_pip(call, target)
+            attributes["files"] = len(os.listdir(wheel_directory))
+
+        wheel_paths = []
+        for wheel_name in sorted(os.listdir(wheel_directory)):
+            wheel_path = os.path.join(wheelhouse, wheel_name)
+            if not os.path.exists(wheel_path):
+                LOGGER.debug("Adding '%s' to the wheelhouse", wheel_name)
+                os.replace(os.path.join(wheel_directory, wheel_name), wheel_path)
+            else:
+                # The modification time tells the eviction of the cache when a wheel has been used last
+                os.utime(wheel_path)
+            wheel_paths.append(wheel_path)
+
+    return wheel_paths
+
+def install_dependencies(path_to_requirements: str, path_to_target_directory: str,
+                         with_dependencies: bool = True) -> str:
     """
     Installs the dependencies from path_to_requirements.txt into path_to_target_directory.
+    The wheels are taken from the wheelhouse, missing ones are built and added to it first.
 
     :param path_to_requirements: Path to the requirements.txt with the dependencies.
     :type path_to_requirements: str
     :param path_to_target_directory: Path to the target directory to install them in.
     :type path_to_target_directory: str
+    :param with_dependencies: Whether to install transitive dependencies as well, defaults to True
+    :type with_dependencies: bool, optional
     :return: Output of the install command.
     :rtype: str
     """
 
-    # Use the pip module to recursively (-r) install all packages from
-    # path_to_requirements into (-t) path_to_target_directory while
-    # ignoring already installed packages (-I)
+    wheel_paths = build_wheels(path_to_requirements, with_dependencies)
+    return install_wheels(wheel_paths, path_to_target_directory, path_to_requirements)
+
+def install_wheels(wheel_paths: typing.List[str], path_to_target_directory: str,
+                   path_to_requirements: str = None) -> str:
+    """
+    Installs the wheels in wheel_paths into path_to_target_directory with pip.
+
+    :param wheel_paths: Paths to the wheels, usually in the wheelhouse.
+    :type wheel_paths: typing.List[str]
+    :param path_to_target_directory: Path to the target directory to install them in.
+    :type path_to_target_directory: str
+    :param path_to_requirements: The requirements.txt the wheels were built for, defaults to None
+    :type path_to_requirements: str, optional
+    :return: Output of the install command.
+    :rtype: str
+    """
+
+    # Use the pip module to install exactly these wheels into (-t)
+    # path_to_target_directory while ignoring already installed packages (-I)
     LOGGER.debug("Installing '%s' to '%s'", path_to_requirements, path_to_target_directory)
-    call = [sys.executable, "-m", "pip", "install", "-r", path_to_requirements,
-            "-t", path_to_target_directory, "-I"]
-    return subprocess.check_output(call)
+    call = [sys.executable, "-m", "pip", "install", "-t", path_to_target_directory,
+            "-I", "--no-deps", "--no-index"]
+    target = targets.get_target()
+    if target is not None:
+        # The bytecode of the interpreter that runs pip is useless for another version
+        call += target.get_pip_options() + ["--no-compile"]
+    with tracing.span("pip_install", requirements=path_to_requirements, wheels=len(wheel_paths)):
+        return subprocess.check_output(call + wheel_paths, env=_get_pip_environment())
+
+def _get_installer() -> str:
+    # Wheels that are copied directly lack the bytecode and scripts pip adds
+    return "direct" if util.is_direct_install() else "pip"
+
+def _get_option_lines(requirements_information: str) -> typing.List[str]:
+    # Global options like --index-url apply to every distribution, includes and editables don't
+    return [
+        line.strip() for line in requirements_information.split("\n")
+        if line.strip().startswith("-")
+        and not line.strip().startswith(("-r", "-c", "-e", "--requirement", "--constraint", "--editable"))
+    ]
+
+def _get_required_names(requires_dist: typing.List[str]) -> typing.Tuple[str, ...]:
+    names = set()
+    for line in requires_dist:
+        try:
+            names.add(canonicalize_name(Requirement(line).name))
+        except InvalidRequirement:
+            LOGGER.debug("Ignoring the invalid dependency '%s'", line)
+    return tuple(sorted(names))
+
+def _parse_report_item(item: dict) -> Distribution:
+
+    name = item["metadata"]["name"]
+    version = item["metadata"]["version"]
+    requires = _get_required_names(item["metadata"].get("requires_dist", []))
+    download_info = item["download_info"]
+    url = download_info["url"]
+
+    if "dir_info" in download_info:
+        # Local directories can change at any time, these are never cached
+        return Distribution(name, version, f"{name} @ {url}", None, requires)
+
+    if "vcs_info" in download_info:
+        vcs_info = download_info["vcs_info"]
+        requirement = f"{name} @ {vcs_info['vcs']}+{url}@{vcs_info['commit_id']}"
+        key_material = [name, version, url, vcs_info["commit_id"]]
+    else:
+        archive_info = download_info.get("archive_info", {})
+        # Index urls may contain credentials that pip redacts in the report
+        requirement = f"{name} @ {url}" if item.get("is_direct") else f"{name}=={version}"
+        # The file name of a wheel determines the platform it has been built for
+        key_material = [name, version, url.split("/")[-1], archive_info.get("hash", "")]
+
+    # Distributions with C-extensions only work for the interpreter they were installed for
+    cache_key = util.hash_string(json.dumps(key_material + [
+        util.get_environment_tag(targets.get_target_tag()), slimming.get_profile().key,
+        compression.get_policy().name, _get_installer()
+    ]))
+    return Distribution(name, version, requirement, cache_key, requires)
+
+def resolve_distributions(path_to_requirements: str) -> typing.Optional[typing.List[Distribution]]:
+    """
+    Asks pip which distributions it would install for the requirements in
+    path_to_requirements, including all transitive dependencies.
+
+    :param path_to_requirements: Path to the requirements.txt with the dependencies.
+    :type path_to_requirements: str
+    :return: The distributions sorted by name or None if pip can't resolve them without installing.
+    :rtype: typing.Optional[typing.List[Distribution]]
+    """
+
+    with tempfile.TemporaryDirectory() as report_directory:
+
+        report_path = os.path.join(report_directory, "report.json")
+        call = [sys.executable, "-m", "pip", "install", "-r", path_to_requirements,
+                "--dry-run", "--ignore-installed", "--quiet", "--report", report_path] + _get_pip_options()
+        target = targets.get_target()
+        if target is not None:
+            # pip only accepts the options of a target for installs into a directory
+            call += target.get_pip_options() + ["--target", os.path.join(report_directory, "target")]
+
+        LOGGER.debug("Resolving the distributions of '%s'", path_to_requirements)
+        with tracing.span("resolve", requirements=path_to_requirements) as attributes:
+            try:
+                subprocess.check_output(call, env=_get_pip_environment(), stderr=subprocess.STDOUT)
+                with open(report_path) as handle:
+                    report = json.load(handle)
+            except (subprocess.CalledProcessError, OSError, ValueError) as error:
+                # Old versions of pip don't support --report
+                LOGGER.debug("Unable to resolve the distributions: %s", error)
+                return None
+            attributes["distributions"] = len(report["install"])
+
+    distributions = [_parse_report_item(item) for item in report["install"]]
+    return sorted(distributions, key=lambda distribution: distribution.name.lower())
+
+def create_or_return_zipped_distribution(distribution: Distribution,
+                                         requirements_information: str,
+                                         output_directory_path: str,
+                                         workers: int = None) -> str:
+    """
+    Returns the zip archive of a single distribution that is installed without its
+    dependencies. Archives are cached, so each version of a distribution is only
+    installed once for all combinations of requirements it's part of.
+
+    :param distribution: The distribution to install.
+    :type distribution: Distribution
+    :param requirements_information: The requirements the distribution was resolved from, its options are used.
+    :type requirements_information: str
+    :param output_directory_path: The directory to build the distribution and store the result in.
+    :type output_directory_path: str
+    :param workers: Number of threads that compress the archive, defaults to None which means one per CPU.
+    :type workers: int, optional
+    :return: Path to the zip archive of the distribution.
+    :rtype: str
+    """
 
-def merge_requirement_files(*file_contents: typing.List[str]) -> str:
+    distribution_directory = os.path.join(output_directory_path, DISTRIBUTION_DIRECTORY_NAME)
+    pathlib.Path(distribution_directory).mkdir(parents=True, exist_ok=True)
+
+    if distribution.cache_key is not None:
+        artifact_path = os.path.join(distribution_directory, f"{distribution.cache_key}.zip")
+    else:
+        artifact_path = os.path.join(distribution_directory, f"uncached-{util.hash_string(distribution.requirement)}.zip")
+
+    def build(temporary_path: str) -> None:
+        # The working directory is named like the archive, so the cache knows
+        # it belongs to a running build as long as the archive is locked.
+        working_directory = artifact_path[:-len(".zip")]
+        if os.path.exists(working_directory):
+            shutil.rmtree(working_directory)
+
+        try:
+            install_directory = os.path.join(working_directory, "install")
+            pathlib.Path(install_directory).mkdir(parents=True)
+            requirements_path = os.path.join(working_directory, "requirements.txt")
+            with open(requirements_path, "w") as handle:
+                handle.write("\n".join(_get_option_lines(requirements_information) + [distribution.requirement]))
+
+            profile = slimming.get_profile()
+            wheel_paths = build_wheels(requirements_path, with_dependencies=False)
+
+            # Stripping binaries needs them on disk
+            if util.is_direct_install() and not profile.strip_binaries \
+                    and len(wheel_paths) == 1 and wheel_paths[0].endswith(wheels.WHEEL_EXTENSION):
+                try:
+                    wheels.install_wheel(wheel_paths[0], temporary_path, profile=profile)
+                    return
+                except wheels.UnsupportedWheelError as error:
+                    LOGGER.debug("Installing '%s' with pip: %s", wheel_paths[0], error)
+
+            install_wheels(wheel_paths, install_directory, requirements_path)
+            slimming.slim_directory(install_directory, profile)
+
+            archive.zip_directory(install_directory, temporary_path, workers=workers)
+        finally:
+            shutil.rmtree(working_directory, ignore_errors=True)
+
+    return cache.build_once(
+        artifact_path,
+        build,
+        reuse_existing=distribution.cache_key is not None,
+        shared_key=distribution.cache_key
+    )
+
+def _install_distributions(distributions: typing.List[Distribution], requirements_information: str,
+                           output_directory_path: str, workers: int = None) -> typing.List[str]:
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_PARALLEL_INSTALLS) as executor:
+        return list(executor.map(
+            util.bind_active(lambda distribution: create_or_return_zipped_distribution(
+                distribution=distribution,
+                requirements_information=requirements_information,
+                output_directory_path=output_directory_path,
+                workers=workers
+            )),
+            distributions
+        ))
+
+def create_or_return_zipped_distributions(distributions: typing.List[Distribution],
+                                          requirements_information: str,
+                                          output_directory_path: str,
+                                          prefix_in_zip: str = None,
+                                          workers: int = None) -> str:
+    """
+    Returns an archive with exactly the distributions in distributions, without
+    their other dependencies. It's assembled from the archives of the individual
+    distributions and cached as long as all of them can be cached.
+
+    :param distributions: The distributions, e.g. a subset of the ones resolve_distributions returned.
+    :type distributions: typing.List[Distribution]
+    :param requirements_information: The requirements the distributions were resolved from, its options are used.
+    :type requirements_information: str
+    :param output_directory_path: The directory to build the distributions and store the result in.
+    :type output_directory_path: str
+    :param prefix_in_zip: Optional prefix in the zip file, defaults to None
+    :type prefix_in_zip: str, optional
+    :param workers: Number of threads that compress the archives, defaults to None which means one per CPU.
+    :type workers: int, optional
+    :return: Path to the zip archive.
+    :rtype: str
+    """
+
+    distributions = sorted(distributions, key=lambda distribution: distribution.name.lower())
+    artifact_name = util.hash_string(json.dumps(
+        [distribution.cache_key or distribution.requirement for distribution in distributions] + [prefix_in_zip or ""]
+    ))
+    artifact_path = os.path.join(output_directory_path, f"{artifact_name}.zip")
+
+    def build(temporary_path: str) -> None:
+        distribution_zips = _install_distributions(
+            distributions, requirements_information, output_directory_path, workers
+        )
+        with archive.ZipWriter.create(temporary_path) as writer:
+            for distribution_zip in distribution_zips:
+                archive.copy_entries(writer, distribution_zip, prefix=prefix_in_zip)
+
+    return cache.build_once(
+        artifact_path,
+        build,
+        reuse_existing=all(distribution.cache_key is not None for distribution in distributions)
+    )
+
+def merge_requirement_files(*file_contents: typing.List[str],
+                            base_directories: typing.List[str] = None) -> str:
     """
     Merges the content of multiple requirements.txt files into one in a reproducible
-    manner and returns it. This means empty lines will be removed and the output is
-    the data for a new requirements.txt file based on the input.
+    manner and returns it. Requirements are normalized, so requirements that only
+    differ in spelling, comments, duplicates or order result in the same output.
+    Included requirement files are merged as well, options come first.
 
+    :param base_directories: The directory of each file that includes refer to, defaults to None
+                             which means the working directory.
+    :type base_directories: typing.List[str], optional
     :return: A merged version of the content of the requirement files.
     :rtype: str
     """
 
-    output_list = []
-    for content in file_contents:
-        output_list += [line.strip() for line in content.split("\n") if line.strip() != ""]
+    base_directories = base_directories or [None] * len(file_contents)
+
+    parsed_requirements = [
+        requirements.parse_requirements(content, base_directory)
+        for content, base_directory in zip(file_contents, base_directories)
+    ]
 
-    return "\n".join(sorted(output_list))
+    return "\n".join(requirements.merge_parsed_requirements(*parsed_requirements))
 
 def collect_and_merge_requirements(*requirement_files: typing.List[str]) -> str:
     """
@@ -57,39 +419,40 @@ def collect_and_merge_requirements(*requirement_files: typing.List[str]) -> str:
     :rtype: str
     """
 
-    file_contents = util.get_content_of_files(*requirement_files)
+    with tracing.span("merge_requirements", files=len(requirement_files)):
+        file_contents = util.get_content_of_files(*requirement_files)
 
-    return merge_requirement_files(*file_contents)
+        return merge_requirement_files(
+            *file_contents,
+            base_directories=[os.path.dirname(os.path.abspath(path)) for path in requirement_files]
+        )
 
-def create_zipped_dependencies(requirements_information: str,
-                               output_directory_path: str,
-                               prefix_in_zip: str = None) -> str:
+def get_dependencies_key(requirements_information: str, prefix_in_zip: str = None) -> str:
     """
-    This function creates a zip archive that holds the python dependencies
-    passed to this function via the requirements_information argument. The
-    output will be stored in output_directory_path with a unique name and
-    returned. If prefix_in_zip is set, requirements will be installed in a
-    subdirectory of the zip (useful for Lambda layers which require a
-    python prefix).
-
+    Returns the key of the archive with the dependencies in requirements_information,
+    which is unique for the requirements, the prefix, the environment they're
+    installed in and how they're slimmed. It names the archive in the build directory and the shared cache.
 
     :param requirements_information: The content of the requirements.txt
     :type requirements_information: str
-    :param output_directory_path: The directory to build the requirements and store the result in.
-    :type output_directory_path: str
     :param prefix_in_zip: Optional prefix in the zip file, defaults to None
     :type prefix_in_zip: str, optional
-    :return: Path to the finished zip archive.
+    :return: The key.
     :rtype: str
     """
 
     # Add the prefix to the hash so we distinguish between layers and regular packages
     prefix_seed = prefix_in_zip or ""
-    directory_name = util.hash_string(requirements_information + prefix_seed)
+    environment_seed = util.get_environment_tag(targets.get_target_tag()) + slimming.get_profile().key \
+        + compression.get_policy().name + _get_installer()
+    return util.hash_string(requirements_information + prefix_seed + environment_seed)
 
-    build_directory = os.path.join(output_directory_path, directory_name)
+def _build_zipped_dependencies(requirements_information: str, output_directory_path: str,
+                               build_directory: str, path_to_zip: str, prefix_in_zip: str = None,
+                               workers: int = None, size_budget: budget.SizeBudget = None) -> None:
 
-    # Check if directory exists
+    # Check if directory exists, we hold the lock of this build so it can't
+    # belong to a build that is still in progress.
     if os.path.exists(build_directory):
         LOGGER.warning("Build-directory '%s' already exists, probably from a failed" \
                        "build - deleting it!", build_directory)
@@ -108,25 +471,88 @@ def create_zipped_dependencies(requirements_information: str,
     with open(requirements_path, "w") as handle:
         handle.write(requirements_information)
 
-    # Install the dependencies to the target directory
-    install_dependencies(
-        path_to_requirements=requirements_path,
-        path_to_target_directory=install_directory
-    )
-
-    output_file_name = build_directory if build_directory[-1] != "/" else build_directory[:-1]
-    # Zip the temporary directory
-    shutil.make_archive(output_file_name, "zip", build_directory)
+    distributions = resolve_distributions(requirements_path)
+
+    if distributions is None:
+        # Install the dependencies to the target directory
+        install_dependencies(
+            path_to_requirements=requirements_path,
+            path_to_target_directory=install_directory
+        )
+        slimming.slim_directory(install_directory, slimming.get_profile())
+
+        # Zip the temporary directory
+        archive.zip_directory(build_directory, path_to_zip, workers=workers, size_budget=size_budget)
+    else:
+        # Assemble the zip from the archives of the individual distributions,
+        # only the ones we haven't seen before need to be installed.
+        distribution_zips = _install_distributions(
+            distributions, requirements_information, output_directory_path, workers
+        )
+
+        with archive.ZipWriter.create(path_to_zip, size_budget) as writer:
+            # This adds the requirements.txt
+            archive.write_sources(writer, util.walk_directory(build_directory), workers)
+            for distribution_zip in distribution_zips:
+                archive.copy_entries(writer, distribution_zip, prefix=prefix_in_zip)
 
     # Delete the build directory
     shutil.rmtree(build_directory)
 
-    return f"{output_file_name}.zip"
+def create_zipped_dependencies(requirements_information: str,
+                               output_directory_path: str,
+                               prefix_in_zip: str = None,
+                               workers: int = None,
+                               size_budget: budget.SizeBudget = None) -> str:
+    """
+    This function creates a zip archive that holds the python dependencies
+    passed to this function via the requirements_information argument. The
+    output will be stored in output_directory_path with a unique name and
+    returned. If prefix_in_zip is set, requirements will be installed in a
+    subdirectory of the zip (useful for Lambda layers which require a
+    python prefix). Each resolved distribution is installed and cached on
+    its own, if pip can't resolve them upfront everything is installed at once.
 
 
+    :param requirements_information: The content of the requirements.txt
+    :type requirements_information: str
+    :param output_directory_path: The directory to build the requirements and store the result in.
+    :type output_directory_path: str
+    :param prefix_in_zip: Optional prefix in the zip file, defaults to None
+    :type prefix_in_zip: str, optional
+    :param workers: Number of threads that compress the archive, defaults to None which means one per CPU.
+    :type workers: int, optional
+    :param size_budget: Budget the archive has to fit into while it's built, defaults to None which means no budget.
+    :type size_budget: budget.SizeBudget, optional
+    :raises budget.BudgetExceededError: If the archive grows beyond the budget.
+    :return: Path to the finished zip archive.
+    :rtype: str
+    """
+
+    directory_name = get_dependencies_key(requirements_information, prefix_in_zip)
+
+    build_directory = os.path.join(output_directory_path, directory_name)
+    output_file_name = build_directory if build_directory[-1] != "/" else build_directory[:-1]
+
+    def build(temporary_path: str) -> None:
+        _build_zipped_dependencies(
+            requirements_information=requirements_information,
+            output_directory_path=output_directory_path,
+            build_directory=build_directory,
+            path_to_zip=temporary_path,
+            prefix_in_zip=prefix_in_zip,
+            workers=workers,
+            size_budget=size_budget
+        )
+
+    # Concurrent builds of the same dependencies wait for the first one to finish
+    return cache.build_once(f"{output_file_name}.zip", build, shared_key=directory_name)
+
 def create_or_return_zipped_dependencies(requirements_information: str,
                                          output_directory_path: str,
-                                         prefix_in_zip: str = None) -> str:
+                                         prefix_in_zip: str = None,
+                                         workers: int = None,
+                                         size_budget: budget.SizeBudget = None) -> str:
     """
     This function creates or returns a zip archive that holds the python
     dependencies passed to this function via the requirements_information
@@ -143,36 +569,52 @@ def create_or_return_zipped_dependencies(requirements_information: str,
     :type output_directory_path: str
     :param prefix_in_zip: Optional prefix in the zip file, defaults to None
     :type prefix_in_zip: str, optional
+    :param workers: Number of threads that compress the archive, defaults to None which means one per CPU.
+    :type workers: int, optional
+    :param size_budget: Budget the archive has to fit into while it's built, defaults to None which means no budget.
+    :type size_budget: budget.SizeBudget, optional
+    :raises budget.BudgetExceededError: If the archive grows beyond the budget.
     :return: Path to the finished zip archive.
     :rtype: str
     """
 
-    prefix_seed = prefix_in_zip or ""
-    artifact_name = util.hash_string(requirements_information + prefix_seed)
+    artifact_name = get_dependencies_key(requirements_information, prefix_in_zip)
 
     artifact_path = os.path.join(output_directory_path, f"{artifact_name}.zip")
-    if os.path.exists(artifact_path):
+    if cache.is_valid_artifact(artifact_path):
         LOGGER.debug("Using cached dependencies from %s", artifact_path)
+        # Keeps the dependencies, which are used the most, from being evicted first
+        cache.record_access(artifact_path, hit=True)
         return artifact_path
 
     return create_zipped_dependencies(
         requirements_information=requirements_information,
         output_directory_path=output_directory_path,
-        prefix_in_zip=prefix_in_zip
+        prefix_in_zip=prefix_in_zip,
+        workers=workers,
+        size_budget=size_budget
     )
 
 def build_lambda_package_without_dependencies(
         code_directories: typing.List[str],
-        exclude_patterns: typing.List[str] = None) -> str:
+        exclude_patterns: typing.List[str] = None,
+        workers: int = None,
+        size_budget: budget.SizeBudget = None) -> str:
     """
     This function builds a deployment package for lambda without dependencies.
     It bundles the code from the code_directories while excluding all files/
-    directories from the exclude_patterns list.
+    directories from the exclude_patterns list. The archive is named after a
+    fingerprint of its content, so unchanged code is only zipped once.
 
     :param code_directories: List of paths to directories to include in the zip.
     :type code_directories: typing.List[str]
     :param exclude_patterns: List of patterns that should be excluded from the zip, defaults to None
     :type exclude_patterns: typing.List[str], optional
+    :param workers: Number of threads that compress the archive, defaults to None which means one per CPU.
+    :type workers: int, optional
+    :param size_budget: Budget the archive has to fit into while it's built, defaults to None which means no budget.
+    :type size_budget: budget.SizeBudget, optional
+    :raises budget.BudgetExceededError: If the archive grows beyond the budget.
     :return: Path to the zipped artifact.
     :rtype: str
     """
@@ -180,38 +622,42 @@ def build_lambda_package_without_dependencies(
     # Build the exclude patterns
     exclude_patterns = exclude_patterns or []
     exclude_patterns = exclude_patterns + util.DEFAULT_EXCLUDE_LIST
-    ignore_during_copy = shutil.ignore_patterns(*exclude_patterns)
-
-    # Create a working directory, copy all source directories there with the exclude list
-    with tempfile.TemporaryDirectory() as working_directory:
-
-        for directory in code_directories:
 
-            # Get the name of the directory -> "path/to/directory" would return "directory"
-            source_directory_name = os.path.basename(directory)
-
-            # This is the directory that will ultimately be zipped
-            target_directory = os.path.join(working_directory, source_directory_name)
-
-            # Copy the source directory to the working directory
-            shutil.copytree(directory, target_directory, ignore=ignore_during_copy)
-
-        target_zip_name = util.hash_string("".join(code_directories))
-        zip_path = os.path.join(util.get_build_dir(), target_zip_name)
-
-        # Zip the directory after removing a potential .zip suffix
-        shutil.make_archive(zip_path, "zip", working_directory)
-        return zip_path + ".zip"
+    # The name of the zip is derived from the content that goes into it,
+    # if nothing changed since the last build we can return that zip.
+    hashed_entries = [
+        hashed_entry for directory in code_directories
+        for hashed_entry in cache.hash_sources(directory, exclude_patterns)
+    ]
+    # Archives compressed with another policy have the same content but different bytes
+    target_zip_name = util.hash_string(cache.fingerprint_entries(hashed_entries) + compression.get_policy().name)
+    zip_path = os.path.join(util.get_build_dir(), target_zip_name + ".zip")
+
+    def build(temporary_path: str) -> None:
+        # Write the entries we found while fingerprinting straight into the zip
+        with archive.ZipWriter.create(temporary_path, size_budget) as writer:
+            archive.write_hashed_sources(
+                writer=writer,
+                hashed_entries=hashed_entries,
+                workers=workers
+            )
+
+    return cache.build_once(zip_path, build)
 
 def build_lambda_package_with_dependencies(
         code_directories: typing.List[str],
         requirement_files: typing.List[str],
-        exclude_patterns: typing.List[str] = None) -> str:
+        exclude_patterns: typing.List[str] = None,
+        workers: int = None,
+        handler_modules: typing.List[str] = None,
+        dynamic_imports: typing.List[str] = None,
+        size_budget: budget.SizeBudget = None) -> str:
     """
     This function bundles the code of one or more code_directories stripped
     from all files/directories that match the exclude_patterns together with
     the dependencies in requirement_files and returns a zip archive for deployment
-    in AWS lambda.
+    in AWS lambda. If handler_modules are set, only the modules of the dependencies
+    they can import are included.
 
     :param code_directories: List of paths to the directories that hold the code.
     :type code_directories: typing.List[str]
@@ -219,6 +665,15 @@ def build_lambda_package_with_dependencies(
     :type requirement_files: typing.List[str]
     :param exclude_patterns: List of patterns to exclude from code_directories, defaults to None
     :type exclude_patterns: typing.List[str], optional
+    :param workers: Number of threads that compress the archive, defaults to None which means one per CPU.
+    :type workers: int, optional
+    :param handler_modules: Names of the modules with the handlers like lambda.handler, defaults to None
+    :type handler_modules: typing.List[str], optional
+    :param dynamic_imports: Modules the handlers import dynamically, names or glob patterns, defaults to None
+    :type dynamic_imports: typing.List[str], optional
+    :param size_budget: Budget the archive has to fit into while it's built, defaults to None which means no budget.
+    :type size_budget: budget.SizeBudget, optional
+    :raises budget.BudgetExceededError: If the archive grows beyond the budget.
     :return: Path to the zipped artifacts.
     :rtype: str
     """
@@ -230,6 +685,9 @@ def build_lambda_package_with_dependencies(
     requirements_zip = create_or_return_zipped_dependencies(
         requirements_information=collected_dependencies,
         output_directory_path=util.get_build_dir(),
+        workers=workers,
+        # Tree shaking may remove most of the dependencies, so only the package has to fit
+        size_budget=None if handler_modules else size_budget
     )
 
     # Hash the requirement files and code directories in order to get
@@ -238,15 +696,80 @@ def build_lambda_package_with_dependencies(
         "".join(code_directories) + "".join(requirement_files)) + ".zip"
     zip_path = os.path.join(util.get_build_dir(), target_zip_name)
 
-    shutil.copyfile(
-        src=requirements_zip,
-        dst=zip_path
-    )
+    def build(temporary_path: str) -> None:
+        if handler_modules:
+            with archive.ZipWriter.create(temporary_path, size_budget) as writer:
+                write_lambda_package(
+                    writer=writer,
+                    code_directories=code_directories,
+                    requirements_zip=requirements_zip,
+                    exclude_patterns=exclude_patterns,
+                    handler_modules=handler_modules,
+                    dynamic_imports=dynamic_imports,
+                    workers=workers
+                )
+            return
+
+        with tracing.span("staging_copy", source=requirements_zip):
+            shutil.copyfile(
+                src=requirements_zip,
+                dst=temporary_path
+            )
+
+        archive.extend_zip(
+            path_to_zip=temporary_path,
+            code_directories=code_directories,
+            exclude_patterns=exclude_patterns,
+            workers=workers,
+            size_budget=size_budget
+        )
+
+    # The name doesn't reflect the content of the code, so it's always built
+    return cache.build_once(zip_path, build, reuse_existing=False)
+
+def write_lambda_package(writer: archive.ZipWriter, code_directories: typing.List[str],
+                         requirements_zip: str = None, exclude_patterns: typing.List[str] = None,
+                         handler_modules: typing.List[str] = None, dynamic_imports: typing.List[str] = None,
+                         workers: int = None) -> None:
+    """
+    Writes the dependencies from requirements_zip and the code from code_directories
+    to the writer. If handler_modules are set, only the modules of the dependencies
+    they can import are written.
 
-    util.extend_zip(
-        path_to_zip=zip_path,
-        code_directories=code_directories,
-        exclude_patterns=exclude_patterns
-    )
+    :param writer: The writer of the package.
+    :type writer: archive.ZipWriter
+    :param code_directories: List of paths to the directories that hold the code.
+    :type code_directories: typing.List[str]
+    :param requirements_zip: Path to the archive with the dependencies, defaults to None which means there are none.
+    :type requirements_zip: str, optional
+    :param exclude_patterns: List of patterns to exclude from code_directories, defaults to None
+    :type exclude_patterns: typing.List[str], optional
+    :param handler_modules: Names of the modules with the handlers like lambda.handler, defaults to None
+    :type handler_modules: typing.List[str], optional
+    :param dynamic_imports: Modules the handlers import dynamically, names or glob patterns, defaults to None
+    :type dynamic_imports: typing.List[str], optional
+    :param workers: Number of threads that compress the archive, defaults to None which means one per CPU.
+    :type workers: int, optional
+    :raises budget.BudgetExceededError: If the writer has a budget and the package grows beyond it.
+    :return: Nothing.
+    :rtype: None
+    """
 
-    return zip_path
+    exclude_patterns = (exclude_patterns or []) + util.DEFAULT_EXCLUDE_LIST
+    hashed_entries = [
+        hashed_entry for directory in code_directories
+        for hashed_entry in cache.hash_sources(directory, exclude_patterns)
+    ]
+
+    if requirements_zip is not None:
+        include = None
+        if handler_modules:
+            include = treeshake.shake_dependencies(
+                path_to_zip=requirements_zip,
+                code_entries=[entry for entry, _ in hashed_entries],
+                handler_modules=handler_modules,
+                dynamic_imports=dynamic_imports
+            ).__contains__
+        archive.copy_entries(writer, requirements_zip, include=include)
+
+    archive.write_hashed_sources(writer, hashed_entries, workers)
@@ -0,0 +1,213 @@
+"""
+Contains the planning of layers: which dependencies many functions have in
+common, so they can be factored out into a shared layer and each function
+package only bundles the rest, and how dependencies that are too large for one
+layer are packed into several. BuildSession builds the layers that are planned here.
+"""
+import collections
+import logging
+import os
+import tempfile
+import typing
+
+from packaging.utils import canonicalize_name
+
+import lambda_bundler.budget as budget
+import lambda_bundler.dependencies as dependencies
+
+LOGGER = logging.getLogger("lambda_bundler")
+
+# Share of the functions that has to use a distribution for it to be moved to the shared layer
+DEFAULT_MIN_SHARE = 0.5
+
+# Number of layers Lambda allows per function
+MAX_LAYERS = 5
+
+class LayerGroup(typing.NamedTuple):
+    """Distributions that are packed into a layer together and their installed sizes."""
+    distributions: typing.List[dependencies.Distribution]
+    compressed_bytes: int
+    uncompressed_bytes: int
+
+def resolve_requirements(requirements_information: str) -> typing.Optional[typing.List[dependencies.Distribution]]:
+    """
+    Resolves the distributions of merged requirements, see dependencies.resolve_distributions.
+
+    :param requirements_information: The content of the requirements.txt
+    :type requirements_information: str
+    :return: The distributions sorted by name or None if pip can't resolve them without installing.
+    :rtype: typing.Optional[typing.List[dependencies.Distribution]]
+    """
+
+    with tempfile.TemporaryDirectory() as directory:
+        requirements_path = os.path.join(directory, "requirements.txt")
+        with open(requirements_path, "w") as handle:
+            handle.write(requirements_information)
+        return dependencies.resolve_distributions(requirements_path)
+
+def choose_shared_distributions(distribution_sets: typing.List[typing.List[dependencies.Distribution]],
+                                min_share: float = DEFAULT_MIN_SHARE) -> typing.List[dependencies.Distribution]:
+    """
+    Chooses the distributions that at least min_share of the sets and at least two
+    of them contain. Distributions are only shared if the versions are the same.
+
+    :param distribution_sets: The resolved distributions of each function.
+    :type distribution_sets: typing.List[typing.List[dependencies.Distribution]]
+    :param min_share: Share of the sets that has to contain a distribution, defaults to DEFAULT_MIN_SHARE
+    :type min_share: float, optional
+    :return: The shared distributions sorted by name.
+    :rtype: typing.List[dependencies.Distribution]
+    """
+
+    counts = collections.Counter(
+        distribution for distributions in distribution_sets for distribution in set(distributions)
+    )
+    min_count = max(2, min_share * len(distribution_sets))
+    shared = [distribution for distribution, count in counts.items() if count >= min_count]
+    return sorted(shared, key=lambda distribution: distribution.name.lower())
+
+def get_closures(distributions: typing.List[dependencies.Distribution]) -> typing.List[typing.List[dependencies.Distribution]]:
+    """
+    Splits the distributions into groups that depend on each other, directly or
+    transitively. Distributions in different groups don't depend on each other.
+
+    :param distributions: The resolved distributions.
+    :type distributions: typing.List[dependencies.Distribution]
+    :return: The groups sorted by the name of their first distribution, each sorted by name.
+    :rtype: typing.List[typing.List[dependencies.Distribution]]
+    """
+
+    by_name = {canonicalize_name(distribution.name): distribution for distribution in distributions}
+    parents = {name: name for name in by_name}
+
+    def find(name: str) -> str:
+        while parents[name] != name:
+            parents[name] = parents[parents[name]]
+            name = parents[name]
+        return name
+
+    for name, distribution in by_name.items():
+        for required_name in distribution.requires:
+            if required_name in by_name:
+                parents[find(required_name)] = find(name)
+
+    closures = collections.defaultdict(list)
+    for name in sorted(by_name):
+        closures[find(name)].append(by_name[name])
+    return sorted(closures.values(), key=lambda closure: closure[0].name.lower())
+
+def _fits(group: LayerGroup, size_budget: budget.SizeBudget) -> bool:
+    max_compressed_bytes, max_uncompressed_bytes = size_budget
+    return (max_compressed_bytes is None or group.compressed_bytes <= max_compressed_bytes) \
+        and (max_uncompressed_bytes is None or group.uncompressed_bytes <= max_uncompressed_bytes)
+
+def _first_fit(items: typing.List[LayerGroup], size_budget: budget.SizeBudget) -> typing.List[LayerGroup]:
+    bins = []
+    for item in items:
+        for index, existing in enumerate(bins):
+            candidate = LayerGroup(
+                existing.distributions + item.distributions,
+                existing.compressed_bytes + item.compressed_bytes,
+                existing.uncompressed_bytes + item.uncompressed_bytes
+            )
+            if _fits(candidate, size_budget):
+                bins[index] = candidate
+                break
+        else:
+            bins.append(item)
+    return bins
+
+def get_layer_budget(size_budget: budget.SizeBudget = None) -> budget.SizeBudget:
+    """
+    Returns the budget of each layer when dependencies are packed into several.
+    Without a compressed limit everything fits into the first layer, so each layer
+    is limited to the zipped size Lambda accepts for direct uploads unless
+    size_budget has a compressed limit of its own.
+
+    :param size_budget: Budget the layers have to fit into, defaults to None which means budget.get_budget.
+    :type size_budget: budget.SizeBudget, optional
+    :return: size_budget with a compressed limit.
+    :rtype: budget.SizeBudget
+    """
+
+    size_budget = size_budget or budget.get_budget()
+    if size_budget.max_compressed_bytes is None:
+        return size_budget._replace(max_compressed_bytes=budget.LAMBDA_MAX_ZIPPED_BYTES)
+    return size_budget
+
+def pack_layers(sizes: typing.Dict[dependencies.Distribution, typing.Tuple[int, int]],
+                max_layers: int = MAX_LAYERS,
+                size_budget: budget.SizeBudget = None) -> typing.List[LayerGroup]:
+    """
+    Packs distributions into as few layers as the budget allows. Lambda limits the
+    uncompressed size of a function and all its layers together, so the uncompressed
+    limit applies to all layers and the compressed limit to each layer. Distributions
+    that depend on each other stay in the same layer unless their closure alone exceeds
+    the budget. They're packed in the order of their names first, so adding or
+    removing a distribution leaves the other layers alone as far as possible, and
+    only sorted by size if that doesn't fit into max_layers.
+
+    :param sizes: The compressed and uncompressed size of each distribution.
+    :type sizes: typing.Dict[dependencies.Distribution, typing.Tuple[int, int]]
+    :param max_layers: Maximum number of layers, defaults to MAX_LAYERS
+    :type max_layers: int, optional
+    :param size_budget: Budget the layers have to fit into, defaults to None which means budget.get_budget.
+                        Each layer is limited to budget.LAMBDA_MAX_ZIPPED_BYTES if it has no
+                        compressed limit (see get_layer_budget).
+    :type size_budget: budget.SizeBudget, optional
+    :raises budget.BudgetExceededError: If the layers together exceed the uncompressed limit, a distribution
+                                        alone exceeds the budget or max_layers aren't enough.
+    :return: The groups of distributions, each sorted by name.
+    :rtype: typing.List[LayerGroup]
+    """
+
+    size_budget = get_layer_budget(size_budget)
+
+    def to_group(distributions: typing.List[dependencies.Distribution]) -> LayerGroup:
+        return LayerGroup(
+            distributions,
+            sum(sizes[distribution][0] for distribution in distributions),
+            sum(sizes[distribution][1] for distribution in distributions)
+        )
+
+    total = to_group(list(sizes))
+    if size_budget.max_uncompressed_bytes is not None and total.uncompressed_bytes > size_budget.max_uncompressed_bytes:
+        # Splitting them doesn't help, the function has to fit in as well
+        raise budget.BudgetExceededError(
+            f"The dependencies have {total.uncompressed_bytes} uncompressed bytes, a function and all its layers "
+            f"may only have {size_budget.max_uncompressed_bytes}",
+            total.compressed_bytes, total.uncompressed_bytes, size_budget
+        )
+
+    items = []
+    for closure in get_closures(list(sizes)):
+        group = to_group(closure)
+        if _fits(group, size_budget):
+            items.append(group)
+            continue
+
+        LOGGER.debug("Splitting the dependencies of %s, they don't fit into one layer", closure[0].name)
+        for distribution in closure:
+            single = to_group([distribution])
+            if not _fits(single, size_budget):
+                raise budget.BudgetExceededError(
+                    f"{distribution.name} alone exceeds the budget of a layer with {single.compressed_bytes} "
+                    f"compressed and {single.uncompressed_bytes} uncompressed bytes",
+                    single.compressed_bytes, single.uncompressed_bytes, size_budget
+                )
+            items.append(single)
+
+    bins = _first_fit(items, size_budget)
+    if len(bins) > max_layers:
+        bins = _first_fit(sorted(items, key=lambda item: -item.uncompressed_bytes), size_budget)
+
+    if len(bins) > max_layers:
+        raise budget.BudgetExceededError(
+            f"The dependencies need {len(bins)} layers, only {max_layers} are allowed",
+            total.compressed_bytes, total.uncompressed_bytes, size_budget
+        )
+
+    return [
+        layer._replace(distributions=sorted(layer.distributions, key=lambda distribution: distribution.name.lower()))
+        for layer in bins
+    ]
@@ -0,0 +1,215 @@
+"""
+Contains functions to parse requirement files into a canonical form, so
+requirements that mean the same thing result in the same cache key.
+"""
+import collections
+import logging
+import os
+import re
+import typing
+
+from packaging.markers import InvalidMarker
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.specifiers import InvalidSpecifier
+from packaging.utils import canonicalize_name
+
+import lambda_bundler.util as util
+
+LOGGER = logging.getLogger("lambda_bundler")
+
+# pip treats everything after a # that starts the line or follows a whitespace as a comment
+_COMMENT_PATTERN = re.compile(r"(^|\s+)#.*$")
+
+# An option and its value, separated by whitespace, an equals sign or nothing for short options
+_OPTION_PATTERN = re.compile(r"^(--[\w-]+|-\w)\s*=?\s*(.*)$")
+
+_REQUIREMENT_OPTIONS = {"-r", "--requirement"}
+_CONSTRAINT_OPTIONS = {"-c", "--constraint"}
+_EDITABLE_OPTIONS = {"-e", "--editable"}
+
+# Short options and their long form, so both spellings end up the same
+_OPTION_ALIASES = {"-i": "--index-url", "-f": "--find-links"}
+
+class ParsedRequirements(typing.NamedTuple):
+    """The content of one or more requirement files split into its parts."""
+    options: typing.List[str]
+    constraints: typing.List[str]
+    requirements: typing.List[str]
+
+def _get_logical_lines(content: str) -> typing.Iterator[str]:
+
+    buffer = ""
+    for line in content.split("\n"):
+        line = _COMMENT_PATTERN.sub("", line).strip()
+        if line.endswith("\\"):
+            buffer += line[:-1] + " "
+            continue
+
+        line = (buffer + line).strip()
+        buffer = ""
+        if line:
+            yield line
+
+    if buffer.strip():
+        yield buffer.strip()
+
+def _split_option(line: str) -> typing.Tuple[str, str]:
+    match = _OPTION_PATTERN.match(line)
+    if match is None:
+        return line, ""
+    return match.group(1), match.group(2).strip()
+
+def _resolve_path(value: str, base_directory: str) -> str:
+    if "://" in value:
+        return value
+    return os.path.normpath(os.path.join(base_directory, os.path.expanduser(value)))
+
+def _normalize_option(line: str) -> str:
+    option, value = _split_option(line)
+    option = _OPTION_ALIASES.get(option, option)
+    return f"{option} {value}" if value else option
+
+def normalize_requirement(line: str) -> str:
+    """
+    Returns the canonical form of a PEP 508 requirement, names are normalized,
+    extras and version specifiers are sorted and whitespace is removed. Lines
+    that aren't PEP 508 requirements, e.g. paths, are returned as they are.
+
+    :param line: The requirement.
+    :type line: str
+    :return: The canonical form of the requirement.
+    :rtype: str
+    """
+
+    # Hashes and other per-requirement options follow the requirement
+    requirement_part, *per_requirement_options = re.split(r"\s+(?=--)", line)
+
+    try:
+        requirement = Requirement(requirement_part)
+    except (InvalidRequirement, InvalidMarker, InvalidSpecifier):
+        return line
+
+    return _format_requirement(
+        name=requirement.name,
+        extras=requirement.extras,
+        specifier=str(requirement.specifier),
+        url=requirement.url,
+        marker=requirement.marker,
+        options=per_requirement_options
+    )
+
+def _format_requirement(name: str, extras: typing.Iterable[str], specifier: str,
+                        url: typing.Optional[str], marker: typing.Any, options: typing.Iterable[str]) -> str:
+
+    formatted = canonicalize_name(name)
+    if extras:
+        formatted += "[" + ",".join(sorted({canonicalize_name(extra) for extra in extras})) + "]"
+    if url:
+        formatted += f" @ {url}"
+    else:
+        formatted += specifier
+    if marker:
+        formatted += (" " if url else "") + f"; {marker}"
+    for option in sorted({_normalize_option(option) for option in options}):
+        formatted += f" {option}"
+    return formatted
+
+def parse_requirements(content: str, base_directory: str = None,
+                       _visited: typing.Set[str] = None) -> ParsedRequirements:
+    """
+    Parses the content of a requirement file. Requirement files it includes with
+    -r are parsed recursively, constraint files are referenced by their absolute path.
+
+    :param content: The content of the requirement file.
+    :type content: str
+    :param base_directory: The directory relative paths refer to, defaults to None which means the working directory.
+    :type base_directory: str, optional
+    :return: The options, constraints and requirements in canonical form.
+    :rtype: ParsedRequirements
+    """
+
+    base_directory = base_directory or os.getcwd()
+    visited = _visited if _visited is not None else set()
+    parsed = ParsedRequirements([], [], [])
+
+    for line in _get_logical_lines(content):
+
+        if not line.startswith("-"):
+            parsed.requirements.append(normalize_requirement(line))
+            continue
+
+        option, value = _split_option(line)
+
+        if option in _REQUIREMENT_OPTIONS:
+            path = _resolve_path(value, base_directory)
+            if path in visited:
+                LOGGER.debug("Skipping '%s', it has already been included", path)
+                continue
+            visited.add(path)
+
+            included = parse_requirements(util.read_file(path), os.path.dirname(path), visited)
+            for target, source in zip(parsed, included):
+                target.extend(source)
+
+        elif option in _CONSTRAINT_OPTIONS:
+            # The constraints aren't part of the requirements, but the key has to change with them
+            path = _resolve_path(value, base_directory)
+            constraints = parse_requirements(util.read_file(path), os.path.dirname(path))
+            digest = util.hash_string("\n".join(merge_parsed_requirements(constraints)))
+            parsed.constraints.append(f"-c {path}  # {digest}")
+
+        elif option in _EDITABLE_OPTIONS:
+            parsed.requirements.append(f"-e {_resolve_path(value, base_directory)}")
+
+        else:
+            parsed.options.append(_normalize_option(line))
+
+    return parsed
+
+def _merge_requirements(requirements: typing.Iterable[str]) -> typing.List[str]:
+
+    # Requirements for the same distribution are combined into one
+    grouped = collections.OrderedDict()
+    others = set()
+
+    for line in requirements:
+        requirement_part, *options = re.split(r"\s+(?=--)", line)
+        try:
+            requirement = Requirement(requirement_part)
+        except (InvalidRequirement, InvalidMarker, InvalidSpecifier):
+            others.add(line)
+            continue
+
+        key = (canonicalize_name(requirement.name), requirement.url, str(requirement.marker or ""))
+        if key not in grouped:
+            grouped[key] = (requirement, set(), set())
+
+        first, extras, merged_options = grouped[key]
+        first.specifier &= requirement.specifier
+        extras.update(requirement.extras)
+        merged_options.update(options)
+
+    merged = {
+        _format_requirement(first.name, extras, str(first.specifier), first.url, first.marker, options)
+        for first, extras, options in grouped.values()
+    }
+
+    return sorted(merged | others, key=lambda line: (line.lower(), line))
+
+def merge_parsed_requirements(*parsed_requirements: ParsedRequirements) -> typing.List[str]:
+    """
+    Merges parsed requirements into the lines of a single requirement file.
+    Options come first, followed by constraints and the requirements sorted
+    by name. Duplicates are removed.
+
+    :return: The lines of the merged requirement file.
+    :rtype: typing.List[str]
+    """
+
+    options = sorted({option for parsed in parsed_requirements for option in parsed.options})
+    constraints = sorted({constraint for parsed in parsed_requirements for constraint in parsed.constraints})
+    requirements = _merge_requirements(
+        requirement for parsed in parsed_requirements for requirement in parsed.requirements
+    )
+
+    return options + constraints + requirements
@@ -0,0 +1,210 @@
+"""
+Contains the slimming stage that removes files from installed dependencies
+that aren't needed at runtime before they are zipped.
+"""
+import fnmatch
+import logging
+import os
+import shutil
+import subprocess
+import typing
+
+import lambda_bundler.tracing as tracing
+import lambda_bundler.util as util
+
+LOGGER = logging.getLogger("lambda_bundler")
+
+SLIMMING_PROFILE_ENV = "LAMBDA_BUNDLER_SLIMMING_PROFILE"
+SLIMMING_EXCLUDE_ENV = "LAMBDA_BUNDLER_SLIMMING_EXCLUDE"
+
+# Native extensions that can be stripped of their debug information
+_BINARY_PATTERNS = ["*.so", "*.so.*"]
+
+class SlimmingProfile(typing.NamedTuple):
+    """Describes which files are removed from installed dependencies."""
+    name: str
+    exclude_patterns: typing.Tuple[str, ...]
+    strip_binaries: bool
+
+    @property
+    def key(self) -> str:
+        """Identifies the profile in cache keys, archives slimmed differently are different."""
+        return repr(tuple(self))
+
+class SlimmingReport(typing.NamedTuple):
+    """What the slimming stage removed from a directory."""
+    files_removed: int
+    bytes_removed: int
+    bytes_stripped: int
+
+NONE = SlimmingProfile("none", (), False)
+
+# Files the interpreter never reads, the bytecode has been compiled for the build host
+SAFE = SlimmingProfile(
+    name="safe",
+    exclude_patterns=(
+        "__pycache__",
+        "*.pyc",
+        "*.pyo",
+        "*.dist-info/RECORD",
+        "*.dist-info/INSTALLER",
+        "*.dist-info/REQUESTED",
+        "*.dist-info/direct_url.json",
+    ),
+    strip_binaries=False
+)
+
+# Tests, documentation, type stubs and sources of extensions, some packages may import these
+AGGRESSIVE = SlimmingProfile(
+    name="aggressive",
+    exclude_patterns=SAFE.exclude_patterns + (
+        "tests",
+        "test",
+        "docs",
+        "doc",
+        "examples",
+        "*.pyi",
+        "py.typed",
+        "*.pyx",
+        "*.pxd",
+        "*.c",
+        "*.cpp",
+        "*.h",
+    ),
+    strip_binaries=True
+)
+
+PROFILES = {profile.name: profile for profile in [NONE, SAFE, AGGRESSIVE]}
+
+def get_profile() -> SlimmingProfile:
+    """
+    Returns the slimming profile from the LAMBDA_BUNDLER_SLIMMING_PROFILE environment
+    variable, which is one of none, safe and aggressive. Additional comma separated
+    patterns can be set in LAMBDA_BUNDLER_SLIMMING_EXCLUDE.
+
+    :raises ValueError: If the profile doesn't exist.
+    :return: The profile, defaults to none which doesn't remove anything.
+    :rtype: SlimmingProfile
+    """
+
+    name = util.get_setting(SLIMMING_PROFILE_ENV, NONE.name).strip().lower()
+    if name not in PROFILES:
+        raise ValueError(f"Unknown slimming profile '{name}', choose one of {', '.join(PROFILES)}")
+
+    profile = PROFILES[name]
+    additional_patterns = tuple(
+        pattern.strip() for pattern in util.get_setting(SLIMMING_EXCLUDE_ENV, "").split(",") if pattern.strip()
+    )
+    if additional_patterns:
+        profile = profile._replace(exclude_patterns=profile.exclude_patterns + additional_patterns)
+
+    return profile
+
+def _matches(relative_path: str, patterns: typing.Iterable[str]) -> bool:
+    name = os.path.basename(relative_path)
+    return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relative_path, pattern) for pattern in patterns)
+
+def is_excluded(relative_path: str, profile: SlimmingProfile) -> bool:
+    """
+    Checks if the profile removes a file of an installed distribution, which is the
+    case if the file or one of the directories it's in matches a pattern.
+
+    :param relative_path: Path of the file relative to the install directory, separated by slashes.
+    :type relative_path: str
+    :param profile: The slimming profile.
+    :type profile: SlimmingProfile
+    :return: True if the file is removed.
+    :rtype: bool
+    """
+
+    parts = relative_path.rstrip("/").split("/")
+    return any(
+        _matches("/".join(parts[:index]), profile.exclude_patterns) for index in range(1, len(parts) + 1)
+    )
+
+def _get_size(path: str) -> typing.Tuple[int, int]:
+    if not os.path.isdir(path):
+        return 1, os.path.getsize(path)
+
+    entries = [entry for entry in util.walk_directory(path) if not entry.is_directory]
+    return len(entries), sum(entry.stat.st_size for entry in entries)
+
+def _strip_binary(path: str, strip_command: str) -> int:
+
+    size = os.path.getsize(path)
+    try:
+        subprocess.check_output([strip_command, "--strip-debug", path], stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError as error:
+        # Not every file that's named like a library is one strip understands
+        LOGGER.debug("Unable to strip '%s': %s", path, error.output)
+        return 0
+
+    return size - os.path.getsize(path)
+
+def slim_directory(directory: str, profile: SlimmingProfile) -> SlimmingReport:
+    """
+    Removes the files that match the patterns of profile from directory and strips
+    the debug information from native extensions if the profile says so.
+
+    :param directory: The directory with the installed dependencies.
+    :type directory: str
+    :param profile: The slimming profile.
+    :type profile: SlimmingProfile
+    :return: Report of what has been removed.
+    :rtype: SlimmingReport
+    """
+
+    if not profile.exclude_patterns and not profile.strip_binaries:
+        return SlimmingReport(0, 0, 0)
+
+    with tracing.span("slim", directory=directory, profile=profile.name) as attributes:
+        report = _slim_directory(directory, profile)
+        attributes.update(report._asdict())
+
+    log_report(directory, profile, report)
+    return report
+
+def _slim_directory(directory: str, profile: SlimmingProfile) -> SlimmingReport:
+
+    files_removed, bytes_removed, bytes_stripped = 0, 0, 0
+    strip_command = shutil.which("strip") if profile.strip_binaries else None
+
+    for root, directory_names, file_names in os.walk(directory):
+        relative_root = os.path.relpath(root, directory).replace(os.sep, "/")
+
+        for name in sorted(directory_names + file_names):
+            path = os.path.join(root, name)
+            relative_path = name if relative_root == "." else f"{relative_root}/{name}"
+
+            if _matches(relative_path, profile.exclude_patterns):
+                file_count, size = _get_size(path)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                    # Don't descend into the directory we just removed
+                    directory_names.remove(name)
+                else:
+                    os.remove(path)
+                files_removed += file_count
+                bytes_removed += size
+
+            elif strip_command is not None and name in file_names and _matches(name, _BINARY_PATTERNS):
+                bytes_stripped += _strip_binary(path, strip_command)
+
+    return SlimmingReport(files_removed, bytes_removed, bytes_stripped)
+
+def log_report(path: str, profile: SlimmingProfile, report: SlimmingReport) -> None:
+    """
+    Logs what slimming the directory or archive at path with profile removed.
+
+    :param path: Path to the slimmed directory or archive.
+    :type path: str
+    :param profile: The slimming profile.
+    :type profile: SlimmingProfile
+    :param report: Report of what has been removed.
+    :type report: SlimmingReport
+    """
+
+    LOGGER.info(
+        "Slimming '%s' with the %s profile removed %s files with %s bytes and stripped %s bytes from binaries",
+        path, profile.name, report.files_removed, report.bytes_removed, report.bytes_stripped
+    )
@@ -0,0 +1,181 @@
+"""
+Contains the target dependencies are installed for. Without a target they're
+installed for the interpreter and platform that run the build. With one, pip
+only picks wheels that have been built for the target, e.g. the Lambda runtime
+on arm64, so the build doesn't have to run in a container that matches it.
+"""
+import logging
+import re
+import sys
+import sysconfig
+import typing
+
+import lambda_bundler.util as util
+
+LOGGER = logging.getLogger("lambda_bundler")
+
+TARGET_PLATFORMS_ENV = "LAMBDA_BUNDLER_TARGET_PLATFORMS"
+TARGET_PYTHON_VERSION_ENV = "LAMBDA_BUNDLER_TARGET_PYTHON_VERSION"
+TARGET_IMPLEMENTATION_ENV = "LAMBDA_BUNDLER_TARGET_IMPLEMENTATION"
+TARGET_ABIS_ENV = "LAMBDA_BUNDLER_TARGET_ABIS"
+
+# CPython, which is what Lambda runs
+DEFAULT_IMPLEMENTATION = "cp"
+
+# Versions like pip understands them, e.g. 3, 3.12 or 312
+_PYTHON_VERSION_PATTERN = re.compile(r"^\d+(\.\d+)?$")
+
+# Tags like manylinux2014_x86_64 or cp312, dots separate compressed tag sets
+_TAG_PATTERN = re.compile(r"^\w+$")
+
+# The line pip ends with when no distribution matches a requirement
+_NO_MATCH_PATTERN = re.compile(r"No matching distribution found for (\S+)")
+
+class Target(typing.NamedTuple):
+    """The interpreter and platform dependencies are installed for."""
+    python_version: typing.Optional[str]
+    implementation: str
+    abis: typing.Tuple[str, ...]
+    platforms: typing.Tuple[str, ...]
+
+    @property
+    def tag(self) -> str:
+        """
+        Identifies the target in cache keys. pip installs for the version and platform of
+        the interpreter that runs the build if they aren't set, so those are used then.
+
+        :return: The tag, e.g. cp3.12-default-manylinux2014_aarch64
+        :rtype: str
+        """
+
+        python_version = self.python_version or f"{sys.version_info.major}.{sys.version_info.minor}"
+        abis = ".".join(self.abis) or "default"
+        platforms = ".".join(self.platforms) or sysconfig.get_platform()
+        return f"{self.implementation}{python_version}-{abis}-{platforms}"
+
+    def get_pip_options(self) -> typing.List[str]:
+        """
+        Returns the options that make pip install wheels for the target. Source
+        distributions can't be built for another platform, so only wheels are allowed.
+
+        :return: The options.
+        :rtype: typing.List[str]
+        """
+
+        options = ["--only-binary=:all:", "--implementation", self.implementation]
+        if self.python_version is not None:
+            options += ["--python-version", self.python_version]
+        for abi in self.abis:
+            options += ["--abi", abi]
+        for platform in self.platforms:
+            options += ["--platform", platform]
+        return options
+
+    def as_settings(self) -> typing.Dict[str, str]:
+        """
+        Returns the target as the values of its environment variables, e.g. for a BuildSession.
+
+        :return: The values by the name of the environment variable.
+        :rtype: typing.Dict[str, str]
+        """
+
+        return {
+            TARGET_PLATFORMS_ENV: ",".join(self.platforms),
+            TARGET_PYTHON_VERSION_ENV: self.python_version or "",
+            TARGET_IMPLEMENTATION_ENV: self.implementation,
+            TARGET_ABIS_ENV: ",".join(self.abis),
+        }
+
+class NoCompatibleWheelError(Exception):
+    """Raised when there is no wheel of a requirement for the target."""
+
+def _split(value: typing.Optional[str]) -> typing.Tuple[str, ...]:
+    return tuple(part.strip() for part in (value or "").split(",") if part.strip())
+
+def create_target(python_version: str = None, platforms: typing.Iterable[str] = None,
+                  implementation: str = None, abis: typing.Iterable[str] = None) -> Target:
+    """
+    Creates a target and checks its values.
+
+    :param python_version: Version of the interpreter like 3.12, defaults to None which means the one of the build.
+    :type python_version: str, optional
+    :param platforms: Platform tags like manylinux2014_x86_64 or manylinux2014_aarch64, defaults to None
+                      which means the platform of the build.
+    :type platforms: typing.Iterable[str], optional
+    :param implementation: Implementation tag like cp, defaults to None which means cp.
+    :type implementation: str, optional
+    :param abis: ABI tags like cp312 or abi3, defaults to None which means the ones pip derives from the version.
+    :type abis: typing.Iterable[str], optional
+    :raises ValueError: If a value isn't a version or tag.
+    :return: The target.
+    :rtype: Target
+    """
+
+    python_version = (python_version or "").strip() or None
+    if python_version is not None and not _PYTHON_VERSION_PATTERN.match(python_version):
+        raise ValueError(f"'{python_version}' is not a python version like 3.12")
+
+    implementation = (implementation or "").strip() or DEFAULT_IMPLEMENTATION
+    platforms = tuple(platforms or ())
+    abis = tuple(abis or ())
+    for tag in (implementation,) + platforms + abis:
+        if not _TAG_PATTERN.match(tag):
+            raise ValueError(f"'{tag}' is not a tag like cp312 or manylinux2014_x86_64")
+
+    return Target(python_version, implementation, abis, platforms)
+
+def get_target() -> typing.Optional[Target]:
+    """
+    Returns the target from the LAMBDA_BUNDLER_TARGET_PLATFORMS, LAMBDA_BUNDLER_TARGET_PYTHON_VERSION,
+    LAMBDA_BUNDLER_TARGET_IMPLEMENTATION and LAMBDA_BUNDLER_TARGET_ABIS environment variables.
+    Platforms and ABIs are separated by commas.
+
+    :raises ValueError: If a value isn't a version or tag.
+    :return: The target or None if none of them is set, dependencies are installed for the build then.
+    :rtype: typing.Optional[Target]
+    """
+
+    values = [
+        util.get_setting(TARGET_PYTHON_VERSION_ENV, ""),
+        util.get_setting(TARGET_PLATFORMS_ENV, ""),
+        util.get_setting(TARGET_IMPLEMENTATION_ENV, ""),
+        util.get_setting(TARGET_ABIS_ENV, ""),
+    ]
+    if not any(value.strip() for value in values):
+        return None
+
+    python_version, platforms, implementation, abis = values
+    return create_target(python_version, _split(platforms), implementation, _split(abis))
+
+def get_target_tag() -> typing.Optional[str]:
+    """
+    Returns the tag of the target, see get_target.
+
+    :return: The tag or None if there is no target.
+    :rtype: typing.Optional[str]
+    """
+
+    target = get_target()
+    return None if target is None else target.tag
+
+def check_pip_output(output: str, target: Target) -> None:
+    """
+    Raises a NoCompatibleWheelError if pip failed because a requirement has no wheel for the target.
+
+    :param output: What pip printed.
+    :type output: str
+    :param target: The target pip installed for.
+    :type target: Target
+    :raises NoCompatibleWheelError: If pip found no distribution of a requirement.
+    """
+
+    match = _NO_MATCH_PATTERN.search(output)
+    if match is None:
+        return
+
+    requirement = match.group(1)
+    raise NoCompatibleWheelError(
+        f"There is no wheel of '{requirement}' for the target {target.tag}. Only wheels can be installed "
+        f"for a target, if it's only published as a source distribution, build its wheel for the target "
+        f"and add it to the wheelhouse at '{util.get_wheelhouse_dir()}'."
+    )
@@ -0,0 +1,222 @@
+"""
+Contains the instrumentation of the build stages. Each stage is a timed span that
+is handed to the registered listeners once it's finished, e.g. the exporter that
+writes Chrome trace events. Without listeners spans cost next to nothing.
+"""
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import typing
+import uuid
+
+import lambda_bundler.util as util
+
+LOGGER = logging.getLogger("lambda_bundler")
+
+TRACE_FILE_ENV = "LAMBDA_BUNDLER_TRACE_FILE"
+
+class Span(typing.NamedTuple):
+    """A finished stage of a build."""
+    name: str
+    start: float
+    duration: float
+    process_id: int
+    thread_id: int
+    attributes: typing.Dict[str, typing.Any]
+
+Listener = typing.Callable[[Span], None]
+
+_LISTENERS: typing.List[Listener] = []
+
+def add_listener(listener: Listener) -> None:
+    """
+    Registers a function that is called with every finished span of this process.
+
+    :param listener: The function.
+    :type listener: typing.Callable[[Span], None]
+    :return: Nothing.
+    :rtype: None
+    """
+    _LISTENERS.append(listener)
+
+def remove_listener(listener: Listener) -> None:
+    """
+    Removes a listener that has been registered with add_listener.
+
+    :param listener: The function.
+    :type listener: typing.Callable[[Span], None]
+    :return: Nothing.
+    :rtype: None
+    """
+    _LISTENERS.remove(listener)
+
+class ChromeTraceExporter:
+    """
+    Listener that appends spans as complete events to a file in the JSON array
+    format of Chrome's trace viewer, which chrome://tracing and Perfetto load.
+    Every event is appended on its own, so multiple processes can share a file
+    and the trace is usable even if the build crashes.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: Path to the trace file, events are appended to an existing trace.
+        :type path: str
+        """
+        self.path = path
+
+    def __repr__(self) -> str:
+        return f"ChromeTraceExporter({self.path!r})"
+
+    def __call__(self, finished_span: Span) -> None:
+        self._create_file()
+        line = json.dumps(self.to_event(finished_span), default=str) + ",\n"
+        # A single write to a file opened for appending isn't interleaved with other processes
+        with open(self.path, "a") as handle:
+            handle.write(line)
+
+    @staticmethod
+    def to_event(finished_span: Span) -> dict:
+        """
+        Converts a span to a trace event, timestamps are in microseconds.
+
+        :param finished_span: The finished span.
+        :type finished_span: Span
+        :return: The trace event.
+        :rtype: dict
+        """
+
+        return {
+            "name": finished_span.name,
+            "cat": "lambda_bundler",
+            "ph": "X",
+            "ts": round(finished_span.start * 1e6),
+            "dur": round(finished_span.duration * 1e6),
+            "pid": finished_span.process_id,
+            "tid": finished_span.thread_id,
+            "args": finished_span.attributes,
+        }
+
+    def _create_file(self) -> None:
+        if os.path.exists(self.path):
+            return
+
+        # Link a complete file into place, so no process appends before the array is opened
+        temporary_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        with open(temporary_path, "w") as handle:
+            handle.write("[\n")
+        try:
+            os.link(temporary_path, self.path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temporary_path)
+
+def load_trace(path: str) -> typing.List[dict]:
+    """
+    Loads the events of a trace file written by the ChromeTraceExporter, which
+    leaves the JSON array open so events can be appended.
+
+    :param path: Path to the trace file.
+    :type path: str
+    :return: The trace events.
+    :rtype: typing.List[dict]
+    """
+
+    with open(path) as handle:
+        content = handle.read().rstrip().rstrip(",")
+    return json.loads(content if content.endswith("]") else content + "]")
+
+_EXPORTERS: typing.Dict[str, ChromeTraceExporter] = {}
+
+def _get_listeners() -> typing.List[Listener]:
+
+    path = util.get_setting(TRACE_FILE_ENV)
+    if not path:
+        return list(_LISTENERS)
+
+    path = os.path.abspath(path)
+    if path not in _EXPORTERS:
+        _EXPORTERS[path] = ChromeTraceExporter(path)
+    return _LISTENERS + [_EXPORTERS[path]]
+
+@contextlib.contextmanager
+def trace_to(path: str) -> typing.Iterator[ChromeTraceExporter]:
+    """
+    Context manager that exports the spans of this process to the trace file at
+    path while it's active. Set LAMBDA_BUNDLER_TRACE_FILE instead to trace every
+    build, including the ones in other processes.
+
+    :param path: Path to the trace file.
+    :type path: str
+    :return: The exporter.
+    :rtype: typing.Iterator[ChromeTraceExporter]
+    """
+
+    exporter = ChromeTraceExporter(path)
+    add_listener(exporter)
+    try:
+        yield exporter
+    finally:
+        remove_listener(exporter)
+
+@contextlib.contextmanager
+def span(name: str, **attributes: typing.Any) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+    """
+    Context manager that times a stage of the build. It yields the attributes of
+    the span, so counts like files and bytes can be added while the stage runs.
+    Spans that end with an exception have its name in the error attribute.
+
+    :param name: Name of the stage.
+    :type name: str
+    :return: The attributes of the span.
+    :rtype: typing.Iterator[typing.Dict[str, typing.Any]]
+    """
+
+    listeners = _get_listeners()
+    if not listeners:
+        yield attributes
+        return
+
+    start = time.time()
+    counter = time.perf_counter()
+    try:
+        yield attributes
+    except BaseException as error:
+        attributes["error"] = type(error).__name__
+        raise
+    finally:
+        finished = Span(
+            name, start, time.perf_counter() - counter, os.getpid(), threading.get_ident(), attributes
+        )
+        for listener in listeners:
+            try:
+                listener(finished)
+            except Exception as error: # pylint: disable=broad-except
+                # Tracing must never break a build
+                LOGGER.warning("Listener %s failed for span '%s': %s", listener, name, error)
+
+def traced(name: str) -> typing.Callable[[typing.Callable], typing.Callable]:
+    """
+    Decorator that wraps every call of the function in a span.
+
+    :param name: Name of the span.
+    :type name: str
+    :return: The decorator.
+    :rtype: typing.Callable[[typing.Callable], typing.Callable]
+    """
+
+    def decorator(function: typing.Callable) -> typing.Callable:
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,248 @@
+"""
+Contains the static import analysis that finds the modules of the dependencies a
+function can reach from its handler modules, so the unreachable ones can be left
+out of the deployment package.
+"""
+import ast
+import collections
+import fnmatch
+import logging
+import re
+import typing
+import zipfile
+
+import lambda_bundler.util as util
+
+LOGGER = logging.getLogger("lambda_bundler")
+
+# Extension modules are named like module.cpython-38-x86_64-linux-gnu.so or module.pyd
+_EXTENSION_PATTERN = re.compile(r"^([A-Za-z_]\w*)(\.[\w-]+)*\.(so|pyd)$")
+
+# Functions that import the module named by their first argument
+_IMPORT_FUNCTIONS = {"import_module", "__import__"}
+
+class Module(typing.NamedTuple):
+    """A module that has been found in the code directories or the dependencies."""
+    name: str
+    is_package: bool
+    read_source: typing.Optional[typing.Callable[[], bytes]]
+
+def get_module_name(arcname: str) -> typing.Optional[typing.Tuple[str, bool]]:
+    """
+    Returns the name of the module at arcname in an archive and whether it's a package.
+
+    :param arcname: The path in the archive.
+    :type arcname: str
+    :return: The module name and whether it's a package or None if arcname is no module.
+    :rtype: typing.Optional[typing.Tuple[str, bool]]
+    """
+
+    *directories, file_name = arcname.split("/")
+
+    if file_name.endswith(".py"):
+        parts = directories + [file_name[:-len(".py")]]
+    else:
+        match = _EXTENSION_PATTERN.match(file_name)
+        if match is None:
+            return None
+        parts = directories + [match.group(1)]
+
+    if not all(part.isidentifier() for part in parts):
+        return None
+
+    if parts[-1] == "__init__":
+        return ".".join(parts[:-1]), True
+    return ".".join(parts), False
+
+def _resolve_relative(module: Module, level: int, name: typing.Optional[str]) -> typing.Optional[str]:
+
+    package_parts = module.name.split(".") if module.is_package else module.name.split(".")[:-1]
+    if level - 1 > len(package_parts):
+        return None
+
+    base_parts = package_parts[:len(package_parts) - (level - 1)]
+    return ".".join(base_parts + ([name] if name else [])) or None
+
+def _get_string(node: ast.AST) -> typing.Optional[str]:
+    # Python < 3.8 parses string literals as ast.Str
+    if type(node).__name__ == "Str":
+        value = node.s
+    elif isinstance(node, ast.Constant):
+        value = node.value
+    else:
+        return None
+    return value if isinstance(value, str) else None
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as handle:
+        return handle.read()
+
+def find_imports(module: Module, source: bytes) -> typing.Set[str]:
+    """
+    Returns the names of the modules that source imports, including the names
+    that might be submodules in from-imports and constant arguments of import_module.
+
+    :param module: The module the source belongs to, relative imports are resolved against it.
+    :type module: Module
+    :param source: The source code.
+    :type source: bytes
+    :return: Names of modules that may be imported.
+    :rtype: typing.Set[str]
+    """
+
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError) as error:
+        LOGGER.warning("Unable to parse '%s', its imports are ignored: %s", module.name, error)
+        return set()
+
+    imported = set()
+    for node in ast.walk(tree):
+
+        if isinstance(node, ast.Import):
+            imported.update(alias.name for alias in node.names)
+
+        elif isinstance(node, ast.ImportFrom):
+            base = _resolve_relative(module, node.level, node.module) if node.level else node.module
+            if base is None:
+                continue
+            imported.add(base)
+            # Names can be attributes or submodules, unknown names are ignored later
+            imported.update(f"{base}.{alias.name}" for alias in node.names)
+
+        elif isinstance(node, ast.Call) and node.args:
+            function = node.func
+            function_name = function.attr if isinstance(function, ast.Attribute) else getattr(function, "id", None)
+            argument = _get_string(node.args[0])
+            if function_name in _IMPORT_FUNCTIONS and argument and not argument.startswith("."):
+                imported.add(argument)
+
+    return imported
+
+def _with_parents(name: str) -> typing.Iterator[str]:
+    # Importing a.b.c executes a and a.b first
+    parts = name.split(".")
+    for index in range(1, len(parts) + 1):
+        yield ".".join(parts[:index])
+
+def _is_allowed(name: str, dynamic_imports: typing.Iterable[str]) -> bool:
+    return any(
+        name == pattern or name.startswith(f"{pattern}.") or fnmatch.fnmatchcase(name, pattern)
+        for pattern in dynamic_imports
+    )
+
+def find_reachable_modules(modules: typing.Dict[str, Module], roots: typing.Iterable[str],
+                           dynamic_imports: typing.Iterable[str] = None) -> typing.Set[str]:
+    """
+    Returns the names of all modules that can be reached from the roots by following
+    their imports. Modules that match dynamic_imports are always reachable.
+
+    :param modules: The known modules by name, imports of unknown modules are ignored.
+    :type modules: typing.Dict[str, Module]
+    :param roots: Names of the modules to start from.
+    :type roots: typing.Iterable[str]
+    :param dynamic_imports: Module names or glob patterns of modules that are imported dynamically, defaults to None
+    :type dynamic_imports: typing.Iterable[str], optional
+    :return: Names of the reachable modules.
+    :rtype: typing.Set[str]
+    """
+
+    dynamic_imports = list(dynamic_imports or [])
+    queue = collections.deque(roots)
+    queue.extend(name for name in modules if _is_allowed(name, dynamic_imports))
+    reachable = set()
+
+    while queue:
+        for name in _with_parents(queue.popleft()):
+            module = modules.get(name)
+            if module is None or name in reachable:
+                continue
+
+            reachable.add(name)
+            if module.read_source is not None:
+                queue.extend(find_imports(module, module.read_source()))
+
+    return reachable
+
+def _get_owner(arcname: str, modules: typing.Dict[str, Module]) -> typing.Optional[str]:
+
+    # Data files belong to the closest package they're in
+    parts = arcname.rstrip("/").split("/")[:-1]
+    owner = None
+    for index in range(1, len(parts) + 1):
+        if not parts[index - 1].isidentifier():
+            break
+        name = ".".join(parts[:index])
+        if name in modules:
+            owner = name
+    return owner
+
+def _get_entries_to_keep(names: typing.List[str], modules: typing.Dict[str, Module],
+                         reachable: typing.Set[str]) -> typing.Set[str]:
+
+    keep = set()
+    for arcname in names:
+        module_name = get_module_name(arcname)
+        if module_name is not None:
+            owner = module_name[0]
+        else:
+            owner = _get_owner(arcname, modules)
+
+        if owner is None or owner in reachable:
+            keep.add(arcname)
+    return keep
+
+def shake_dependencies(path_to_zip: str, code_entries: typing.Iterable[util.SourceEntry],
+                       handler_modules: typing.Iterable[str],
+                       dynamic_imports: typing.Iterable[str] = None) -> typing.Set[str]:
+    """
+    Analyses which modules in the dependency archive at path_to_zip the handler_modules
+    from the code directories can import and returns the entries of the archive that
+    have to be kept. Files that aren't modules are kept if the package they're in is
+    reachable or if they aren't part of a package.
+
+    :param path_to_zip: Path to the archive with the dependencies.
+    :type path_to_zip: str
+    :param code_entries: The entries of the code directories.
+    :type code_entries: typing.Iterable[util.SourceEntry]
+    :param handler_modules: Names of the modules with the handler functions, e.g. lambda.handler
+    :type handler_modules: typing.Iterable[str]
+    :param dynamic_imports: Module names or glob patterns of modules that are imported dynamically, defaults to None
+    :type dynamic_imports: typing.Iterable[str], optional
+    :raises ValueError: If a handler module isn't part of the code directories.
+    :return: The names of the entries in the archive to keep.
+    :rtype: typing.Set[str]
+    """
+
+    handler_modules = list(handler_modules)
+
+    with zipfile.ZipFile(path_to_zip) as source_zip:
+
+        names = source_zip.namelist()
+        modules = {}
+        for arcname in names:
+            module_name = get_module_name(arcname)
+            if module_name is not None:
+                read_source = (lambda arcname=arcname: source_zip.read(arcname)) if arcname.endswith(".py") else None
+                modules[module_name[0]] = Module(module_name[0], module_name[1], read_source)
+
+        dependency_modules = set(modules)
+        for entry in code_entries:
+            module_name = get_module_name(entry.arcname) if not entry.is_directory else None
+            if module_name is not None:
+                modules[module_name[0]] = Module(
+                    module_name[0], module_name[1], lambda path=entry.path: _read_file(path)
+                )
+
+        missing_handlers = [name for name in handler_modules if name not in modules]
+        if missing_handlers:
+            raise ValueError(f"The handler modules {missing_handlers} aren't part of the code directories")
+
+        reachable = find_reachable_modules(modules, handler_modules, dynamic_imports)
+
+    LOGGER.info(
+        "Tree shaking keeps %s of %s modules of the dependencies in '%s'",
+        len(dependency_modules & reachable), len(dependency_modules), path_to_zip
+    )
+
+    return _get_entries_to_keep(names, modules, reachable)
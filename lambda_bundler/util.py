@@ -1,13 +1,16 @@
 """Contains several utility functions for the lambda_bundler."""
+import contextlib
+import fnmatch
 import functools
 import hashlib
 import logging
 import os
 import pathlib
-import shutil
+import sys
+import sysconfig
 import tempfile
+import threading
 import typing
-import zipfile
 
 LOGGER = logging.getLogger("lambda_bundler")
 
@@ -16,6 +19,210 @@ DEFAULT_EXCLUDE_LIST = [
 ]
 
 BUILD_DIR_ENV = "LAMBDA_BUNDLER_BUILD_DIR"
+WHEELHOUSE_ENV = "LAMBDA_BUNDLER_WHEELHOUSE"
+OFFLINE_ENV = "LAMBDA_BUNDLER_OFFLINE"
+REPRODUCIBLE_ENV = "LAMBDA_BUNDLER_REPRODUCIBLE"
+DIRECT_INSTALL_ENV = "LAMBDA_BUNDLER_DIRECT_INSTALL"
+SKIP_INSTALL_ENV = "LAMBDA_BUNDLER_SKIP_INSTALL"
+IN_MEMORY_BUILD_DIR_ENV = "LAMBDA_BUNDLER_IN_MEMORY_BUILD_DIR"
+
+# RAM-backed file system of Linux
+SHARED_MEMORY_DIRECTORY = "/dev/shm"
+
+# Directories in the build directory that hold wheels and the cache of pip
+WHEELHOUSE_DIRECTORY_NAME = "wheelhouse"
+PIP_CACHE_DIRECTORY_NAME = "pip-cache"
+
+TRUTHY_VALUES = ["true", "t", "1", "y", "yes"]
+
+# Read files in chunks of this size when hashing them
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Settings and file cache of the BuildSession that's active in a thread
+_ACTIVE = threading.local()
+
+class SourceEntry(typing.NamedTuple):
+    """A file or empty directory that has been found in a code directory."""
+    path: str
+    arcname: str
+    is_directory: bool
+    stat: os.stat_result
+
+class FileCache:
+    """
+    Memoizes the content and hash of files. An entry is valid as long as the size,
+    modification time and inode of its file don't change, so a file that is read
+    many times is only read once while it stays the same.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contents = {}
+        self._hashes = {}
+        # Files read by the current thread while recording, see record_reads
+        self._recorded = threading.local()
+
+    @staticmethod
+    def get_stat_key(path: str) -> typing.Optional[typing.Tuple[int, int, int]]:
+        """
+        Returns what identifies the version of the file at path.
+
+        :param path: Path to the file.
+        :type path: str
+        :return: The size, modification time and inode or None if the file doesn't exist.
+        :rtype: typing.Optional[typing.Tuple[int, int, int]]
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+    def _lookup(self, memo: dict, path: str, load: typing.Callable[[str], typing.Any]) -> typing.Any:
+
+        path = os.path.abspath(path)
+        stat_key = self.get_stat_key(path)
+        reads = getattr(self._recorded, "reads", None)
+        if reads is not None:
+            reads[path] = stat_key
+
+        with self._lock:
+            known = memo.get(path)
+        if known is not None and stat_key is not None and known[0] == stat_key:
+            return known[1]
+
+        value = load(path)
+        with self._lock:
+            memo[path] = (stat_key, value)
+        return value
+
+    def read(self, path: str) -> str:
+        """
+        Returns the content of the text file at path.
+
+        :param path: Path to the file.
+        :type path: str
+        :return: The content.
+        :rtype: str
+        """
+        return self._lookup(self._contents, path, _read_file)
+
+    def hash(self, path: str) -> str:
+        """
+        Returns the sha256 hexdigest of the content of the file at path.
+
+        :param path: Path to the file.
+        :type path: str
+        :return: Hexdigest of the content.
+        :rtype: str
+        """
+        return self._lookup(self._hashes, path, _hash_file)
+
+    @contextlib.contextmanager
+    def record_reads(self) -> typing.Iterator[typing.Dict[str, typing.Optional[tuple]]]:
+        """
+        Records the files the current thread reads or hashes through the cache
+        in the block, e.g. to find out which files a result depends on.
+
+        :return: Context manager that yields the stat key of each file by its absolute path.
+        :rtype: typing.Iterator[typing.Dict[str, typing.Optional[tuple]]]
+        """
+
+        previous = getattr(self._recorded, "reads", None)
+        self._recorded.reads = {}
+        try:
+            yield self._recorded.reads
+        finally:
+            reads = self._recorded.reads
+            self._recorded.reads = previous
+            if previous is not None:
+                previous.update(reads)
+
+@contextlib.contextmanager
+def activate(settings: typing.Dict[str, str], file_cache: FileCache = None) -> typing.Iterator[None]:
+    """
+    Makes settings take precedence over the environment variables of the same name
+    and routes file reads through file_cache in the current thread while the block runs.
+
+    :param settings: Values by the name of the environment variable they replace.
+    :type settings: typing.Dict[str, str]
+    :param file_cache: Cache for the files that are read, defaults to None which means no cache.
+    :type file_cache: FileCache, optional
+    :return: Context manager.
+    :rtype: typing.Iterator[None]
+    """
+
+    previous = getattr(_ACTIVE, "settings", {}), getattr(_ACTIVE, "file_cache", None)
+    _ACTIVE.settings = {**previous[0], **settings}
+    _ACTIVE.file_cache = file_cache or previous[1]
+    try:
+        yield
+    finally:
+        _ACTIVE.settings, _ACTIVE.file_cache = previous
+
+def get_active_settings() -> typing.Dict[str, str]:
+    """
+    Returns the settings that are active in the current thread, see activate.
+
+    :return: Values by the name of the environment variable they replace.
+    :rtype: typing.Dict[str, str]
+    """
+    return dict(getattr(_ACTIVE, "settings", {}))
+
+def bind_active(function: typing.Callable) -> typing.Callable:
+    """
+    Returns a function that calls function with the settings and file cache of the
+    current thread, for functions that run in threads of an executor.
+
+    :param function: The function to bind.
+    :type function: typing.Callable
+    :return: The bound function.
+    :rtype: typing.Callable
+    """
+
+    settings, file_cache = get_active_settings(), getattr(_ACTIVE, "file_cache", None)
+
+    @functools.wraps(function)
+    def bound(*args, **kwargs):
+        with activate(settings, file_cache):
+            return function(*args, **kwargs)
+
+    return bound
+
+def get_setting(name: str, default: str = None) -> typing.Optional[str]:
+    """
+    Returns the value of the environment variable name, unless the settings that are
+    active in the current thread replace it.
+
+    :param name: Name of the environment variable.
+    :type name: str
+    :param default: Value if it isn't set, defaults to None
+    :type default: str, optional
+    :return: The value.
+    :rtype: typing.Optional[str]
+    """
+
+    settings = getattr(_ACTIVE, "settings", {})
+    if name in settings:
+        return settings[name]
+    return os.environ.get(name, default)
+
+def _read_file(path: str) -> str:
+    with open(path) as file_handle:
+        return file_handle.read()
+
+def read_file(path: str) -> str:
+    """
+    Returns the content of the text file at path, from the cache of the active session if there is one.
+
+    :param path: Path to the file.
+    :type path: str
+    :return: The content.
+    :rtype: str
+    """
+
+    file_cache = getattr(_ACTIVE, "file_cache", None)
+    return _read_file(path) if file_cache is None else file_cache.read(path)
 
 def get_content_of_files(*list_of_paths: typing.List[str]) -> typing.List[str]:
     """
@@ -25,13 +232,18 @@ def get_content_of_files(*list_of_paths: typing.List[str]) -> typing.List[str]:
     :rtype: typing.List[str]
     """
 
-    contents = []
+    return [read_file(path) for path in list_of_paths]
 
-    for path in list_of_paths:
-        with open(path) as file_handle:
-            contents.append(file_handle.read())
+def to_list(values: typing.Optional[typing.Iterable[str]]) -> typing.Optional[typing.List[str]]:
+    """
+    Converts the tuples of specs back to the lists the build functions take.
 
-    return contents
+    :param values: The values or None.
+    :type values: typing.Optional[typing.Iterable[str]]
+    :return: The values as a list or None if there are none.
+    :rtype: typing.Optional[typing.List[str]]
+    """
+    return None if values is None else list(values)
 
 def hash_string(string_to_hash: str) -> str:
     """
@@ -44,96 +256,196 @@ def hash_string(string_to_hash: str) -> str:
     """
     return hashlib.sha256(string_to_hash.encode("utf-8")).hexdigest()
 
-def _collect_sources(code_directories: typing.List[str], exclude_patterns: typing.List[str], working_directory: str):
-    ignore_during_copy = shutil.ignore_patterns(*exclude_patterns)
+def hash_file(path_to_file: str) -> str:
+    """
+    Returns the sha256 hexdigest of the content of path_to_file, from the cache
+    of the active session if there is one.
 
-    LOGGER.debug("Copying code to staging directory.")
-    for directory in code_directories:
+    :param path_to_file: Path to the file that should be hashed.
+    :type path_to_file: str
+    :return: Hexdigest of the file content.
+    :rtype: str
+    """
 
-        LOGGER.debug("Copying '%s'", directory)
-        # Get the name of the directory -> "path/to/directory" would return "directory"
-        source_directory_name = os.path.basename(directory)
+    file_cache = getattr(_ACTIVE, "file_cache", None)
+    return _hash_file(path_to_file) if file_cache is None else file_cache.hash(path_to_file)
+
+def _hash_file(path_to_file: str) -> str:
+    file_hash = hashlib.sha256()
+    with open(path_to_file, "rb") as file_handle:
+        for chunk in iter(lambda: file_handle.read(HASH_CHUNK_SIZE), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
 
-        # This is the directory that will ultimately be zipped
-        target_directory = os.path.join(working_directory, source_directory_name)
+def _is_excluded(name: str, exclude_patterns: typing.List[str]) -> bool:
+    # Same semantics as shutil.ignore_patterns
+    return any(fnmatch.fnmatch(name, pattern) for pattern in exclude_patterns)
 
-        # Copy the source directory to the working directory
-        shutil.copytree(directory, target_directory, ignore=ignore_during_copy)
+def _scan_directory(path: str, exclude_patterns: typing.List[str]) -> typing.List[os.DirEntry]:
+    with os.scandir(path) as iterator:
+        children = [entry for entry in iterator if not _is_excluded(entry.name, exclude_patterns)]
+    return sorted(children, key=lambda entry: entry.name)
 
-def _add_sources_to_zip(zip_file: zipfile.ZipFile, working_directory: str):
+def _join_arcname(prefix: str, name: str) -> str:
+    return f"{prefix}/{name}" if prefix else name
 
-    # Now add the contents of the working directory to the EXISTING zip
-    # inspired by https://stackoverflow.com/a/11751948/6485881
-    # and https://stackoverflow.com/a/18295769/6485881
-    for root, directories, files in os.walk(working_directory):
+def _walk_tree(directory: str, arcname: str,
+               exclude_patterns: typing.List[str]) -> typing.Iterator[SourceEntry]:
 
-        # Add regular files
-        for name in files:
-            zip_file.write(
-                filename=os.path.join(root, name),
-                arcname=os.path.join(root.replace(working_directory, ""), name),
-                compress_type=zipfile.ZIP_DEFLATED
-            )
+    pending = [(directory, arcname)]
+
+    while pending:
+        path, arcname = pending.pop()
+        children = _scan_directory(path, exclude_patterns)
 
         # Handle empty directories, those are annoying in zips
-        empty_dirs = [directory for directory in directories
-                      if os.listdir(os.path.join(root, directory)) == []]
-        for empty_dir in empty_dirs:
-            zip_file.write(
-                filename=os.path.join(root, empty_dir),
-                arcname=os.path.join(root.replace(working_directory, ""), empty_dir),
-                compress_type=zipfile.ZIP_STORED
-            )
-
-def extend_zip(path_to_zip: str, code_directories: typing.List[str],
-               exclude_patterns: typing.List[str] = None) -> None:
-    """
-    This functions extends an existing zip archive with code from the code_directories
-    while ignoring the exclude_patterns.
-
-    :param path_to_zip: The path to the zip file to edit.
-    :type path_to_zip: str
-    :param code_directories: A list of directories that should be included in the zip.
+        if not children:
+            if arcname:
+                yield SourceEntry(path, arcname + "/", True, os.stat(path))
+            continue
+
+        sub_directories = []
+        for child in children:
+            if child.is_dir():
+                sub_directories.append((child.path, _join_arcname(arcname, child.name)))
+            else:
+                yield SourceEntry(child.path, _join_arcname(arcname, child.name), False, child.stat())
+
+        # Reversed, so the directories are popped in alphabetical order
+        pending.extend(reversed(sub_directories))
+
+def walk_sources(code_directories: typing.List[str],
+                 exclude_patterns: typing.List[str]) -> typing.Iterator[SourceEntry]:
+    """
+    Walks the code_directories in a stable order and yields every file and every
+    empty directory that doesn't match the exclude_patterns. Each code directory
+    ends up under its own name in the archive, "path/to/directory/a.py" becomes
+    "directory/a.py".
+
+    :param code_directories: List of directories to walk.
     :type code_directories: typing.List[str]
-    :param exclude_patterns: A list of glob patterns to exclude from the zip, defaults to None
-    :type exclude_patterns: typing.List[str], optional
-    :return: Nothing.
-    :rtype: None
+    :param exclude_patterns: Glob patterns of files/directories to skip.
+    :type exclude_patterns: typing.List[str]
+    :return: Iterator over the entries that belong into the archive.
+    :rtype: typing.Iterator[SourceEntry]
     """
 
-    # Build the exclude patterns
-    exclude_patterns = exclude_patterns or []
-    exclude_patterns = exclude_patterns + DEFAULT_EXCLUDE_LIST
+    for directory in code_directories:
 
-    # Create a working directory, copy all source directories there with the exclude list
-    with tempfile.TemporaryDirectory() as working_directory, \
-        zipfile.ZipFile(path_to_zip, mode="a") as zip_file:
+        # Get the name of the directory -> "path/to/directory" would return "directory"
+        directory_name = os.path.basename(os.path.normpath(directory))
+        yield from _walk_tree(directory, directory_name, exclude_patterns)
 
-        _collect_sources(
-            code_directories=code_directories,
-            exclude_patterns=exclude_patterns,
-            working_directory=working_directory
-        )
+def walk_directory(directory: str,
+                   exclude_patterns: typing.List[str] = None) -> typing.Iterator[SourceEntry]:
+    """
+    Walks directory like walk_sources, but the archive names are relative to
+    directory itself, "directory/a.py" becomes "a.py".
 
-        LOGGER.debug("Extending '%s' with code from the staging directory", path_to_zip)
+    :param directory: The directory to walk.
+    :type directory: str
+    :param exclude_patterns: Glob patterns of files/directories to skip, defaults to None
+    :type exclude_patterns: typing.List[str], optional
+    :return: Iterator over the entries that belong into the archive.
+    :rtype: typing.Iterator[SourceEntry]
+    """
 
-        _add_sources_to_zip(
-            zip_file=zip_file,
-            working_directory=working_directory
-        )
-        LOGGER.debug("Zip extended.")
+    return _walk_tree(directory, "", exclude_patterns or [])
 
 def get_build_dir() -> str:
     """
-    Returns the path to the build directory.
+    Returns the path to the build directory. Set LAMBDA_BUNDLER_IN_MEMORY_BUILD_DIR
+    to true to build in /dev/shm, which keeps archives and installs in memory, the
+    temporary directory is used if it doesn't exist. LAMBDA_BUNDLER_BUILD_DIR takes precedence.
 
     :return: Path to the build directory.
     :rtype: str
     """
-    return os.environ.get(
-        BUILD_DIR_ENV,
-        os.path.join(tempfile.gettempdir(), "lambda_bundler_builds")
-    )
+
+    build_directory = get_setting(BUILD_DIR_ENV)
+    if build_directory:
+        return build_directory
+
+    parent_directory = tempfile.gettempdir()
+    if get_setting(IN_MEMORY_BUILD_DIR_ENV, "false").lower() in TRUTHY_VALUES:
+        if os.path.isdir(SHARED_MEMORY_DIRECTORY) and os.access(SHARED_MEMORY_DIRECTORY, os.W_OK):
+            parent_directory = SHARED_MEMORY_DIRECTORY
+        else:
+            LOGGER.debug("%s isn't available, building in %s", SHARED_MEMORY_DIRECTORY, parent_directory)
+
+    return os.path.join(parent_directory, "lambda_bundler_builds")
+
+@functools.lru_cache(maxsize=None)
+def get_environment_tag(target_tag: str = None) -> str:
+    """
+    Returns a tag for the environment dependencies are installed in. Installed
+    distributions depend on the interpreter version, the platform and pip, so
+    artifacts can only be shared between environments with the same tag.
+
+    :param target_tag: Tag of the target dependencies are installed for, defaults to None
+                       which means the interpreter and platform of the build.
+    :type target_tag: str, optional
+    :return: The tag, e.g. cpython-38-linux-x86_64-pip20.1.1
+    :rtype: str
+    """
+
+    try:
+        import pip # pylint: disable=import-outside-toplevel
+        pip_version = pip.__version__
+    except ImportError:
+        pip_version = "unknown"
+
+    if target_tag is not None:
+        return f"target-{target_tag}-pip{pip_version}"
+    return f"{sys.implementation.cache_tag}-{sysconfig.get_platform()}-pip{pip_version}"
+
+def get_wheelhouse_dir() -> str:
+    """
+    Returns the path to the wheelhouse, the directory with wheels pip installs from.
+
+    :return: Path to the wheelhouse.
+    :rtype: str
+    """
+    return get_setting(WHEELHOUSE_ENV) or os.path.join(get_build_dir(), WHEELHOUSE_DIRECTORY_NAME)
+
+def is_offline() -> bool:
+    """
+    Returns whether dependencies must be installed from the wheelhouse only.
+
+    :return: True if the package index must not be used.
+    :rtype: bool
+    """
+    return get_setting(OFFLINE_ENV, "false").lower() in TRUTHY_VALUES
+
+def is_reproducible() -> bool:
+    """
+    Returns whether archives are built byte for byte reproducible, which is the
+    default. Set LAMBDA_BUNDLER_REPRODUCIBLE to false to keep timestamps and permissions.
+
+    :return: True if identical inputs have to result in identical archives.
+    :rtype: bool
+    """
+    return get_setting(REPRODUCIBLE_ENV, "true").lower() in TRUTHY_VALUES
+
+def is_direct_install() -> bool:
+    """
+    Returns whether wheels are copied straight into the archives of their distributions,
+    which is the default. Set LAMBDA_BUNDLER_DIRECT_INSTALL to false to always install with pip.
+
+    :return: True if wheels are installed without extracting them to disk.
+    :rtype: bool
+    """
+    return get_setting(DIRECT_INSTALL_ENV, "true").lower() in TRUTHY_VALUES
+
+def is_skip_install() -> bool:
+    """
+    Returns whether installing dependencies and bundling is skipped because
+    LAMBDA_BUNDLER_SKIP_INSTALL is set, e.g. for a cdk synth.
+
+    :return: True if builds return an empty archive.
+    :rtype: bool
+    """
+    return get_setting(SKIP_INSTALL_ENV, "false").lower() in TRUTHY_VALUES
 
 def _create_or_return_empty_zip() -> str:
     path_to_empty_zip = os.path.join(get_build_dir(), "empty.zip")
@@ -144,7 +456,7 @@ def _create_or_return_empty_zip() -> str:
     return path_to_empty_zip
 
 def return_empty_if_skip_install(function: typing.Callable,
-                                 environment_variale_name="LAMBDA_BUNDLER_SKIP_INSTALL") -> typing.Callable:
+                                 environment_variale_name=SKIP_INSTALL_ENV) -> typing.Callable:
     """
     Decorator that returns an empty zip if the installation should be skipped.
 
@@ -159,9 +471,9 @@ def return_empty_if_skip_install(function: typing.Callable,
     @functools.wraps(function)
     def wrapped(*args, **kwargs):
 
-        skip_install_value = os.environ.get(environment_variale_name, "false")
+        skip_install_value = get_setting(environment_variale_name, "false")
 
-        if skip_install_value.lower() in ["true", "t", "1", "y", "yes"]:
+        if skip_install_value.lower() in TRUTHY_VALUES:
             LOGGER.info("Skipping installation of dependencies.")
             return _create_or_return_empty_zip()
 
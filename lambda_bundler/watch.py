@@ -0,0 +1,398 @@
+"""
+Contains the watch mode that rebuilds the artifacts of functions and layers
+whenever their code or requirements change.
+
+Changes are detected with inotify on Linux and by polling the file stats
+everywhere else. Editors write files in several steps, so events are collected
+until the tree has been quiet for a moment before anything is rebuilt.
+"""
+import ctypes
+import ctypes.util
+import fnmatch
+import json
+import logging
+import os
+import select
+import struct
+import time
+import typing
+
+import lambda_bundler.bundler as bundler
+import lambda_bundler.util as util
+
+LOGGER = logging.getLogger("lambda_bundler")
+
+# Events are collected until there haven't been new ones for this long
+DEFAULT_DEBOUNCE_SECONDS = 0.1
+
+DEFAULT_POLL_INTERVAL_SECONDS = 0.5
+
+_IN_MODIFY = 0x2
+_IN_ATTRIB = 0x4
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+_IN_MOVE_SELF = 0x800
+_IN_Q_OVERFLOW = 0x4000
+_IN_ISDIR = 0x40000000
+_WATCH_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO \
+    | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF
+_EVENT_HEADER = struct.Struct("iIII")
+
+Spec = typing.Union[bundler.LayerSpec, bundler.PackageSpec]
+
+def load_config(path: str) -> typing.Dict[str, Spec]:
+    """
+    Loads the functions and layers to build from a JSON file like
+    {"layers": {"name": {"requirement_files": [...]}},
+    "functions": {"name": {"code_directories": [...], ...}}}. The functions take the
+    arguments of build_lambda_package, relative paths are relative to the file.
+
+    :param path: Path to the config file.
+    :type path: str
+    :raises ValueError: If the config is invalid.
+    :return: The spec of each function and layer by its name.
+    :rtype: typing.Dict[str, Spec]
+    """
+
+    with open(path) as handle:
+        config = json.load(handle)
+
+    base_directory = os.path.dirname(os.path.abspath(path))
+
+    def resolve(paths: typing.Optional[typing.List[str]]) -> typing.Optional[typing.List[str]]:
+        if paths is None:
+            return None
+        return [os.path.normpath(os.path.join(base_directory, relative_path)) for relative_path in paths]
+
+    specs = {}
+    try:
+        for name, layer in config.get("layers", {}).items():
+            specs[name] = bundler.LayerSpec(resolve(layer["requirement_files"]))
+
+        for name, function in config.get("functions", {}).items():
+            if name in specs:
+                raise ValueError(f"The name '{name}' is used by a layer and a function")
+            specs[name] = bundler.PackageSpec(
+                code_directories=resolve(function["code_directories"]),
+                requirement_files=resolve(function.get("requirement_files")),
+                exclude_patterns=function.get("exclude_patterns"),
+                handler_modules=function.get("handler_modules"),
+                dynamic_imports=function.get("dynamic_imports")
+            )
+    except (KeyError, AttributeError, TypeError) as error:
+        raise ValueError(f"Invalid config '{path}': {error!r}") from error
+
+    if not specs:
+        raise ValueError(f"The config '{path}' has neither functions nor layers")
+
+    return specs
+
+def get_watched_paths(spec: Spec) -> typing.List[str]:
+    """
+    Returns the directories and files a spec is built from.
+
+    :param spec: The spec of a function or layer.
+    :type spec: Spec
+    :return: The paths.
+    :rtype: typing.List[str]
+    """
+
+    paths = list(spec.requirement_files or [])
+    if isinstance(spec, bundler.PackageSpec):
+        paths += spec.code_directories
+    return paths
+
+def is_affected(spec: Spec, path: str) -> bool:
+    """
+    Checks if a change of the file or directory at path changes the artifact of spec.
+
+    :param spec: The spec of a function or layer.
+    :type spec: Spec
+    :param path: Path that has changed.
+    :type path: str
+    :return: Whether the artifact has to be rebuilt.
+    :rtype: bool
+    """
+
+    path = os.path.abspath(path)
+    if any(path == os.path.abspath(requirement_file) for requirement_file in spec.requirement_files or []):
+        return True
+
+    if isinstance(spec, bundler.LayerSpec):
+        return False
+
+    exclude_patterns = list(spec.exclude_patterns or []) + util.DEFAULT_EXCLUDE_LIST
+    for directory in spec.code_directories:
+        directory = os.path.abspath(directory)
+        if path == directory:
+            return True
+        if path.startswith(directory + os.sep):
+            # Files in excluded directories aren't part of the archive either
+            parts = os.path.relpath(path, directory).split(os.sep)
+            if not any(fnmatch.fnmatch(part, pattern) for part in parts for pattern in exclude_patterns):
+                return True
+
+    return False
+
+class PollingWatcher:
+    """Detects changes by comparing the stats of the watched files periodically."""
+
+    def __init__(self, paths: typing.Iterable[str], interval: float = DEFAULT_POLL_INTERVAL_SECONDS):
+        """
+        :param paths: Directories and files to watch, directories are watched recursively.
+        :type paths: typing.Iterable[str]
+        :param interval: Seconds between two scans, defaults to DEFAULT_POLL_INTERVAL_SECONDS
+        :type interval: float, optional
+        """
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self) -> typing.Dict[str, typing.Tuple[int, int, int]]:
+        snapshot = {}
+        for root_path in self.paths:
+            for directory, directory_names, file_names in os.walk(root_path):
+                for name in directory_names + file_names:
+                    self._add(snapshot, os.path.join(directory, name))
+            if not os.path.isdir(root_path):
+                self._add(snapshot, root_path)
+        return snapshot
+
+    @staticmethod
+    def _add(snapshot: dict, path: str) -> None:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        snapshot[path] = (stat.st_mtime_ns, stat.st_size, stat.st_mode)
+
+    def wait(self, timeout: typing.Optional[float]) -> typing.Set[str]:
+        """
+        Waits for changes.
+
+        :param timeout: Seconds to wait at most, None waits until something changes.
+        :type timeout: typing.Optional[float]
+        :return: The paths that have been created, changed or deleted, empty after a timeout.
+        :rtype: typing.Set[str]
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            time.sleep(self.interval if remaining is None else max(0.0, min(self.interval, remaining)))
+
+            snapshot = self._scan()
+            changes = {
+                path for path in set(snapshot) | set(self._snapshot)
+                if snapshot.get(path) != self._snapshot.get(path)
+            }
+            self._snapshot = snapshot
+
+            if changes or (deadline is not None and time.monotonic() >= deadline):
+                return changes
+
+    def close(self) -> None:
+        """Nothing to release, polling has no resources."""
+
+class InotifyWatcher:
+    """Detects changes with the inotify API of Linux, without scanning the tree."""
+
+    def __init__(self, paths: typing.Iterable[str]):
+        """
+        :param paths: Directories and files to watch, directories are watched recursively.
+        :type paths: typing.Iterable[str]
+        :raises OSError: If inotify isn't available.
+        """
+
+        library_name = ctypes.util.find_library("c")
+        self._libc = ctypes.CDLL(library_name, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError("inotify isn't available on this platform")
+
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.paths = [os.path.abspath(path) for path in paths]
+        self._directories = {}
+        for path in self.paths:
+            if os.path.isdir(path):
+                self._watch_tree(path)
+            else:
+                # Files are often replaced by editors, so their directory is watched
+                self._watch(os.path.dirname(path))
+
+    def _watch(self, directory: str) -> None:
+        descriptor = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), _WATCH_MASK)
+        if descriptor < 0:
+            LOGGER.debug("Unable to watch '%s': %s", directory, os.strerror(ctypes.get_errno()))
+            return
+        self._directories[descriptor] = directory
+
+    def _watch_tree(self, root: str) -> typing.Set[str]:
+        paths = set()
+        for directory, directory_names, file_names in os.walk(root):
+            self._watch(directory)
+            paths.update(os.path.join(directory, name) for name in directory_names + file_names)
+        return paths
+
+    def wait(self, timeout: typing.Optional[float]) -> typing.Set[str]:
+        """
+        Waits for changes.
+
+        :param timeout: Seconds to wait at most, None waits until something changes.
+        :type timeout: typing.Optional[float]
+        :return: The paths that have been created, changed or deleted, empty after a timeout.
+        :rtype: typing.Set[str]
+        """
+
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changes = set()
+        position = 0
+        while position + _EVENT_HEADER.size <= len(data):
+            descriptor, mask, _, name_size = _EVENT_HEADER.unpack_from(data, position)
+            position += _EVENT_HEADER.size
+            name = os.fsdecode(data[position:position + name_size].rstrip(b"\0"))
+            position += name_size
+
+            if mask & _IN_Q_OVERFLOW:
+                # Events have been lost, everything may have changed
+                changes.update(self.paths)
+                continue
+
+            directory = self._directories.get(descriptor)
+            if directory is None:
+                continue
+
+            path = os.path.join(directory, name) if name else directory
+            changes.add(path)
+            if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                # Files created before the directory is watched don't have events of their own
+                changes.update(self._watch_tree(path))
+
+        return changes
+
+    def close(self) -> None:
+        """Releases the inotify instance."""
+        os.close(self._fd)
+
+def create_watcher(paths: typing.Iterable[str], polling: bool = False) -> typing.Union[InotifyWatcher, PollingWatcher]:
+    """
+    Returns an inotify based watcher if it's available and a polling one otherwise.
+
+    :param paths: Directories and files to watch, directories are watched recursively.
+    :type paths: typing.Iterable[str]
+    :param polling: Whether to poll even if inotify is available, defaults to False
+    :type polling: bool, optional
+    :return: The watcher.
+    :rtype: typing.Union[InotifyWatcher, PollingWatcher]
+    """
+
+    paths = list(paths)
+    if not polling:
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError, TypeError) as error:
+            LOGGER.debug("Falling back to polling, inotify isn't available: %s", error)
+    return PollingWatcher(paths)
+
+def build_specs(specs: typing.Dict[str, Spec], names: typing.Iterable[str],
+                report: typing.Callable[[str], None] = print) -> typing.Dict[str, str]:
+    """
+    Builds the specs with the given names one after another. Failed builds are
+    reported and don't stop the others, so the watch mode keeps running.
+
+    :param specs: The spec of each function and layer by its name.
+    :type specs: typing.Dict[str, Spec]
+    :param names: Names of the specs to build.
+    :type names: typing.Iterable[str]
+    :param report: Function that prints the result of each build, defaults to print
+    :type report: typing.Callable[[str], None], optional
+    :return: The path to the artifact of each spec that has been built.
+    :rtype: typing.Dict[str, str]
+    """
+
+    artifacts = {}
+    for name in names:
+        start = time.perf_counter()
+        try:
+            artifacts[name] = bundler.build_spec(specs[name])
+        except Exception as error: # pylint: disable=broad-except
+            report(f"Failed to build {name}: {error}")
+            continue
+        report(f"Built {name} in {time.perf_counter() - start:.2f}s: {artifacts[name]}")
+    return artifacts
+
+def collect_changes(watcher: typing.Union[InotifyWatcher, PollingWatcher],
+                    debounce_seconds: float = DEFAULT_DEBOUNCE_SECONDS,
+                    timeout: float = None) -> typing.Set[str]:
+    """
+    Waits for the first change and then collects changes until there haven't been
+    any for debounce_seconds.
+
+    :param watcher: The watcher.
+    :type watcher: typing.Union[InotifyWatcher, PollingWatcher]
+    :param debounce_seconds: Quiet time that ends a batch of changes, defaults to DEFAULT_DEBOUNCE_SECONDS
+    :type debounce_seconds: float, optional
+    :param timeout: Seconds to wait for the first change, defaults to None which waits forever.
+    :type timeout: float, optional
+    :return: The changed paths, empty if nothing changed before the timeout.
+    :rtype: typing.Set[str]
+    """
+
+    changes = watcher.wait(timeout)
+    while changes:
+        more_changes = watcher.wait(debounce_seconds)
+        if not more_changes:
+            break
+        changes |= more_changes
+    return changes
+
+def watch(specs: typing.Dict[str, Spec], polling: bool = False,
+          debounce_seconds: float = DEFAULT_DEBOUNCE_SECONDS,
+          report: typing.Callable[[str], None] = print,
+          should_stop: typing.Callable[[], bool] = lambda: False) -> None:
+    """
+    Builds all specs and then rebuilds the ones whose code or requirements changed
+    until should_stop returns True or the process is interrupted.
+
+    :param specs: The spec of each function and layer by its name.
+    :type specs: typing.Dict[str, Spec]
+    :param polling: Whether to poll instead of using inotify, defaults to False
+    :type polling: bool, optional
+    :param debounce_seconds: Quiet time that ends a batch of changes, defaults to DEFAULT_DEBOUNCE_SECONDS
+    :type debounce_seconds: float, optional
+    :param report: Function that prints the result of each build, defaults to print
+    :type report: typing.Callable[[str], None], optional
+    :param should_stop: Function that is checked between batches of changes, defaults to never stopping.
+    :type should_stop: typing.Callable[[], bool], optional
+    :return: Nothing.
+    :rtype: None
+    """
+
+    watched_paths = sorted({path for spec in specs.values() for path in get_watched_paths(spec)})
+    watcher = create_watcher(watched_paths, polling)
+
+    try:
+        build_specs(specs, specs, report)
+        report(f"Watching {len(watched_paths)} paths with {type(watcher).__name__}, press Ctrl+C to stop")
+
+        while not should_stop():
+            changes = collect_changes(watcher, debounce_seconds, timeout=1.0)
+            affected = [name for name, spec in specs.items() if any(is_affected(spec, path) for path in changes)]
+            if affected:
+                build_specs(specs, affected, report)
+    finally:
+        watcher.close()
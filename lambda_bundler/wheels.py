@@ -0,0 +1,243 @@
+"""
+Contains the installer that writes wheels straight into archives. Wheels are zip
+archives already, so their entries are copied to the archive of a distribution
+without decompressing, compressing or extracting them to disk.
+"""
+import base64
+import csv
+import email.parser
+import hashlib
+import io
+import logging
+import re
+import typing
+import zipfile
+
+import lambda_bundler.archive as archive
+import lambda_bundler.budget as budget
+import lambda_bundler.slimming as slimming
+import lambda_bundler.tracing as tracing
+
+LOGGER = logging.getLogger("lambda_bundler")
+
+WHEEL_EXTENSION = ".whl"
+
+# Name of the tool that's recorded in the INSTALLER file of distributions
+INSTALLER_NAME = "lambda-bundler"
+
+# Major version of the wheel format this installer understands
+_SUPPORTED_WHEEL_VERSION = 1
+
+# Schemes of the .data directory that pip installs to the top of the target directory
+_ROOT_SCHEMES = {"purelib", "platlib", "data"}
+
+# Metadata that's written by the installer, the signatures of the RECORD become invalid when it's rewritten
+_REPLACED_FILES = {"INSTALLER", "RECORD", "RECORD.jws", "RECORD.p7s"}
+
+_WHEEL_NAME = re.compile(
+    r"^(?P<name>[^-]+)-(?P<version>[^-]+)(-(?P<build>\d[^-]*))?"
+    r"-(?P<python>[^-]+)-(?P<abi>[^-]+)-(?P<platform>[^-]+)\.whl$"
+)
+
+class WheelName(typing.NamedTuple):
+    """The parts of the file name of a wheel."""
+    name: str
+    version: str
+    build: typing.Optional[str]
+    python_tags: typing.Tuple[str, ...]
+    abi_tags: typing.Tuple[str, ...]
+    platform_tags: typing.Tuple[str, ...]
+
+class UnsupportedWheelError(Exception):
+    """Raised when a wheel can't be installed without pip."""
+
+def parse_wheel_name(filename: str) -> WheelName:
+    """
+    Splits the file name of a wheel into its parts, compressed tag sets like
+    py2.py3 are split into their tags.
+
+    :param filename: File name of the wheel, e.g. six-1.15.0-py2.py3-none-any.whl
+    :type filename: str
+    :raises ValueError: If filename isn't the name of a wheel.
+    :return: The parts of the name.
+    :rtype: WheelName
+    """
+
+    match = _WHEEL_NAME.match(filename.replace("\\", "/").split("/")[-1])
+    if match is None:
+        raise ValueError(f"'{filename}' is not the file name of a wheel")
+
+    return WheelName(
+        name=match.group("name"),
+        version=match.group("version"),
+        build=match.group("build"),
+        python_tags=tuple(match.group("python").split(".")),
+        abi_tags=tuple(match.group("abi").split(".")),
+        platform_tags=tuple(match.group("platform").split("."))
+    )
+
+def _hash_content(content: bytes) -> str:
+    digest = base64.urlsafe_b64encode(hashlib.sha256(content).digest()).rstrip(b"=").decode("ascii")
+    return f"sha256={digest}"
+
+def _find_dist_info(names: typing.List[str]) -> str:
+
+    dist_infos = sorted(set(
+        name.split("/")[0] for name in names
+        if name.count("/") == 1 and name.endswith("/WHEEL") and name.split("/")[0].endswith(".dist-info")
+    ))
+    if len(dist_infos) != 1:
+        raise UnsupportedWheelError(f"Expected one .dist-info directory, found {dist_infos}")
+    return dist_infos[0]
+
+def _check_wheel_version(wheel_zip: zipfile.ZipFile, dist_info: str) -> None:
+
+    metadata = email.parser.Parser().parsestr(wheel_zip.read(f"{dist_info}/WHEEL").decode("utf-8"))
+    wheel_version = metadata.get("Wheel-Version", "")
+    try:
+        major_version = int(wheel_version.split(".")[0])
+    except ValueError as error:
+        raise UnsupportedWheelError(f"Invalid Wheel-Version '{wheel_version}'") from error
+    if major_version != _SUPPORTED_WHEEL_VERSION:
+        raise UnsupportedWheelError(f"Unsupported Wheel-Version '{wheel_version}'")
+
+def get_install_names(path_to_wheel: str) -> typing.Dict[str, str]:
+    """
+    Returns where pip would install the entries of a wheel into a target directory.
+    Entries of the purelib, platlib and data schemes move to the top, the RECORD,
+    its signatures and the INSTALLER are left out because they're written anew.
+
+    :param path_to_wheel: Path to the wheel.
+    :type path_to_wheel: str
+    :raises UnsupportedWheelError: If the wheel has scripts, headers, unsafe paths or
+                                   an unknown format, these are left to pip.
+    :return: The installed name by the name of each entry in the wheel.
+    :rtype: typing.Dict[str, str]
+    """
+
+    with zipfile.ZipFile(path_to_wheel) as wheel_zip:
+        zip_infos = wheel_zip.infolist()
+        dist_info = _find_dist_info([zip_info.filename for zip_info in zip_infos])
+        _check_wheel_version(wheel_zip, dist_info)
+
+    data_directory = dist_info[:-len(".dist-info")] + ".data"
+    install_names = {}
+
+    for zip_info in zip_infos:
+        name = zip_info.filename
+
+        if zip_info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise UnsupportedWheelError(f"'{name}' uses the unsupported compression method {zip_info.compress_type}")
+        if name.startswith("/") or ".." in name.split("/"):
+            raise UnsupportedWheelError(f"'{name}' would be installed outside of the target directory")
+
+        if name.startswith(data_directory + "/"):
+            scheme, _, installed_name = name[len(data_directory) + 1:].partition("/")
+            if scheme not in _ROOT_SCHEMES:
+                # pip rewrites scripts for the interpreter it runs with
+                raise UnsupportedWheelError(f"The {scheme} scheme of '{name}' is installed by pip")
+            if not installed_name:
+                continue
+            name = installed_name
+        elif name.startswith(dist_info + "/") and name[len(dist_info) + 1:] in _REPLACED_FILES:
+            continue
+
+        install_names[zip_info.filename] = name
+
+    return install_names
+
+def _create_record(path_to_wheel: str, dist_info: str, install_names: typing.Dict[str, str],
+                   generated_files: typing.Dict[str, bytes]) -> bytes:
+
+    with zipfile.ZipFile(path_to_wheel) as wheel_zip:
+        try:
+            content = wheel_zip.read(f"{dist_info}/RECORD").decode("utf-8")
+        except KeyError:
+            content = ""
+
+    # The content of the entries doesn't change, only their names
+    recorded = {row[0]: row[1:3] for row in csv.reader(io.StringIO(content)) if len(row) >= 3}
+
+    rows = []
+    for source_name, installed_name in install_names.items():
+        if not installed_name.endswith("/"):
+            rows.append([installed_name] + recorded.get(source_name, ["", ""]))
+    for name, generated_content in generated_files.items():
+        rows.append([name, _hash_content(generated_content), str(len(generated_content))])
+    rows.append([f"{dist_info}/RECORD", "", ""])
+
+    record = io.StringIO()
+    csv.writer(record, lineterminator="\n").writerows(sorted(rows))
+    return record.getvalue().encode("utf-8")
+
+def _write_installed_files(writer: archive.ZipWriter, path_to_wheel: str, dist_info: str,
+                           install_names: typing.Dict[str, str], is_included: typing.Callable[[str], bool]) -> None:
+
+    archive.copy_entries(writer, path_to_wheel, rename=install_names.get)
+
+    installer_name = f"{dist_info}/INSTALLER"
+    generated_files = {installer_name: f"{INSTALLER_NAME}\n".encode("utf-8")} if is_included(installer_name) else {}
+    for name, content in generated_files.items():
+        writer.write(archive.compress_bytes(name, content))
+
+    if is_included(f"{dist_info}/RECORD"):
+        record = _create_record(path_to_wheel, dist_info, install_names, generated_files)
+        writer.write(archive.compress_bytes(f"{dist_info}/RECORD", record))
+
+def install_wheel(path_to_wheel: str, path_to_zip: str, include: typing.Callable[[str], bool] = None,
+                  size_budget: budget.SizeBudget = None, profile: slimming.SlimmingProfile = None) -> str:
+    """
+    Creates an archive at path_to_zip with the content pip would install from the wheel,
+    without extracting it. The compressed entries are copied as they are, the RECORD is
+    rewritten for the installed names and an INSTALLER is added. Bytecode isn't compiled
+    and the scripts of entry points aren't generated, Lambda doesn't use either.
+
+    :param path_to_wheel: Path to the wheel.
+    :type path_to_wheel: str
+    :param path_to_zip: Path to the archive.
+    :type path_to_zip: str
+    :param include: Function that decides by the installed name if a file is added, defaults to None
+                    which adds all. Use it to slim the distribution.
+    :type include: typing.Callable[[str], bool], optional
+    :param size_budget: Budget the archive has to fit into, defaults to None which means no budget.
+    :type size_budget: budget.SizeBudget, optional
+    :param profile: Slimming profile whose excluded files aren't added, defaults to None which excludes none.
+                    What it left out is logged with slimming.log_report, it can't strip binaries.
+    :type profile: slimming.SlimmingProfile, optional
+    :raises UnsupportedWheelError: If the wheel has to be installed by pip, nothing has been written then.
+    :raises budget.BudgetExceededError: If the archive grows beyond the budget.
+    :return: Path to the archive.
+    :rtype: str
+    """
+
+    def is_included(installed_name: str) -> bool:
+        if profile is not None and slimming.is_excluded(installed_name, profile):
+            return False
+        return include is None or include(installed_name)
+
+    with tracing.span("install_wheel", wheel=path_to_wheel) as attributes:
+        all_install_names = get_install_names(path_to_wheel)
+        with zipfile.ZipFile(path_to_wheel) as wheel_zip:
+            dist_info = _find_dist_info(wheel_zip.namelist())
+            file_sizes = {zip_info.filename: zip_info.file_size for zip_info in wheel_zip.infolist()}
+
+        install_names = {
+            source_name: installed_name for source_name, installed_name in all_install_names.items()
+            if is_included(installed_name)
+        }
+        with archive.ZipWriter.create(path_to_zip, size_budget) as writer:
+            _write_installed_files(writer, path_to_wheel, dist_info, install_names, is_included)
+
+        attributes["files"] = len(install_names)
+
+    if profile is not None:
+        # Binaries are copied as they are, only the excluded files are left out
+        excluded_names = [
+            source_name for source_name, installed_name in all_install_names.items()
+            if source_name not in install_names and not installed_name.endswith("/")
+        ]
+        report = slimming.SlimmingReport(len(excluded_names), sum(file_sizes[name] for name in excluded_names), 0)
+        slimming.log_report(path_to_wheel, profile, report)
+
+    LOGGER.debug("Installed '%s' to '%s' without extracting it", path_to_wheel, path_to_zip)
+    return path_to_zip
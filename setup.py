@@ -59,6 +59,14 @@ setuptools.setup(
         "Operating System :: OS Independent",
     ],
     python_requires='>=3.6',
+    install_requires=[
+        "packaging>=20.0"
+    ],
+    entry_points={
+        "console_scripts": [
+            "lambda-bundler=lambda_bundler.cli:main"
+        ]
+    },
     extras_require={
         "dev": [
             "pylint==2.5.3",
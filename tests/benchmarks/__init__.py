@@ -0,0 +1,7 @@
+"""
+Benchmarks for the lambda bundler.
+
+They build synthetic code trees and dependencies from a local package index,
+so the results only depend on the machine and the code. Run them with
+python -m tests.benchmarks and compare the results across commits.
+"""
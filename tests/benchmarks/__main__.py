@@ -0,0 +1,51 @@
+"""
+Command line interface of the benchmarks, run python -m tests.benchmarks --help
+"""
+import argparse
+import json
+import sys
+
+from tests.benchmarks import runner, trees
+
+def main(argv=None) -> int:
+    """
+    Runs the benchmarks, stores the results and compares them with a baseline.
+
+    :param argv: The command line arguments, defaults to None which means sys.argv.
+    :type argv: typing.List[str], optional
+    :return: The exit code, 1 if a scenario regressed.
+    :rtype: int
+    """
+
+    parser = argparse.ArgumentParser(prog="python -m tests.benchmarks", description=__doc__)
+    parser.add_argument("--shapes", default=",".join(trees.SHAPES),
+                        help=f"Comma separated code tree shapes, defaults to {','.join(trees.SHAPES)}.")
+    parser.add_argument("--skip-dependencies", action="store_true", help="Don't benchmark installing dependencies.")
+    parser.add_argument("--scale", type=float, default=1.0, help="Size factor of the scenarios, e.g. 0.1 for quick runs.")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per scenario, the median is reported.")
+    parser.add_argument("--output", help="Store the results as JSON in this file.")
+    parser.add_argument("--compare", help="Compare the results with the ones in this file.")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="Slowdown factor that counts as a regression, defaults to 1.25.")
+    arguments = parser.parse_args(argv)
+
+    shape_names = [name.strip() for name in arguments.shapes.split(",") if name.strip()]
+    unknown_shapes = [name for name in shape_names if name not in trees.SHAPES]
+    if unknown_shapes:
+        parser.error(f"Unknown shapes {unknown_shapes}, choose from {', '.join(trees.SHAPES)}")
+
+    results = runner.run(shape_names, not arguments.skip_dependencies, arguments.scale, arguments.repeat)
+
+    if arguments.output:
+        with open(arguments.output, "w") as handle:
+            json.dump(results, handle, indent=2)
+
+    if arguments.compare:
+        lines, regressed = runner.compare(runner.load_results(arguments.compare), results, arguments.threshold)
+        print("\n".join(lines))
+        return 1 if regressed else 0
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
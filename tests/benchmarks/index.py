@@ -0,0 +1,128 @@
+"""
+Builds synthetic wheels and serves them from a local, file based package index,
+so installing dependencies doesn't depend on the network or PyPI.
+"""
+import base64
+import hashlib
+import os
+import pathlib
+import re
+import typing
+import zipfile
+
+class SyntheticDistribution(typing.NamedTuple):
+    """A pure python distribution with generated modules."""
+    name: str
+    version: str
+    modules: int
+    module_size: int
+    requires: typing.Tuple[str, ...] = ()
+
+    @property
+    def wheel_name(self) -> str:
+        """The file name of the wheel."""
+        return f"{self.name}-{self.version}-py3-none-any.whl"
+
+def _record_line(arcname: str, content: bytes) -> str:
+    digest = base64.urlsafe_b64encode(hashlib.sha256(content).digest()).rstrip(b"=").decode("ascii")
+    return f"{arcname},sha256={digest},{len(content)}"
+
+def build_wheel(distribution: SyntheticDistribution, directory: str) -> str:
+    """
+    Builds the wheel of distribution in directory.
+
+    :param distribution: The distribution.
+    :type distribution: SyntheticDistribution
+    :param directory: The directory to write the wheel to.
+    :type directory: str
+    :return: Path to the wheel.
+    :rtype: str
+    """
+
+    dist_info = f"{distribution.name}-{distribution.version}.dist-info"
+    line = f"VALUE_{distribution.name.upper()} = {distribution.version!r}\n"
+
+    files = {f"{distribution.name}/__init__.py": line.encode("utf-8")}
+    for index in range(distribution.modules):
+        content = line * (distribution.module_size // len(line) + 1)
+        files[f"{distribution.name}/module_{index}.py"] = content[:distribution.module_size].encode("utf-8")
+
+    metadata = [
+        "Metadata-Version: 2.1",
+        f"Name: {distribution.name}",
+        f"Version: {distribution.version}",
+    ] + [f"Requires-Dist: {requirement}" for requirement in distribution.requires]
+    files[f"{dist_info}/METADATA"] = ("\n".join(metadata) + "\n").encode("utf-8")
+    files[f"{dist_info}/WHEEL"] = (
+        "Wheel-Version: 1.0\nGenerator: lambda-bundler-benchmarks\nRoot-Is-Purelib: true\nTag: py3-none-any\n"
+    ).encode("utf-8")
+
+    record = [_record_line(arcname, content) for arcname, content in files.items()] + [f"{dist_info}/RECORD,,"]
+    files[f"{dist_info}/RECORD"] = ("\n".join(record) + "\n").encode("utf-8")
+
+    path = os.path.join(directory, distribution.wheel_name)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as wheel:
+        for arcname, content in files.items():
+            wheel.writestr(arcname, content)
+    return path
+
+def create_index(directory: str, distributions: typing.Iterable[SyntheticDistribution]) -> str:
+    """
+    Creates a simple repository (PEP 503) with the wheels of distributions in directory.
+
+    :param directory: The directory of the index.
+    :type directory: str
+    :param distributions: The distributions to serve.
+    :type distributions: typing.Iterable[SyntheticDistribution]
+    :return: The file URL of the index, for pip's --index-url.
+    :rtype: str
+    """
+
+    root = os.path.join(directory, "simple")
+    links = []
+
+    for distribution in distributions:
+        # pip looks projects up by their normalized name
+        project_name = re.sub(r"[-_.]+", "-", distribution.name).lower()
+        project_directory = os.path.join(root, project_name)
+        pathlib.Path(project_directory).mkdir(parents=True, exist_ok=True)
+
+        wheel_path = build_wheel(distribution, project_directory)
+        with open(wheel_path, "rb") as handle:
+            digest = hashlib.sha256(handle.read()).hexdigest()
+
+        with open(os.path.join(project_directory, "index.html"), "w") as handle:
+            handle.write(f'<html><body><a href="{distribution.wheel_name}#sha256={digest}">'
+                         f"{distribution.wheel_name}</a></body></html>\n")
+        links.append(f'<a href="{project_name}/">{project_name}</a>')
+
+    with open(os.path.join(root, "index.html"), "w") as handle:
+        handle.write("<html><body>" + "".join(links) + "</body></html>\n")
+
+    return pathlib.Path(root).absolute().as_uri()
+
+def get_distributions(count: int, modules: int = 50, module_size: int = 2048) -> typing.List[SyntheticDistribution]:
+    """
+    Returns count distributions, each one depends on the next, so pip has to
+    resolve a chain of transitive dependencies.
+
+    :param count: Number of distributions.
+    :type count: int
+    :param modules: Number of modules per distribution, defaults to 50
+    :type modules: int, optional
+    :param module_size: Size of each module in bytes, defaults to 2048
+    :type module_size: int, optional
+    :return: The distributions.
+    :rtype: typing.List[SyntheticDistribution]
+    """
+
+    return [
+        SyntheticDistribution(
+            name=f"benchmark_dependency_{index}",
+            version="1.0.0",
+            modules=modules,
+            module_size=module_size,
+            requires=(f"benchmark_dependency_{index + 1}==1.0.0",) if index + 1 < count else ()
+        )
+        for index in range(count)
+    ]
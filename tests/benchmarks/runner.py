@@ -0,0 +1,239 @@
+"""
+Runs the benchmark scenarios and compares their results across commits.
+
+Every phase of a scenario runs in a fresh process, like a synth does. The
+caches live in the build directory on disk, so a warm phase sees what the
+cold phase left behind and the peak memory is the one of the phase alone.
+"""
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import typing
+
+from tests.benchmarks import index, trees
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+BUILD_DIR_ENV = "LAMBDA_BUNDLER_BUILD_DIR"
+
+# cold: empty build directory, warm: nothing changed, changed: one file or requirement changed
+PHASES = ["cold", "warm", "changed"]
+
+class Measurement(typing.NamedTuple):
+    """Duration and peak memory of one phase."""
+    seconds: float
+    peak_memory_bytes: typing.Optional[int]
+
+def _get_peak_memory() -> typing.Optional[int]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if platform.system() == "Darwin" else peak * 1024
+
+def _build_code(workspace: str) -> None:
+    import lambda_bundler.dependencies as dependencies # pylint: disable=import-outside-toplevel
+    dependencies.build_lambda_package_without_dependencies([os.path.join(workspace, "code")])
+
+def _extend(workspace: str) -> None:
+    import lambda_bundler.archive as archive # pylint: disable=import-outside-toplevel
+    path_to_zip = os.path.join(workspace, "extended.zip")
+    shutil.copyfile(os.path.join(workspace, "base.zip"), path_to_zip)
+    archive.extend_zip(path_to_zip, [os.path.join(workspace, "code")])
+
+def _build_dependencies(workspace: str) -> None:
+    import lambda_bundler.dependencies as dependencies # pylint: disable=import-outside-toplevel
+    with open(os.path.join(workspace, "requirements.txt")) as handle:
+        requirements_information = handle.read()
+    dependencies.create_or_return_zipped_dependencies(requirements_information, os.path.join(workspace, "build"))
+
+_TARGETS = {
+    "code": _build_code,
+    "extend": _extend,
+    "dependencies": _build_dependencies,
+}
+
+def _run_phase(target: str, workspace: str) -> Measurement:
+    # Runs in its own process
+    os.environ[BUILD_DIR_ENV] = os.path.join(workspace, "build")
+    os.environ.pop("PIP_CACHE_DIR", None)
+
+    start = time.perf_counter()
+    _TARGETS[target](workspace)
+    return Measurement(time.perf_counter() - start, _get_peak_memory())
+
+def _measure(target: str, workspace: str) -> Measurement:
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(_run_phase, (target, workspace))
+
+def _prepare_code(workspace: str, shape: trees.TreeShape) -> typing.Callable[[], None]:
+
+    paths = trees.create_tree(os.path.join(workspace, "code"), shape)
+
+    # A small archive like the dependencies extend_zip adds the code to
+    import lambda_bundler.archive as archive # pylint: disable=import-outside-toplevel
+    base_directory = os.path.join(workspace, "base")
+    trees.create_tree(base_directory, trees.TreeShape("base", 100, 1024, 2, 0), seed=1)
+    archive.zip_directory(base_directory, os.path.join(workspace, "base.zip"))
+
+    return lambda: trees.touch_file(paths[len(paths) // 2])
+
+def _prepare_dependencies(workspace: str, scale: float) -> typing.Callable[[], None]:
+
+    distributions = index.get_distributions(count=max(2, int(10 * scale)) + 1)
+    index_url = index.create_index(os.path.join(workspace, "index"), distributions)
+
+    requirements_path = os.path.join(workspace, "requirements.txt")
+    with open(requirements_path, "w") as handle:
+        handle.write(f"--index-url {index_url}\n{distributions[1].name}==1.0.0\n")
+
+    def change() -> None:
+        # Adding a requirement only installs the new distribution, the others are cached
+        with open(requirements_path, "a") as handle:
+            handle.write(f"{distributions[0].name}==1.0.0\n")
+
+    return change
+
+def run_scenario(target: str, shape: typing.Optional[trees.TreeShape], scale: float) -> typing.Dict[str, Measurement]:
+    """
+    Runs the cold, warm and changed phases of a scenario in a new workspace.
+
+    :param target: What is built: code, extend or dependencies.
+    :type target: str
+    :param shape: The shape of the code tree, None for dependencies.
+    :type shape: typing.Optional[trees.TreeShape]
+    :param scale: Factor for the size of the code tree or the number of dependencies.
+    :type scale: float
+    :return: The measurement of each phase.
+    :rtype: typing.Dict[str, Measurement]
+    """
+
+    with tempfile.TemporaryDirectory(prefix="lambda_bundler_benchmark_") as workspace:
+
+        if shape is None:
+            change = _prepare_dependencies(workspace, scale)
+        else:
+            change = _prepare_code(workspace, shape.scaled(scale))
+
+        measurements = {}
+        for phase in PHASES:
+            if phase == "changed":
+                change()
+            measurements[phase] = _measure(target, workspace)
+        return measurements
+
+def _get_commit() -> typing.Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, cwd=os.path.dirname(__file__)
+        ).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(shape_names: typing.Iterable[str], with_dependencies: bool = True, scale: float = 1.0,
+        repeat: int = 1, log: typing.Callable[[str], None] = print) -> dict:
+    """
+    Runs the scenarios for each shape and the dependency scenario and returns the results,
+    which can be stored as JSON and compared with the results of another commit.
+
+    :param shape_names: Names of the code tree shapes, see trees.SHAPES.
+    :type shape_names: typing.Iterable[str]
+    :param with_dependencies: Whether to run the dependency scenario, defaults to True
+    :type with_dependencies: bool, optional
+    :param scale: Factor for the size of the scenarios, defaults to 1.0
+    :type scale: float, optional
+    :param repeat: Number of runs of each scenario, the median is reported, defaults to 1
+    :type repeat: int, optional
+    :param log: Function that prints the progress, defaults to print
+    :type log: typing.Callable[[str], None], optional
+    :return: The results.
+    :rtype: dict
+    """
+
+    scenarios = [
+        (target, trees.SHAPES[name]) for name in shape_names for target in ["code", "extend"]
+    ]
+    if with_dependencies:
+        scenarios.append(("dependencies", None))
+
+    runs = {}
+    for target, shape in scenarios:
+        scenario = target if shape is None else f"{target}/{shape.name}"
+        for _ in range(repeat):
+            for phase, measurement in run_scenario(target, shape, scale).items():
+                runs.setdefault(f"{scenario}/{phase}", []).append(measurement)
+                log(f"{scenario}/{phase}: {measurement.seconds:.3f}s")
+
+    results = {}
+    for key, measurements in runs.items():
+        peaks = [measurement.peak_memory_bytes for measurement in measurements if measurement.peak_memory_bytes]
+        results[key] = {
+            "seconds": statistics.median(measurement.seconds for measurement in measurements),
+            "runs": [measurement.seconds for measurement in measurements],
+            "peak_memory_bytes": max(peaks) if peaks else None,
+        }
+
+    return {
+        "commit": _get_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "scale": scale,
+        "results": results,
+    }
+
+def compare(baseline: dict, current: dict, threshold: float) -> typing.Tuple[typing.List[str], bool]:
+    """
+    Compares the results of two runs.
+
+    :param baseline: The results to compare against.
+    :type baseline: dict
+    :param current: The new results.
+    :type current: dict
+    :param threshold: Ratio of the durations above which a scenario has regressed, e.g. 1.25
+    :type threshold: float
+    :return: A line per scenario and whether any scenario has regressed.
+    :rtype: typing.Tuple[typing.List[str], bool]
+    """
+
+    lines = []
+    regressed = False
+
+    for key, result in sorted(current["results"].items()):
+        baseline_result = baseline["results"].get(key)
+        if baseline_result is None:
+            lines.append(f"{key:<40} {result['seconds']:>9.3f}s  (new)")
+            continue
+
+        ratio = result["seconds"] / baseline_result["seconds"] if baseline_result["seconds"] else float("inf")
+        marker = ""
+        if ratio > threshold:
+            marker = "  REGRESSION"
+            regressed = True
+        lines.append(
+            f"{key:<40} {baseline_result['seconds']:>9.3f}s -> {result['seconds']:>9.3f}s  x{ratio:.2f}{marker}"
+        )
+
+    return lines, regressed
+
+def load_results(path: str) -> dict:
+    """
+    Loads results that have been stored as JSON.
+
+    :param path: Path to the file.
+    :type path: str
+    :return: The results.
+    :rtype: dict
+    """
+
+    with open(path) as handle:
+        return json.load(handle)
@@ -0,0 +1,116 @@
+"""
+Generates code trees of different shapes for the benchmarks.
+"""
+import os
+import pathlib
+import random
+import typing
+
+class TreeShape(typing.NamedTuple):
+    """Describes a synthetic code tree."""
+    name: str
+    files: int
+    file_size: int
+    depth: int
+    empty_directories: int
+
+    def scaled(self, scale: float) -> "TreeShape":
+        """
+        Returns the shape with the number of files and directories or, if there
+        are only a few files, their size multiplied by scale.
+
+        :param scale: The factor, 1 is the full size.
+        :type scale: float
+        :return: The scaled shape.
+        :rtype: TreeShape
+        """
+
+        if self.files <= 10:
+            return self._replace(file_size=max(1, int(self.file_size * scale)))
+        return self._replace(
+            files=max(1, int(self.files * scale)),
+            empty_directories=int(self.empty_directories * scale)
+        )
+
+SHAPES = {shape.name: shape for shape in [
+    # Typical for functions that vendor a lot of small modules
+    TreeShape("small_files", files=10000, file_size=512, depth=2, empty_directories=0),
+    # Models or other data shipped with the code, they dominate compression
+    TreeShape("huge_files", files=3, file_size=64 * 1024 * 1024, depth=1, empty_directories=0),
+    TreeShape("deep_nesting", files=1000, file_size=1024, depth=40, empty_directories=0),
+    TreeShape("empty_directories", files=100, file_size=1024, depth=3, empty_directories=5000),
+]}
+
+# Python-like lines, so the files compress like real code
+_WORDS = ["def", "return", "import", "value", "self", "handler", "event", "context", "for", "in", "if", "None"]
+
+def _create_content(size: int, generator: random.Random, compressible: bool) -> bytes:
+
+    if not compressible:
+        block_size = min(size, 1024 * 1024)
+        block = generator.getrandbits(8 * block_size).to_bytes(block_size, "little")
+        return (block * (size // block_size + 1))[:size]
+
+    lines = []
+    length = 0
+    while length < size:
+        line = " ".join(generator.choice(_WORDS) for _ in range(8)) + "\n"
+        lines.append(line)
+        length += len(line)
+    return "".join(lines).encode("utf-8")[:size]
+
+def _get_directory(root: str, index: int, shape: TreeShape) -> str:
+    # Spread the files across directories, deep trees put them along a single long path
+    if shape.depth <= 1:
+        return root
+    parts = [f"level_{level}" for level in range(shape.depth - 1)] if shape.depth > 3 else []
+    parts.append(f"package_{index % 100}")
+    return os.path.join(root, *parts)
+
+def create_tree(root: str, shape: TreeShape, seed: int = 0) -> typing.List[str]:
+    """
+    Creates a code tree with the given shape in root. The content only depends on
+    the shape and the seed, so every run benchmarks the same tree.
+
+    :param root: The directory to create the tree in.
+    :type root: str
+    :param shape: The shape of the tree.
+    :type shape: TreeShape
+    :param seed: Seed of the content, defaults to 0
+    :type seed: int, optional
+    :return: The paths of the files that have been created.
+    :rtype: typing.List[str]
+    """
+
+    generator = random.Random(seed)
+    paths = []
+
+    for index in range(shape.files):
+        directory = _get_directory(root, index, shape)
+        pathlib.Path(directory).mkdir(parents=True, exist_ok=True)
+
+        # Large files are binary data that doesn't compress well
+        compressible = shape.file_size < 1024 * 1024
+        name = f"module_{index}.py" if compressible else f"model_{index}.bin"
+        path = os.path.join(directory, name)
+        with open(path, "wb") as handle:
+            handle.write(_create_content(shape.file_size, generator, compressible))
+        paths.append(path)
+
+    for index in range(shape.empty_directories):
+        pathlib.Path(os.path.join(root, "empty", f"directory_{index}")).mkdir(parents=True, exist_ok=True)
+
+    return paths
+
+def touch_file(path: str) -> None:
+    """
+    Changes the content of the file at path, like an edit during development.
+
+    :param path: Path to the file.
+    :type path: str
+    :return: Nothing.
+    :rtype: None
+    """
+
+    with open(path, "ab") as handle:
+        handle.write(b"\n# changed\n")
@@ -0,0 +1,330 @@
+"""Tests for the lambda_bundler.archive module."""
+import io
+import os
+import pathlib
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from unittest.mock import patch
+
+import lambda_bundler.archive as target_module
+
+class ArchiveTestCases(unittest.TestCase):
+    """Test cases for the archive module"""
+
+    def setUp(self):
+        self.module = "lambda_bundler.archive."
+
+    def _create_sources(self, source_directory):
+        pathlib.Path(os.path.join(source_directory, "lambda", "empty")).mkdir(parents=True)
+        for index in range(20):
+            with open(os.path.join(source_directory, "lambda", f"module_{index}.py"), "w") as handle:
+                handle.write(f"value = {index}\n" * (index * 100))
+
+    def test_get_worker_count(self):
+        """Asserts the worker count defaults to the number of CPUs"""
+
+        self.assertEqual(3, target_module.get_worker_count(3))
+        self.assertEqual(os.cpu_count() or 1, target_module.get_worker_count())
+
+    def test_zip_writer_round_trip(self):
+        """Asserts archives from the ZipWriter can be read by zipfile"""
+
+        with tempfile.TemporaryDirectory() as source_directory:
+
+            self._create_sources(source_directory)
+
+            stream = io.BytesIO()
+            with target_module.ZipWriter(stream) as writer:
+                target_module.write_sources(
+                    writer,
+                    target_module.util.walk_directory(source_directory)
+                )
+
+            with zipfile.ZipFile(stream) as zip_file:
+                self.assertIsNone(zip_file.testzip())
+                self.assertIn("lambda/empty/", zip_file.namelist())
+                self.assertEqual(
+                    "value = 3\n" * 300,
+                    zip_file.read("lambda/module_3.py").decode("utf-8")
+                )
+
+    def test_chunked_stream(self):
+        """Asserts archives are handed on in chunks and failed ones aren't finished"""
+
+        with tempfile.TemporaryDirectory() as source_directory:
+
+            self._create_sources(source_directory)
+
+            chunks = []
+            with target_module.ChunkedStream(chunks.append, chunk_size=4096) as stream, \
+                target_module.ZipWriter(stream) as writer:
+                target_module.write_sources(writer, target_module.util.walk_directory(source_directory))
+
+            self.assertEqual(stream.tell(), writer.size)
+            self.assertTrue(all(len(chunk) == 4096 for chunk in chunks[:-1]))
+            with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as zip_file:
+                self.assertIsNone(zip_file.testzip())
+
+            chunks = []
+            with self.assertRaises(RuntimeError), target_module.ChunkedStream(chunks.append, chunk_size=4096) as stream:
+                stream.write(b"a" * 5000)
+                raise RuntimeError("failed")
+            self.assertEqual([b"a" * 4096], chunks)
+
+    def test_parallel_compression_is_deterministic(self):
+        """Asserts the number of workers doesn't change the archive"""
+
+        with tempfile.TemporaryDirectory() as source_directory, \
+            tempfile.TemporaryDirectory() as target_directory:
+
+            self._create_sources(source_directory)
+
+            sequential = target_module.zip_directory(
+                source_directory, os.path.join(target_directory, "sequential.zip"), workers=1
+            )
+            parallel = target_module.zip_directory(
+                source_directory, os.path.join(target_directory, "parallel.zip"), workers=8
+            )
+
+            with open(sequential, "rb") as sequential_handle, open(parallel, "rb") as parallel_handle:
+                self.assertEqual(sequential_handle.read(), parallel_handle.read())
+
+    def test_reproducible_archives(self):
+        """Asserts timestamps and permissions of the files don't change the archive"""
+
+        with tempfile.TemporaryDirectory() as source_directory, \
+            tempfile.TemporaryDirectory() as target_directory, \
+            patch.dict(os.environ, {"LAMBDA_BUNDLER_REPRODUCIBLE": "true"}):
+
+            self._create_sources(source_directory)
+            first = target_module.zip_directory(source_directory, os.path.join(target_directory, "first.zip"))
+
+            path = os.path.join(source_directory, "lambda", "module_3.py")
+            os.utime(path, (1600000000, 1600000000))
+            os.chmod(path, 0o664)
+            second = target_module.zip_directory(source_directory, os.path.join(target_directory, "second.zip"))
+
+            with open(first, "rb") as first_handle, open(second, "rb") as second_handle:
+                self.assertEqual(first_handle.read(), second_handle.read())
+
+            with zipfile.ZipFile(second) as zip_file:
+                zip_info = zip_file.getinfo("lambda/module_3.py")
+                self.assertEqual(target_module.ZIP_EPOCH, zip_info.date_time)
+                self.assertEqual(0o100644, zip_info.external_attr >> 16)
+
+            # Executables stay executable
+            os.chmod(path, 0o700)
+            self.assertEqual(0o100755, target_module.create_zip_info("module_3.py", os.stat(path)).external_attr >> 16)
+
+            with patch.dict(os.environ, {"SOURCE_DATE_EPOCH": "1600000000"}):
+                self.assertEqual((2020, 9, 13, 12, 26, 40), target_module.get_fixed_date_time())
+
+        with patch.dict(os.environ, {"LAMBDA_BUNDLER_REPRODUCIBLE": "false"}):
+            zip_info = target_module.create_zip_info("module_3.py", os.stat(__file__))
+            self.assertNotEqual(target_module.ZIP_EPOCH, zip_info.date_time)
+
+    def test_compress_source_uses_entry_cache(self):
+        """Asserts files with a known content hash are only compressed once"""
+
+        with tempfile.TemporaryDirectory() as source_directory, \
+            tempfile.TemporaryDirectory() as build_directory, \
+            patch(self.module + "util.get_build_dir") as gbd_mock:
+
+            gbd_mock.return_value = build_directory
+            self._create_sources(source_directory)
+
+            hashed_entries = target_module.cache.hash_sources(
+                os.path.join(source_directory, "lambda"), []
+            )
+
+            first = io.BytesIO()
+            with target_module.ZipWriter(first) as writer:
+                target_module.write_hashed_sources(writer, hashed_entries)
+
+            second = io.BytesIO()
+            with patch(self.module + "zlib.compressobj") as compress_mock, \
+                target_module.ZipWriter(second) as writer:
+                target_module.write_hashed_sources(writer, hashed_entries)
+                compress_mock.assert_not_called()
+
+            self.assertEqual(first.getvalue(), second.getvalue())
+
+            with zipfile.ZipFile(second) as zip_file:
+                self.assertIsNone(zip_file.testzip())
+
+    def test_compress_source_skips_cache_for_changed_content(self):
+        """Asserts content that doesn't match its hash isn't added to the entry cache"""
+
+        with tempfile.TemporaryDirectory() as source_directory, \
+            tempfile.TemporaryDirectory() as build_directory, \
+            patch(self.module + "util.get_build_dir") as gbd_mock, \
+            patch(self.module + "cache.store_compressed_entry") as store_mock:
+
+            gbd_mock.return_value = build_directory
+            self._create_sources(source_directory)
+
+            entry = next(target_module.util.walk_directory(source_directory))
+            compressed = target_module.compress_source(entry, content_hash="outdated")
+            compressed.data.close()
+
+            store_mock.assert_not_called()
+
+    def test_compression_policy(self):
+        """Asserts compressed content is stored and the preset decides the level of the rest"""
+
+        with tempfile.TemporaryDirectory() as source_directory, \
+            tempfile.TemporaryDirectory() as target_directory:
+
+            self._create_sources(source_directory)
+            payload = os.urandom(64 * 1024)
+            with open(os.path.join(source_directory, "lambda", "model.bin"), "wb") as handle:
+                handle.write(payload)
+
+            with patch.dict(os.environ, {"LAMBDA_BUNDLER_COMPRESSION": "fast"}):
+                fast = target_module.zip_directory(source_directory, os.path.join(target_directory, "fast.zip"))
+            with patch.dict(os.environ, {"LAMBDA_BUNDLER_COMPRESSION": "max"}):
+                maximum = target_module.zip_directory(source_directory, os.path.join(target_directory, "max.zip"))
+
+            with zipfile.ZipFile(fast) as fast_zip, zipfile.ZipFile(maximum) as max_zip:
+                self.assertIsNone(fast_zip.testzip())
+                self.assertEqual(zipfile.ZIP_STORED, fast_zip.getinfo("lambda/model.bin").compress_type)
+                self.assertEqual(payload, fast_zip.read("lambda/model.bin"))
+                self.assertEqual(zipfile.ZIP_DEFLATED, fast_zip.getinfo("lambda/module_19.py").compress_type)
+                self.assertEqual(fast_zip.read("lambda/module_19.py"), max_zip.read("lambda/module_19.py"))
+
+            self.assertLess(os.path.getsize(maximum), os.path.getsize(fast))
+
+    def test_zip_writer_aborts_over_budget(self):
+        """Asserts the writer stops as soon as the archive exceeds its budget"""
+
+        with tempfile.TemporaryDirectory() as source_directory:
+
+            self._create_sources(source_directory)
+
+            stream = io.BytesIO()
+            size_budget = target_module.budget.SizeBudget(None, 20000)
+            with self.assertRaises(target_module.budget.BudgetExceededError), \
+                target_module.ZipWriter(stream, size_budget=size_budget) as writer:
+                target_module.write_sources(writer, target_module.util.walk_directory(source_directory))
+
+            # The data of the entry that crossed the budget hasn't been written
+            self.assertLess(len(stream.getvalue()), 20000)
+
+    def test_copy_entries(self):
+        """Asserts entries are copied to another archive with a prefix and without duplicates"""
+
+        with tempfile.TemporaryDirectory() as source_directory, \
+            tempfile.TemporaryDirectory() as target_directory:
+
+            self._create_sources(source_directory)
+            source_zip = target_module.zip_directory(
+                source_directory, os.path.join(target_directory, "source.zip")
+            )
+
+            stream = io.BytesIO()
+            with target_module.ZipWriter(stream) as writer:
+                target_module.copy_entries(writer, source_zip, prefix="python")
+                target_module.copy_entries(writer, source_zip, prefix="python")
+
+            with zipfile.ZipFile(stream) as zip_file, zipfile.ZipFile(source_zip) as source:
+                self.assertIsNone(zip_file.testzip())
+                self.assertEqual(
+                    ["python/" + name for name in source.namelist()],
+                    zip_file.namelist()
+                )
+                self.assertEqual(
+                    source.read("lambda/module_7.py"),
+                    zip_file.read("python/lambda/module_7.py")
+                )
+
+            # Only the included entries are copied
+            stream = io.BytesIO()
+            with target_module.ZipWriter(stream) as writer:
+                target_module.copy_entries(writer, source_zip, include=lambda name: name.endswith("_7.py"))
+
+            with zipfile.ZipFile(stream) as zip_file:
+                self.assertEqual(["lambda/module_7.py"], zip_file.namelist())
+
+    def test_extend_zip(self):
+        """Asserts that extend_zip works as intended"""
+
+        with tempfile.TemporaryDirectory() as source_directory, \
+            tempfile.TemporaryDirectory() as target_directory, \
+            tempfile.TemporaryDirectory() as assertion_directory, \
+            patch(self.module + "util.get_build_dir") as gbd_mock:
+
+            gbd_mock.return_value = target_directory
+
+            directories_in_source = ["src/lambda", "tests"]
+
+            for directory in directories_in_source:
+                pathlib.Path(os.path.join(source_directory, directory)).mkdir(parents=True, exist_ok=True)
+
+            pathlib.Path(os.path.join(source_directory, "initial")).mkdir(parents=True, exist_ok=True)
+            with open(os.path.join(source_directory, "initial", "test.txt"), "w") as handle:
+                handle.write("test-content")
+
+            with open(os.path.join(source_directory, "src", "lambda", "handler.py"), "w") as handle:
+                handle.write("test-content")
+
+            zip_path = os.path.join(target_directory, "target")
+            shutil.make_archive(zip_path, "zip", os.path.join(source_directory, "initial"))
+
+            # Verify the test setup was ok
+            self.assertTrue(os.path.exists(zip_path + ".zip"))
+
+            target_module.extend_zip(
+                path_to_zip=zip_path + ".zip",
+                code_directories=[
+                    os.path.join(source_directory, "src"),
+                    os.path.join(source_directory, "tests")
+                ]
+            )
+
+            # Verify the zip still exists
+            self.assertTrue(os.path.exists(zip_path + ".zip"))
+
+            # Extract the zip
+            shutil.unpack_archive(zip_path + ".zip", assertion_directory)
+
+            # Assert that our code directories exist
+            self.assertTrue(os.path.exists(os.path.join(assertion_directory, "src", "lambda", "handler.py")))
+            self.assertTrue(os.path.exists(os.path.join(assertion_directory, "tests")))
+
+            # Assert that the content of our initial zip is there as well
+            self.assertTrue(os.path.exists(os.path.join(assertion_directory, "test.txt")))
+
+            with zipfile.ZipFile(zip_path + ".zip") as zip_file:
+                self.assertIsNone(zip_file.testzip())
+
+    def test_extend_zip_keeps_archive_on_error(self):
+        """Asserts the archive is left as it was if extending it aborts"""
+
+        with tempfile.TemporaryDirectory() as source_directory, \
+            tempfile.TemporaryDirectory() as target_directory, \
+            tempfile.TemporaryDirectory() as build_directory, \
+            patch(self.module + "util.get_build_dir", return_value=build_directory):
+
+            self._create_sources(source_directory)
+
+            zip_path = os.path.join(target_directory, "target.zip")
+            with zipfile.ZipFile(zip_path, "w") as zip_file:
+                zip_file.writestr("initial.txt", "test-content")
+
+            with self.assertRaises(target_module.budget.BudgetExceededError):
+                target_module.extend_zip(
+                    zip_path, [source_directory], size_budget=target_module.budget.SizeBudget(None, 20000)
+                )
+
+            with zipfile.ZipFile(zip_path) as zip_file:
+                self.assertIsNone(zip_file.testzip())
+                self.assertEqual(["initial.txt"], zip_file.namelist())
+
+            # The copy the entries were added to is gone
+            self.assertEqual(["target.zip"], os.listdir(target_directory))
+
+if __name__ == "__main__":
+    unittest.main()
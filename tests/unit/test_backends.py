@@ -0,0 +1,55 @@
+"""Tests for the lambda_bundler.backends module."""
+import os
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+import lambda_bundler.backends as target_module
+
+class BackendsTestCases(unittest.TestCase):
+    """Test cases for the shared cache backends"""
+
+    def test_directory_backend(self):
+        """Asserts artifacts can be published to and fetched from a directory"""
+
+        with tempfile.TemporaryDirectory() as shared_directory, \
+            tempfile.TemporaryDirectory() as local_directory:
+
+            backend = target_module.DirectoryBackend(shared_directory)
+            source_path = os.path.join(local_directory, "source.zip")
+            destination_path = os.path.join(local_directory, "destination.zip")
+            with open(source_path, "wb") as handle:
+                handle.write(b"artifact")
+
+            self.assertFalse(backend.lookup("abcdef"))
+            self.assertFalse(backend.fetch("abcdef", destination_path))
+
+            backend.publish("abcdef", source_path)
+
+            self.assertTrue(backend.lookup("abcdef"))
+            self.assertTrue(backend.fetch("abcdef", destination_path))
+            with open(destination_path, "rb") as handle:
+                self.assertEqual(b"artifact", handle.read())
+
+            # Only the artifact is left in the shared directory
+            self.assertEqual(["abcdef.zip"], os.listdir(os.path.join(shared_directory, "ab")))
+
+    def test_get_backend(self):
+        """Asserts the backend that has been set takes precedence over the environment"""
+
+        with patch.dict(os.environ, {target_module.SHARED_CACHE_DIR_ENV: "/mnt/cache"}):
+            self.assertEqual("/mnt/cache", target_module.get_backend().directory)
+
+            backend = target_module.DirectoryBackend("/other")
+            target_module.set_backend(backend)
+            try:
+                self.assertIs(backend, target_module.get_backend())
+            finally:
+                target_module.set_backend(None)
+
+        with patch.dict(os.environ, clear=True):
+            self.assertIsNone(target_module.get_backend())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+"""Tests for the lambda_bundler.budget module."""
+import io
+import os
+import pickle
+import tempfile
+import unittest
+import zipfile
+
+from unittest.mock import patch
+
+import lambda_bundler.budget as target_module
+
+class BudgetTestCases(unittest.TestCase):
+    """Test cases for the budget module"""
+
+    def setUp(self):
+        self.module = "lambda_bundler.budget."
+
+    def _create_archive(self, path):
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.writestr("python/requests/__init__.py", "a" * 1000)
+            zip_file.writestr("python/requests/api.py", "b" * 3000)
+            zip_file.writestr("python/six.py", os.urandom(2000))
+            zip_file.writestr("python/requests-2.0.dist-info/", "")
+        return path
+
+    def test_get_budget(self):
+        """Asserts the budget defaults to the unzipped limit of Lambda and can be changed or disabled"""
+
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertEqual(
+                target_module.SizeBudget(None, 250 * 1024 ** 2),
+                target_module.get_budget()
+            )
+
+        with patch.dict(os.environ, {"LAMBDA_BUNDLER_MAX_ZIPPED_BYTES": "50M"}):
+            self.assertEqual(50 * 1024 ** 2, target_module.get_budget().max_compressed_bytes)
+
+        with patch.dict(os.environ, {"LAMBDA_BUNDLER_MAX_ZIPPED_BYTES": "none",
+                                     "LAMBDA_BUNDLER_MAX_UNZIPPED_BYTES": "100M"}):
+            self.assertEqual(target_module.SizeBudget(None, 100 * 1024 ** 2), target_module.get_budget())
+
+        with patch.dict(os.environ, {"LAMBDA_BUNDLER_MAX_UNZIPPED_BYTES": "huge"}):
+            self.assertEqual(250 * 1024 ** 2, target_module.get_budget().max_uncompressed_bytes)
+
+    def test_get_package_name(self):
+        """Asserts entries are attributed to their top-level package"""
+
+        self.assertEqual("requests", target_module.get_package_name("python/requests/api.py"))
+        self.assertEqual("six.py", target_module.get_package_name("six.py"))
+        self.assertEqual("python", target_module.get_package_name("python/"))
+
+    def test_analyze_archive(self):
+        """Asserts the sizes are reported per package, directory and file"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = self._create_archive(os.path.join(directory, "layer.zip"))
+            report = target_module.analyze_archive(path)
+
+        self.assertEqual(6000, report.uncompressed_bytes)
+        self.assertEqual(3, report.file_count)
+
+        packages = {entry.name: entry for entry in report.packages}
+        self.assertEqual({"requests", "six.py"}, set(packages))
+        self.assertEqual(4000, packages["requests"].uncompressed_bytes)
+        self.assertEqual(2, packages["requests"].file_count)
+        # Random data doesn't compress, so six is the largest
+        self.assertEqual("six.py", report.packages[0].name)
+
+        directories = {entry.name: entry for entry in report.directories}
+        self.assertEqual(6000, directories["python/"].uncompressed_bytes)
+        self.assertEqual(4000, directories["python/requests/"].uncompressed_bytes)
+
+        self.assertEqual(3, len(report.files))
+        self.assertEqual("python/six.py", report.to_dict()["files"][0]["name"])
+
+    def test_size_tracker(self):
+        """Asserts the tracker raises as soon as a total exceeds the budget"""
+
+        tracker = target_module.SizeTracker(target_module.SizeBudget(None, 1500), "layer.zip")
+
+        zip_info = zipfile.ZipInfo("python/requests/api.py")
+        zip_info.file_size = zip_info.compress_size = 1000
+        tracker.add(zip_info)
+
+        with self.assertRaises(target_module.BudgetExceededError) as context:
+            tracker.add(zip_info)
+
+        self.assertEqual(2000, context.exception.uncompressed_bytes)
+        self.assertIn("1500 uncompressed bytes", str(context.exception))
+        self.assertIn("requests (2000 bytes)", str(context.exception))
+
+    def test_check_archive(self):
+        """Asserts finished archives are checked against the budget"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = self._create_archive(os.path.join(directory, "layer.zip"))
+
+            target_module.check_archive(path, target_module.get_budget())
+            target_module.check_archive(path, target_module.UNLIMITED)
+
+            with self.assertRaises(target_module.BudgetExceededError):
+                target_module.check_archive(path, target_module.SizeBudget(1024, None))
+
+    def test_pickle_budget_exceeded_error(self):
+        """Asserts the error survives being passed back from a worker process"""
+
+        error = target_module.BudgetExceededError("too large", 10, 20, target_module.SizeBudget(5, None))
+        restored = pickle.loads(pickle.dumps(error))
+
+        self.assertEqual("too large", str(restored))
+        self.assertEqual((10, 20), (restored.compressed_bytes, restored.uncompressed_bytes))
+        self.assertEqual(target_module.SizeBudget(5, None), restored.size_budget)
+
+if __name__ == "__main__":
+    unittest.main()
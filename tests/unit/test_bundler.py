@@ -1,10 +1,26 @@
 """
 Tests for the lambda_bundler.bundler module.
 """
+import io
+import os
+import pathlib
+import tempfile
+import threading
 import unittest
+import zipfile
 from unittest.mock import patch, ANY
 
 import lambda_bundler.bundler as target_module
+import lambda_bundler.dependencies as dependencies
+
+def _distribution(name, version="1.0", requires=()):
+    return dependencies.Distribution(name, version, f"{name}=={version}", f"key-{name}-{version}", requires)
+
+def _fake_install(distribution, requirements_information, output_directory_path, workers=None):
+    path = os.path.join(output_directory_path, f"{distribution.cache_key}.zip")
+    with zipfile.ZipFile(path, "w") as zip_file:
+        zip_file.writestr(f"{distribution.name}/__init__.py", distribution.requirement * 100)
+    return path
 
 class TestBundler(unittest.TestCase):
     """
@@ -18,7 +34,9 @@ class TestBundler(unittest.TestCase):
         """Asserts build_layer_package orchestrates the functions as expected."""
 
         with patch(self.module + "dependencies.collect_and_merge_requirements") as collect_mock, \
-            patch(self.module + "dependencies.create_or_return_zipped_dependencies") as zip_mock:
+            patch(self.module + "dependencies.create_or_return_zipped_dependencies") as zip_mock, \
+            patch(self.module + "cache.enforce_limits") as limits_mock, \
+            patch(self.module + "budget.check_archive") as check_mock:
 
             zip_mock.return_value = "some/path.zip"
 
@@ -31,15 +49,21 @@ class TestBundler(unittest.TestCase):
             zip_mock.assert_called_with(
                 requirements_information=ANY,
                 output_directory_path=ANY,
-                prefix_in_zip="python"
+                prefix_in_zip="python",
+                workers=None,
+                size_budget=target_module.budget.get_budget()
             )
 
             self.assertEqual("some/path.zip", result)
+            limits_mock.assert_called_once_with()
+            check_mock.assert_called_once_with("some/path.zip", target_module.budget.get_budget())
 
     def test_build_lambda_package(self):
         """Assert this function calls the right subroutines"""
 
-        with patch(self.module + "dependencies.build_lambda_package_without_dependencies") as wo_mock:
+        with patch(self.module + "dependencies.build_lambda_package_without_dependencies") as wo_mock, \
+            patch(self.module + "cache.enforce_limits"), \
+            patch(self.module + "budget.check_archive"):
 
             wo_mock.return_value = "without_dependencies.zip"
 
@@ -50,28 +74,377 @@ class TestBundler(unittest.TestCase):
 
             wo_mock.assert_called_once_with(
                 code_directories=["abc"],
-                exclude_patterns=["def"]
+                exclude_patterns=["def"],
+                workers=None,
+                size_budget=target_module.budget.get_budget()
             )
 
             self.assertEqual("without_dependencies.zip", return_value)
 
-        with patch(self.module + "dependencies.build_lambda_package_with_dependencies") as w_mock:
+        size_budget = target_module.budget.SizeBudget(1024, None)
+        with patch(self.module + "dependencies.build_lambda_package_with_dependencies") as w_mock, \
+            patch(self.module + "cache.enforce_limits"), \
+            patch(self.module + "budget.check_archive") as check_mock:
 
             w_mock.return_value = "with_dependencies.zip"
 
             result = target_module.build_lambda_package(
                 code_directories=["abc"],
                 requirement_files=["ghi"],
-                exclude_patterns=["def"]
+                exclude_patterns=["def"],
+                size_budget=size_budget
             )
 
             w_mock.assert_called_once_with(
                 code_directories=["abc"],
                 requirement_files=["ghi"],
-                exclude_patterns=["def"]
+                exclude_patterns=["def"],
+                workers=None,
+                handler_modules=None,
+                dynamic_imports=None,
+                size_budget=size_budget
             )
 
             self.assertEqual("with_dependencies.zip", result)
+            check_mock.assert_called_once_with("with_dependencies.zip", size_budget)
+
+    def test_specs_are_hashable(self):
+        """Assert specs built from lists can be used as keys"""
+
+        spec = target_module.PackageSpec(["abc"], requirement_files=["def"])
+
+        self.assertEqual(target_module.PackageSpec(("abc",), ("def",)), spec)
+        self.assertIsNone(spec.exclude_patterns)
+        self.assertEqual({spec: "a"}, {target_module.PackageSpec(["abc"], ["def"]): "a"})
+        self.assertEqual(("abc",), target_module.LayerSpec(["abc"]).requirement_files)
+
+    def test_build_many_deduplicates_dependencies(self):
+        """Assert build_many installs identical dependencies once and returns a path per spec"""
+
+        layer = target_module.LayerSpec(["requirements.txt"])
+        package_1 = target_module.PackageSpec(["a"], ["requirements.txt"])
+        package_2 = target_module.PackageSpec(["b"], ["other_requirements.txt"])
+        code_only = target_module.PackageSpec(["c"])
+
+        with patch(self.module + "dependencies.collect_and_merge_requirements") as collect_mock, \
+            patch(self.module + "dependencies.create_or_return_zipped_dependencies") as zip_mock, \
+            patch(self.module + "dependencies.build_lambda_package_with_dependencies") as w_mock, \
+            patch(self.module + "dependencies.build_lambda_package_without_dependencies") as wo_mock, \
+            patch(self.module + "cache.enforce_limits"), \
+            patch(self.module + "budget.check_archive"):
+
+            collect_mock.return_value = "pytz"
+            zip_mock.side_effect = lambda prefix_in_zip, **_: f"{prefix_in_zip}.zip"
+            w_mock.side_effect = lambda code_directories, **_: f"{code_directories[0]}.zip"
+            wo_mock.return_value = "c.zip"
+
+            result = target_module.build_many([layer, package_1, package_2, code_only], max_workers=1)
+
+            self.assertEqual(
+                {layer: "python.zip", package_1: "a.zip", package_2: "b.zip", code_only: "c.zip"},
+                result
+            )
+
+            # Once for the layer and once for both packages with the same merged requirements
+            # while warming up the cache, once more when building the layer itself.
+            self.assertEqual(3, zip_mock.call_count)
+            self.assertEqual(2, w_mock.call_count)
+
+    def test_build_many_in_processes(self):
+        """Assert build_many builds code-only packages in a process pool"""
+
+        with tempfile.TemporaryDirectory() as source_directory, \
+            tempfile.TemporaryDirectory() as build_directory, \
+            patch.dict(os.environ, {"LAMBDA_BUNDLER_BUILD_DIR": build_directory}):
+
+            specs = []
+            for name in ["first", "second", "third"]:
+                pathlib.Path(os.path.join(source_directory, name)).mkdir()
+                with open(os.path.join(source_directory, name, "handler.py"), "w") as handle:
+                    handle.write(name)
+                specs.append(target_module.PackageSpec([os.path.join(source_directory, name)]))
+
+            result = target_module.build_many(specs, max_workers=2)
+
+            self.assertEqual(set(specs), set(result))
+            for spec, path in result.items():
+                name = os.path.basename(spec.code_directories[0])
+                with zipfile.ZipFile(path) as zip_file:
+                    self.assertEqual(name, zip_file.read(f"{name}/handler.py").decode("utf-8"))
+
+    def test_write_package(self):
+        """Assert packages and layers are written to streams and chunk functions"""
+
+        with tempfile.TemporaryDirectory() as source_directory, \
+            tempfile.TemporaryDirectory() as build_directory, \
+            patch.dict(os.environ, {"LAMBDA_BUNDLER_BUILD_DIR": build_directory}):
+
+            with open(os.path.join(source_directory, "handler.py"), "w") as handle:
+                handle.write("handler")
+            spec = target_module.PackageSpec([source_directory])
+
+            stream = io.BytesIO()
+            size = target_module.write_package(stream, spec)
+
+            self.assertEqual(len(stream.getvalue()), size)
+            with zipfile.ZipFile(stream) as zip_file:
+                name = os.path.basename(source_directory)
+                self.assertEqual(b"handler", zip_file.read(f"{name}/handler.py"))
+            # Nothing but the entry cache ends up in the build directory
+            self.assertFalse([name for name in os.listdir(build_directory) if name.endswith(".zip")])
+
+            chunks = []
+            target_module.write_package(chunks.append, spec)
+            self.assertEqual([stream.getvalue()], chunks)
+
+            layer_path = os.path.join(build_directory, "layer.zip")
+            with open(layer_path, "wb") as handle:
+                handle.write(b"layer")
+
+            with patch(self.module + "BuildSession.build_layer_package", return_value=layer_path) as layer_mock:
+                stream = io.BytesIO()
+                self.assertEqual(5, target_module.write_package(stream, target_module.LayerSpec(["requirements.txt"])))
+                self.assertEqual(b"layer", stream.getvalue())
+                layer_mock.assert_called_once_with(["requirements.txt"], None, target_module.budget.get_budget())
+
+    def test_write_package_skip_install(self):
+        """Assert nothing is written when the installation is skipped, like the other builds return an empty archive"""
+
+        with tempfile.TemporaryDirectory() as build_directory:
+            session = target_module.BuildSession(
+                build_dir=build_directory, settings={"LAMBDA_BUNDLER_SKIP_INSTALL": "true"}
+            )
+            spec = target_module.PackageSpec([build_directory], requirement_files=["requirements.txt"])
+
+            chunks = []
+            self.assertEqual(0, session.write_package(chunks.append, spec))
+            self.assertEqual([], chunks)
+
+            stream = io.BytesIO()
+            self.assertEqual(0, session.write_package(stream, target_module.LayerSpec(["requirements.txt"])))
+            self.assertEqual(b"", stream.getvalue())
+
+    def test_session_merges_requirements_once(self):
+        """Assert a session merges requirement files again only when they or their includes change"""
+
+        with tempfile.TemporaryDirectory() as source_directory:
+
+            base_path = os.path.join(source_directory, "base.txt")
+            with open(base_path, "w") as handle:
+                handle.write("pytz")
+            requirements_path = os.path.join(source_directory, "requirements.txt")
+            with open(requirements_path, "w") as handle:
+                handle.write("-r base.txt\nsix")
+
+            session = target_module.BuildSession()
+            with patch(self.module + "dependencies.collect_and_merge_requirements",
+                       wraps=target_module.dependencies.collect_and_merge_requirements) as collect_mock:
+
+                for _ in range(3):
+                    self.assertEqual("pytz\nsix", session.merge_requirements([requirements_path]))
+                self.assertEqual(1, collect_mock.call_count)
+
+                with open(base_path, "w") as handle:
+                    handle.write("pytz==2020.1")
+                self.assertEqual("pytz==2020.1\nsix", session.merge_requirements([requirements_path]))
+                self.assertEqual(2, collect_mock.call_count)
+
+                # Other sessions don't share what has been merged
+                target_module.BuildSession().merge_requirements([requirements_path])
+                self.assertEqual(3, collect_mock.call_count)
+
+    def test_sessions_in_threads(self):
+        """Assert sessions with different configurations build at the same time"""
+
+        with tempfile.TemporaryDirectory() as source_directory, \
+            tempfile.TemporaryDirectory() as first_directory, \
+            tempfile.TemporaryDirectory() as second_directory:
+
+            with open(os.path.join(source_directory, "handler.py"), "w") as handle:
+                handle.write("handler")
+
+            sessions = [
+                target_module.BuildSession(build_dir=first_directory, compression_preset="fast"),
+                target_module.BuildSession(build_dir=second_directory, compression_preset="max")
+            ]
+            results = {}
+            threads = [
+                threading.Thread(target=lambda session=session: results.setdefault(
+                    session, session.build_lambda_package([source_directory])
+                ))
+                for session in sessions
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual(first_directory, os.path.dirname(results[sessions[0]]))
+            self.assertEqual(second_directory, os.path.dirname(results[sessions[1]]))
+            # The compression is part of the name of the archive
+            self.assertNotEqual(os.path.basename(results[sessions[0]]), os.path.basename(results[sessions[1]]))
+
+            with self.assertRaises(ValueError):
+                target_module.BuildSession(compression_preset="unknown")
+
+    def test_session_enforces_limits_once(self):
+        """Assert a session used as a context manager enforces the limits when it's closed"""
+
+        with patch(self.module + "dependencies.build_lambda_package_without_dependencies", return_value="a.zip"), \
+            patch(self.module + "budget.check_archive"), \
+            patch(self.module + "cache.enforce_limits") as limits_mock:
+
+            with target_module.BuildSession(workers=2) as session:
+                session.build_lambda_package(["a"])
+                session.build_lambda_package(["b"])
+                limits_mock.assert_not_called()
+
+            limits_mock.assert_called_once_with()
+
+            session.build_lambda_package(["c"])
+            self.assertEqual(2, limits_mock.call_count)
+
+            # Worker processes leave the limits to the session that started them
+            target_module._call_in_worker_session({}, "build_lambda_package", (["d"],))
+            self.assertEqual(2, limits_mock.call_count)
+
+            # Other threads don't wait for the block of one thread to end
+            with session:
+                thread = threading.Thread(target=session.build_lambda_package, args=(["e"],))
+                thread.start()
+                thread.join()
+                self.assertEqual(3, limits_mock.call_count)
+
+                session.build_lambda_package(["f"])
+                self.assertEqual(3, limits_mock.call_count)
+
+            self.assertEqual(4, limits_mock.call_count)
+
+    def test_build_with_shared_layer(self):
+        """Asserts shared distributions end up in the layer and the rest in the packages"""
+
+        with tempfile.TemporaryDirectory() as source_directory, \
+            tempfile.TemporaryDirectory() as build_directory, \
+            patch.dict(os.environ, {"LAMBDA_BUNDLER_BUILD_DIR": build_directory}), \
+            patch(self.module + "layers.resolve_requirements") as resolve_mock, \
+            patch(self.module + "dependencies.create_or_return_zipped_distribution", side_effect=_fake_install):
+
+            resolved = {
+                "boto3\npandas": [_distribution("boto3"), _distribution("pandas")],
+                "boto3\nsix": [_distribution("boto3"), _distribution("six")],
+            }
+            resolve_mock.side_effect = resolved.get
+
+            specs = []
+            for name, requirements in [("first", "boto3\npandas"), ("second", "boto3\nsix"), ("third", None)]:
+                pathlib.Path(os.path.join(source_directory, name)).mkdir()
+                with open(os.path.join(source_directory, name, "handler.py"), "w") as handle:
+                    handle.write(name)
+                requirement_files = None
+                if requirements is not None:
+                    requirement_files = [os.path.join(source_directory, f"{name}.txt")]
+                    with open(requirement_files[0], "w") as handle:
+                        handle.write(requirements)
+                specs.append(target_module.PackageSpec(
+                    [os.path.join(source_directory, name)], requirement_files
+                ))
+
+            result = target_module.build_with_shared_layer(specs)
+
+            self.assertEqual([_distribution("boto3")], result.shared_distributions)
+            self.assertEqual(specs[:2], result.layer_users)
+            self.assertEqual(set(specs), set(result.package_paths))
+            self.assertGreater(result.bytes_saved, 0)
+
+            with zipfile.ZipFile(result.layer_path) as zip_file:
+                self.assertEqual(["python/boto3/__init__.py"], zip_file.namelist())
+
+            with zipfile.ZipFile(result.package_paths[specs[0]]) as zip_file:
+                self.assertEqual(["first/handler.py", "pandas/__init__.py"], sorted(zip_file.namelist()))
+
+            with zipfile.ZipFile(result.package_paths[specs[2]]) as zip_file:
+                self.assertEqual(["third/handler.py"], zip_file.namelist())
+
+            # Nothing is resolved and every package is the empty archive like with build_lambda_package
+            resolve_mock.reset_mock()
+            with patch.dict(os.environ, {"LAMBDA_BUNDLER_SKIP_INSTALL": "true"}):
+                result = target_module.build_with_shared_layer(specs)
+            resolve_mock.assert_not_called()
+            self.assertIsNone(result.layer_path)
+            self.assertEqual([], result.layer_users)
+            self.assertEqual(
+                {spec: os.path.join(build_directory, "empty.zip") for spec in specs}, result.package_paths
+            )
+
+    def test_build_with_shared_layer_in_session(self):
+        """Asserts the layer is built in the session with the options of all its users"""
+
+        def resolve(requirements_information):
+            names = [line for line in requirements_information.split("\n") if not line.startswith("-")]
+            return [_distribution(name) for name in names]
+
+        with tempfile.TemporaryDirectory() as source_directory, \
+            tempfile.TemporaryDirectory() as build_directory, \
+            patch(self.module + "layers.resolve_requirements", side_effect=resolve), \
+            patch(self.module + "dependencies.create_or_return_zipped_distribution", side_effect=_fake_install), \
+            patch(self.module + "BuildSession._build_layer", autospec=True,
+                  side_effect=target_module.BuildSession._build_layer) as layer_mock:
+
+            specs = []
+            for name, requirements in [("first", "--extra-index-url https://first\nboto3"),
+                                       ("second", "--find-links wheels\nboto3\nsix")]:
+                requirements_path = os.path.join(source_directory, f"{name}.txt")
+                with open(requirements_path, "w") as handle:
+                    handle.write(requirements)
+                specs.append(target_module.PackageSpec([source_directory], [requirements_path]))
+
+            session = target_module.BuildSession(build_dir=build_directory)
+            result = session.build_with_shared_layer(specs)
+
+            self.assertEqual(build_directory, os.path.dirname(result.layer_path))
+            layer_requirements = layer_mock.call_args[0][2]
+            self.assertIn("--extra-index-url https://first", layer_requirements)
+            self.assertIn("--find-links wheels", layer_requirements)
+
+    def test_build_layer_packages(self):
+        """Asserts the layers contain the packed distributions and are reused"""
+
+        distributions = [_distribution("boto3", requires=("botocore",)), _distribution("botocore"), _distribution("pytz")]
+
+        with tempfile.TemporaryDirectory() as source_directory, \
+            tempfile.TemporaryDirectory() as build_directory, \
+            patch.dict(os.environ, {"LAMBDA_BUNDLER_BUILD_DIR": build_directory}), \
+            patch(self.module + "layers.resolve_requirements", return_value=distributions), \
+            patch(self.module + "dependencies.create_or_return_zipped_distribution", side_effect=_fake_install):
+
+            requirements_path = os.path.join(source_directory, "requirements.txt")
+            with open(requirements_path, "w") as handle:
+                handle.write("boto3\npytz")
+
+            # Each archive with one distribution has about 1.2 KB, the archives aren't compressed
+            size_budget = target_module.budget.SizeBudget(2700, None)
+            layer_paths = target_module.build_layer_packages([requirements_path], size_budget=size_budget)
+
+            self.assertEqual(2, len(layer_paths))
+            with zipfile.ZipFile(layer_paths[0]) as zip_file:
+                self.assertEqual(["python/boto3/__init__.py", "python/botocore/__init__.py"], zip_file.namelist())
+            with zipfile.ZipFile(layer_paths[1]) as zip_file:
+                self.assertEqual(["python/pytz/__init__.py"], zip_file.namelist())
+
+            self.assertEqual(layer_paths, target_module.build_layer_packages([requirements_path], size_budget=size_budget))
+
+            with patch(self.module + "layers.resolve_requirements", return_value=None), \
+                patch(self.module + "BuildSession.build_layer_package", return_value="layer.zip") as layer_mock:
+                self.assertEqual(["layer.zip"], target_module.build_layer_packages([requirements_path]))
+                layer_mock.assert_called_once_with([requirements_path], None, target_module.budget.get_budget())
+
+            # Nothing is resolved or installed when the installation is skipped
+            with patch.dict(os.environ, {"LAMBDA_BUNDLER_SKIP_INSTALL": "true"}), \
+                patch(self.module + "layers.resolve_requirements") as resolve_mock:
+                self.assertEqual(
+                    [os.path.join(build_directory, "empty.zip")], target_module.build_layer_packages([requirements_path])
+                )
+                resolve_mock.assert_not_called()
 
 if __name__ == "__main__":
     unittest.main()
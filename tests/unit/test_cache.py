@@ -0,0 +1,363 @@
+"""Tests for the lambda_bundler.cache module."""
+import io
+import os
+import pathlib
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+
+from unittest.mock import patch
+
+import lambda_bundler.backends as backends
+import lambda_bundler.cache as target_module
+import lambda_bundler.util as util
+
+class CacheTestCases(unittest.TestCase):
+    """Test cases for the cache module"""
+
+    def setUp(self):
+        self.module = "lambda_bundler.cache."
+
+    def _create_sources(self, source_directory):
+        pathlib.Path(os.path.join(source_directory, "src", "lambda")).mkdir(parents=True)
+        with open(os.path.join(source_directory, "src", "lambda", "handler.py"), "w") as handle:
+            handle.write("test-content")
+        with open(os.path.join(source_directory, "src", "other.py"), "w") as handle:
+            handle.write("other-content")
+
+    def test_fingerprint_sources_detects_changes(self):
+        """Asserts the fingerprint is stable and changes with the content"""
+
+        with tempfile.TemporaryDirectory() as source_directory, \
+            tempfile.TemporaryDirectory() as build_directory, \
+            patch(self.module + "util.get_build_dir") as gbd_mock:
+
+            gbd_mock.return_value = build_directory
+            self._create_sources(source_directory)
+            code_directories = [os.path.join(source_directory, "src")]
+
+            initial = target_module.fingerprint_sources(code_directories, [])
+            self.assertEqual(initial, target_module.fingerprint_sources(code_directories, []))
+
+            # Excluding a file changes the content of the archive
+            excluded = target_module.fingerprint_sources(code_directories, ["other.py"])
+            self.assertNotEqual(initial, excluded)
+
+            with open(os.path.join(source_directory, "src", "lambda", "handler.py"), "w") as handle:
+                handle.write("changed-content")
+
+            self.assertNotEqual(initial, target_module.fingerprint_sources(code_directories, []))
+
+    def test_hash_sources_uses_manifest(self):
+        """Asserts unchanged files aren't read again once the manifest exists"""
+
+        with tempfile.TemporaryDirectory() as source_directory, \
+            tempfile.TemporaryDirectory() as build_directory, \
+            patch(self.module + "util.get_build_dir") as gbd_mock:
+
+            gbd_mock.return_value = build_directory
+            self._create_sources(source_directory)
+            code_directory = os.path.join(source_directory, "src")
+
+            first_run = target_module.hash_sources(code_directory, [])
+            self.assertEqual(2, len(first_run))
+            self.assertEqual(
+                util.hash_file(os.path.join(code_directory, "lambda", "handler.py")),
+                dict((entry.arcname, digest) for entry, digest in first_run)["src/lambda/handler.py"]
+            )
+
+            with patch(self.module + "util.hash_file") as hash_mock:
+                second_run = target_module.hash_sources(code_directory, [])
+                hash_mock.assert_not_called()
+
+            self.assertEqual(
+                [digest for _, digest in first_run],
+                [digest for _, digest in second_run]
+            )
+
+    def test_load_manifest_without_manifest(self):
+        """Asserts a missing or broken manifest is treated as empty"""
+
+        with tempfile.TemporaryDirectory() as build_directory, \
+            patch(self.module + "util.get_build_dir") as gbd_mock:
+
+            gbd_mock.return_value = build_directory
+
+            self.assertEqual({}, target_module.load_manifest("does/not/exist"))
+
+            target_module.store_manifest("broken", {})
+            with open(target_module._get_manifest_path("broken"), "w") as handle:
+                handle.write("{no json")
+
+            self.assertEqual({}, target_module.load_manifest("broken"))
+
+    def test_compressed_entry_round_trip(self):
+        """Asserts compressed entries can be stored and opened again"""
+
+        with tempfile.TemporaryDirectory() as build_directory, \
+            patch(self.module + "util.get_build_dir") as gbd_mock:
+
+            gbd_mock.return_value = build_directory
+
+            self.assertIsNone(target_module.open_compressed_entry("abcdef", "deflate6"))
+
+            data = io.BytesIO(b"compressed-data")
+            target_module.store_compressed_entry("abcdef", "deflate6", 1234, 42, data)
+
+            # The data is rewound for the caller
+            self.assertEqual(0, data.tell())
+
+            cached_entry = target_module.open_compressed_entry("abcdef", "deflate6")
+            with cached_entry.data:
+                self.assertEqual((1234, 42, 15), cached_entry[:3])
+                self.assertEqual(b"compressed-data", cached_entry.data.read())
+
+            # Different compression settings are cached separately
+            self.assertIsNone(target_module.open_compressed_entry("abcdef", "deflate9"))
+
+    def test_publish_and_is_valid_artifact(self):
+        """Asserts only complete, published archives are valid"""
+
+        with tempfile.TemporaryDirectory() as build_directory:
+
+            artifact_path = os.path.join(build_directory, "artifact.zip")
+            temporary_path = target_module.get_temporary_path(artifact_path)
+
+            with zipfile.ZipFile(temporary_path, "w") as zip_file:
+                zip_file.writestr("handler.py", "test-content" * 100)
+
+            self.assertFalse(target_module.is_valid_artifact(artifact_path))
+
+            target_module.publish(temporary_path, artifact_path)
+
+            self.assertFalse(os.path.exists(temporary_path))
+            self.assertTrue(target_module.is_valid_artifact(artifact_path))
+
+            # A partially written archive doesn't match the recorded size
+            with open(artifact_path, "r+b") as handle:
+                handle.truncate(50)
+            self.assertFalse(target_module.is_valid_artifact(artifact_path))
+
+            # Neither does an archive without an end of central directory record
+            with open(artifact_path, "wb") as handle:
+                handle.write(b"x" * 50)
+            self.assertFalse(target_module.is_valid_artifact(artifact_path))
+
+    def test_build_once_is_single_flight(self):
+        """Asserts concurrent builds of the same artifact only build it once"""
+
+        with tempfile.TemporaryDirectory() as build_directory:
+
+            artifact_path = os.path.join(build_directory, "artifact.zip")
+            builds = []
+
+            def build(temporary_path):
+                builds.append(temporary_path)
+                time.sleep(0.2)
+                with zipfile.ZipFile(temporary_path, "w") as zip_file:
+                    zip_file.writestr("handler.py", "test-content")
+
+            results = []
+            threads = [
+                threading.Thread(target=lambda: results.append(target_module.build_once(artifact_path, build)))
+                for _ in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual(1, len(builds))
+            self.assertEqual([artifact_path] * 4, results)
+            self.assertTrue(target_module.is_valid_artifact(artifact_path))
+
+            # Unless existing artifacts can't be reused
+            target_module.build_once(artifact_path, build, reuse_existing=False)
+            self.assertEqual(2, len(builds))
+
+    def test_build_once_cleans_up_failed_builds(self):
+        """Asserts a failing build leaves neither a temporary file nor an artifact"""
+
+        with tempfile.TemporaryDirectory() as build_directory:
+
+            artifact_path = os.path.join(build_directory, "artifact.zip")
+
+            def build(temporary_path):
+                with open(temporary_path, "w") as handle:
+                    handle.write("partial")
+                raise RuntimeError("pip failed")
+
+            with self.assertRaises(RuntimeError):
+                target_module.build_once(artifact_path, build)
+
+            self.assertEqual(["artifact.zip.lock"], os.listdir(build_directory))
+
+    def test_build_once_uses_shared_cache(self):
+        """Asserts artifacts are fetched from the shared cache and published to it after building"""
+
+        with tempfile.TemporaryDirectory() as build_directory, \
+            tempfile.TemporaryDirectory() as shared_directory, \
+            patch(self.module + "backends.get_backend") as backend_mock:
+
+            backend_mock.return_value = backends.DirectoryBackend(shared_directory)
+            builds = []
+
+            def build(temporary_path):
+                builds.append(temporary_path)
+                with zipfile.ZipFile(temporary_path, "w") as zip_file:
+                    zip_file.writestr("handler.py", "test-content")
+
+            first_path = os.path.join(build_directory, "first", "artifact.zip")
+            target_module.build_once(first_path, build, shared_key="abcdef")
+            self.assertTrue(backend_mock.return_value.lookup("abcdef"))
+
+            # Another machine with an empty build directory fetches it
+            second_path = os.path.join(build_directory, "second", "artifact.zip")
+            target_module.build_once(second_path, build, shared_key="abcdef")
+
+            self.assertEqual(1, len(builds))
+            self.assertTrue(target_module.is_valid_artifact(second_path))
+
+            # Broken artifacts in the shared cache are ignored
+            with open(os.path.join(shared_directory, "ab", "abcdef.zip"), "wb") as handle:
+                handle.write(b"broken")
+
+            third_path = os.path.join(build_directory, "third", "artifact.zip")
+            target_module.build_once(third_path, build, shared_key="abcdef")
+            self.assertEqual(2, len(builds))
+
+    def test_parse_size(self):
+        """Asserts sizes with and without suffixes are parsed"""
+
+        self.assertEqual(500, target_module.parse_size("500"))
+        self.assertEqual(2 * 1024 ** 2, target_module.parse_size("2M"))
+        self.assertEqual(10 * 1024 ** 3, target_module.parse_size("10gb"))
+
+        with self.assertRaises(ValueError):
+            target_module.parse_size("lots")
+
+        with patch.dict(os.environ, {target_module.MAX_BYTES_ENV: "lots"}):
+            self.assertIsNone(target_module.get_max_bytes())
+
+    def test_build_once_records_statistics(self):
+        """Asserts hits, misses and saved bytes are recorded for artifacts in the build directory"""
+
+        with tempfile.TemporaryDirectory() as build_directory, \
+            patch(self.module + "util.get_build_dir") as gbd_mock:
+
+            gbd_mock.return_value = build_directory
+            artifact_path = os.path.join(build_directory, "artifact.zip")
+
+            def build(temporary_path):
+                with zipfile.ZipFile(temporary_path, "w") as zip_file:
+                    zip_file.writestr("handler.py", "test-content")
+
+            target_module.build_once(artifact_path, build)
+            target_module.build_once(artifact_path, build)
+            target_module.build_once(artifact_path, build)
+
+            statistics = target_module.get_statistics()
+
+            self.assertEqual((2, 1, 1), (statistics.hits, statistics.misses, statistics.artifacts))
+            self.assertEqual(2 * os.path.getsize(artifact_path), statistics.bytes_saved)
+            self.assertGreater(statistics.bytes_stored, os.path.getsize(artifact_path))
+
+    def test_enforce_limits_evicts_least_recently_used(self):
+        """Asserts the oldest artifacts are evicted first and recently used ones are kept"""
+
+        with tempfile.TemporaryDirectory() as build_directory, \
+            patch(self.module + "util.get_build_dir") as gbd_mock:
+
+            gbd_mock.return_value = build_directory
+
+            def build(temporary_path):
+                with zipfile.ZipFile(temporary_path, "w") as zip_file:
+                    zip_file.writestr("handler.py", "x" * 1000)
+
+            paths = [os.path.join(build_directory, f"{name}.zip") for name in ["old", "older", "new"]]
+            for path in paths:
+                target_module.build_once(path, build)
+
+            with target_module._update_index() as index:
+                index["artifacts"]["old.zip"]["last_access"] -= 2 * target_module.EVICTION_GRACE_PERIOD_SECONDS
+                index["artifacts"]["older.zip"]["last_access"] -= 3 * target_module.EVICTION_GRACE_PERIOD_SECONDS
+
+            freed_bytes = target_module.enforce_limits(max_bytes=2 * os.path.getsize(paths[0]))
+
+            self.assertEqual(os.path.getsize(paths[0]), freed_bytes)
+            self.assertEqual([True, False, True], [os.path.exists(path) for path in paths])
+            self.assertFalse(os.path.exists(paths[1] + ".json"))
+            self.assertEqual(2, target_module.get_statistics().artifacts)
+
+            # Nothing is evicted within the grace period, even if the limit is exceeded
+            self.assertEqual(os.path.getsize(paths[0]), target_module.enforce_limits(max_bytes=1))
+            self.assertEqual([False, False, True], [os.path.exists(path) for path in paths])
+
+    def test_remove_orphans(self):
+        """Asserts build directories without a build and stale temporary files are removed"""
+
+        with tempfile.TemporaryDirectory() as build_directory, \
+            patch(self.module + "util.get_build_dir") as gbd_mock:
+
+            gbd_mock.return_value = build_directory
+
+            orphan = os.path.join(build_directory, "orphan")
+            in_use = os.path.join(build_directory, "in_use")
+            stale_file = target_module.get_temporary_path(os.path.join(build_directory, "artifact.zip"))
+            for directory in [orphan, in_use]:
+                pathlib.Path(directory).mkdir()
+                with open(os.path.join(directory, "requirements.txt"), "w") as handle:
+                    handle.write("pytz")
+                open(f"{directory}.zip.lock", "w").close()
+            with open(stale_file, "w") as handle:
+                handle.write("partial")
+            os.utime(stale_file, (0, 0))
+            pathlib.Path(os.path.join(build_directory, target_module.ENTRY_DIRECTORY_NAME)).mkdir()
+
+            # What the bundler didn't create is kept, no matter how old it is
+            user_directory = os.path.join(build_directory, "notes")
+            user_file = os.path.join(build_directory, "notes.tmp")
+            pathlib.Path(user_directory).mkdir()
+            open(user_file, "w").close()
+            for path in [user_directory, user_file]:
+                os.utime(path, (0, 0))
+
+            with target_module.lock(f"{in_use}.zip"):
+                freed_bytes = target_module.remove_orphans()
+
+            self.assertEqual(len("pytz") + len("partial"), freed_bytes)
+            self.assertFalse(os.path.exists(orphan))
+            self.assertFalse(os.path.exists(stale_file))
+            self.assertTrue(os.path.exists(in_use))
+            self.assertTrue(os.path.exists(os.path.join(build_directory, target_module.ENTRY_DIRECTORY_NAME)))
+            self.assertTrue(os.path.exists(user_directory))
+            self.assertTrue(os.path.exists(user_file))
+
+    def test_enforce_limits_evicts_wheels(self):
+        """Asserts old wheels and files of pip's cache count towards the limit unless the wheelhouse is the user's"""
+
+        with tempfile.TemporaryDirectory() as build_directory, \
+            patch.dict(os.environ, {"LAMBDA_BUNDLER_BUILD_DIR": build_directory}):
+
+            paths = [
+                os.path.join(build_directory, "wheelhouse", "pytz-2020.1-py2.py3-none-any.whl"),
+                os.path.join(build_directory, "pip-cache", "http", "abc"),
+                os.path.join(build_directory, "wheelhouse", ".building", "six-1.15.0-py2.py3-none-any.whl"),
+            ]
+            for path in paths:
+                pathlib.Path(os.path.dirname(path)).mkdir(parents=True, exist_ok=True)
+                with open(path, "w") as handle:
+                    handle.write("x" * 100)
+                os.utime(path, (0, 0))
+
+            with patch.dict(os.environ, {"LAMBDA_BUNDLER_WHEELHOUSE": os.path.join(build_directory, "wheelhouse")}):
+                self.assertEqual(100, target_module.enforce_limits(max_bytes=1))
+            self.assertEqual([True, False, True], [os.path.exists(path) for path in paths])
+
+            self.assertEqual(100, target_module.enforce_limits(max_bytes=1))
+            self.assertEqual([False, False, True], [os.path.exists(path) for path in paths])
+
+if __name__ == "__main__":
+    unittest.main()
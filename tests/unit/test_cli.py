@@ -0,0 +1,105 @@
+"""Tests for the lambda_bundler.cli module."""
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+import zipfile
+
+from unittest.mock import patch
+
+import lambda_bundler.cache as cache
+import lambda_bundler.cli as target_module
+
+class CliTestCases(unittest.TestCase):
+    """Test cases for the command line interface"""
+
+    def setUp(self):
+        self.module = "lambda_bundler.cli."
+
+    def test_cache_stats(self):
+        """Asserts the statistics are printed as text and JSON"""
+
+        statistics = cache.CacheStatistics(hits=3, misses=1, artifacts=2, bytes_stored=2048, bytes_saved=4096)
+
+        with patch(self.module + "cache.get_statistics") as statistics_mock:
+            statistics_mock.return_value = statistics
+
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                self.assertEqual(0, target_module.main(["cache", "stats"]))
+            self.assertIn("Hit rate:     75.0%", output.getvalue())
+            self.assertIn("Bytes saved:  4.0 KB", output.getvalue())
+
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                target_module.main(["cache", "stats", "--json"])
+            self.assertEqual(statistics._asdict(), json.loads(output.getvalue()))
+
+    def test_cache_prune(self):
+        """Asserts prune passes the size limit on"""
+
+        with patch(self.module + "cache.enforce_limits") as limits_mock, \
+            contextlib.redirect_stdout(io.StringIO()):
+            limits_mock.return_value = 0
+
+            target_module.main(["cache", "prune", "--max-bytes", "1G"])
+            limits_mock.assert_called_once_with(max_bytes=1024 ** 3)
+
+            limits_mock.reset_mock()
+            target_module.main(["cache", "prune"])
+            limits_mock.assert_called_once_with(max_bytes=None)
+
+    def test_size(self):
+        """Asserts the size report is printed and archives over budget fail"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "package.zip")
+            with zipfile.ZipFile(path, "w") as zip_file:
+                zip_file.writestr("requests/api.py", "a" * 2048)
+
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                self.assertEqual(0, target_module.main(["size", path, "--json"]))
+            report = json.loads(output.getvalue())
+            self.assertEqual(2048, report["uncompressed_bytes"])
+            self.assertEqual("requests", report["packages"][0]["name"])
+            self.assertIsNone(report["exceeded"])
+
+            with contextlib.redirect_stdout(io.StringIO()) as output, \
+                contextlib.redirect_stderr(io.StringIO()) as error:
+                self.assertEqual(1, target_module.main(["size", path, "--max-unzipped", "1K", "--max-zipped", "none"]))
+            self.assertIn("requests", output.getvalue())
+            self.assertIn("1024 uncompressed bytes", error.getvalue())
+
+    def test_watch(self):
+        """Asserts watch builds the config once or keeps watching it"""
+
+        with patch(self.module + "watch.load_config") as config_mock, \
+            patch(self.module + "watch.build_specs") as build_mock, \
+            patch(self.module + "watch.watch") as watch_mock:
+            config_mock.return_value = {"api": "spec"}
+            build_mock.return_value = {}
+
+            self.assertEqual(1, target_module.main(["watch", "bundler.json", "--once"]))
+            build_mock.assert_called_once_with({"api": "spec"}, {"api": "spec"})
+            watch_mock.assert_not_called()
+
+            watch_mock.side_effect = KeyboardInterrupt
+            self.assertEqual(0, target_module.main(["watch", "bundler.json", "--polling", "--debounce", "0.5"]))
+            watch_mock.assert_called_once_with({"api": "spec"}, polling=True, debounce_seconds=0.5)
+
+            config_mock.side_effect = ValueError("invalid")
+            with contextlib.redirect_stderr(io.StringIO()) as error:
+                self.assertEqual(1, target_module.main(["watch", "bundler.json"]))
+            self.assertIn("invalid", error.getvalue())
+
+    def test_invalid_size(self):
+        """Asserts invalid sizes are rejected"""
+
+        with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            target_module.main(["cache", "prune", "--max-bytes", "lots"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+"""Tests for the lambda_bundler.compression module."""
+import os
+import tempfile
+import unittest
+import zipfile
+
+from unittest.mock import patch
+
+import lambda_bundler.compression as target_module
+
+class CompressionTestCases(unittest.TestCase):
+    """Test cases for the compression module"""
+
+    def setUp(self):
+        self.module = "lambda_bundler.compression."
+
+    def test_get_policy(self):
+        """Asserts presets are taken from the argument or the environment"""
+
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertEqual(target_module.CompressionPolicy("default", 6), target_module.get_policy())
+            self.assertEqual(9, target_module.get_policy("max").level)
+
+        with patch.dict(os.environ, {"LAMBDA_BUNDLER_COMPRESSION": " Fast "}):
+            self.assertEqual(1, target_module.get_policy().level)
+
+        with self.assertRaises(ValueError):
+            target_module.get_policy("smallest")
+
+    def test_get_entropy(self):
+        """Asserts the entropy is low for repetitive and high for random content"""
+
+        self.assertEqual(0.0, target_module.get_entropy(b""))
+        self.assertEqual(0.0, target_module.get_entropy(b"a" * 100))
+        self.assertEqual(8.0, target_module.get_entropy(bytes(range(256))))
+        self.assertLess(target_module.get_entropy(b"value = 3\n" * 1000), 4)
+
+    def test_choose_compression(self):
+        """Asserts compressed formats and random content are stored, everything else is deflated"""
+
+        policy = target_module.get_policy("fast")
+
+        with tempfile.TemporaryDirectory() as directory:
+
+            def create(name, content):
+                path = os.path.join(directory, name)
+                with open(path, "wb") as handle:
+                    handle.write(content)
+                return path
+
+            text = create("module.py", b"value = 3\n" * 1000)
+            self.assertEqual((zipfile.ZIP_DEFLATED, 1), target_module.choose_compression(text, 10000, policy))
+
+            wheel = create("package.WHL", b"value = 3\n" * 1000)
+            self.assertEqual((zipfile.ZIP_STORED, None), target_module.choose_compression(wheel, 10000, policy))
+
+            empty = create("empty.py", b"")
+            self.assertEqual((zipfile.ZIP_STORED, None), target_module.choose_compression(empty, 0, policy))
+
+            random = create("model.bin", os.urandom(64 * 1024))
+            self.assertEqual((zipfile.ZIP_STORED, None), target_module.choose_compression(random, 64 * 1024, policy))
+
+            # Too small to sample, deflating is cheap anyway
+            small = create("small.bin", os.urandom(1024))
+            self.assertEqual((zipfile.ZIP_DEFLATED, 1), target_module.choose_compression(small, 1024, policy))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,13 +1,18 @@
 """Test cases for lambda_bundler.dependencies"""
+import json
 import os
 import pathlib
 import shutil
 import tempfile
 import unittest
+import zipfile
 
 from unittest.mock import patch, ANY
 
 import lambda_bundler.dependencies as target_module
+import lambda_bundler.compression as compression
+import lambda_bundler.slimming as slimming
+import lambda_bundler.util as util
 
 class DependenciesTestCases(unittest.TestCase):
     """Tests for the lambda_bundler.dependencies module"""
@@ -33,6 +38,21 @@ class DependenciesTestCases(unittest.TestCase):
 
         self.assertEqual(expected_output, actual_output)
 
+    def test_merge_requirement_files_is_semantic(self):
+        """Assert equivalent requirement files are merged into the same output"""
+
+        file_1 = "Requests==2.31.0\n--index-url=https://example.com\n# A comment\nFlask_Login"
+        file_2 = "-i https://example.com\nflask-login  # Another comment\nrequests == 2.31.0\nrequests==2.31.0"
+
+        self.assertEqual(
+            target_module.merge_requirement_files(file_1),
+            target_module.merge_requirement_files(file_2)
+        )
+        self.assertEqual(
+            "--index-url https://example.com\nflask-login\nrequests==2.31.0",
+            target_module.merge_requirement_files(file_1)
+        )
+
     def test_collect_and_merge_requirements(self):
         """Assert collect_and_merge_requirements calls the correct functions"""
 
@@ -46,7 +66,7 @@ class DependenciesTestCases(unittest.TestCase):
             self.assertEqual("merged", target_module.collect_and_merge_requirements(*list_of_files))
 
             get_mock.assert_called_with(*list_of_files)
-            merge_mock.assert_called_with("a")
+            merge_mock.assert_called_with("a", base_directories=[os.getcwd(), os.getcwd()])
 
     def test_create_zipped_dependencies(self):
         """Asserts that create_zipped_dependencies works as expected"""
@@ -54,6 +74,7 @@ class DependenciesTestCases(unittest.TestCase):
         with tempfile.TemporaryDirectory() as working_directory, \
             tempfile.TemporaryDirectory() as assertion_directory, \
             patch(self.module + "util.hash_string") as hash_mock, \
+            patch(self.module + "resolve_distributions", return_value=None), \
             patch(self.module + "install_dependencies") as install_mock:
 
             hash_mock.return_value = "bla"
@@ -64,7 +85,8 @@ class DependenciesTestCases(unittest.TestCase):
                 output_directory_path=working_directory
             )
 
-            hash_mock.assert_called_with(requirements)
+            hash_mock.assert_called_with(requirements + util.get_environment_tag() + slimming.get_profile().key
+                                         + compression.get_policy().name + "direct")
             install_mock.assert_called_with(
                 path_to_requirements=os.path.join(working_directory, "bla", "requirements.txt"),
                 path_to_target_directory=os.path.join(working_directory, "bla")
@@ -86,6 +108,7 @@ class DependenciesTestCases(unittest.TestCase):
         with tempfile.TemporaryDirectory() as working_directory, \
             tempfile.TemporaryDirectory() as assertion_directory, \
             patch(self.module + "util.hash_string") as hash_mock, \
+            patch(self.module + "resolve_distributions", return_value=None), \
             patch(self.module + "install_dependencies") as install_mock:
 
             hash_mock.return_value = "bla"
@@ -97,7 +120,8 @@ class DependenciesTestCases(unittest.TestCase):
                 prefix_in_zip="python"
             )
 
-            hash_mock.assert_called_with(requirements + "python")
+            hash_mock.assert_called_with(requirements + "python" + util.get_environment_tag() + slimming.get_profile().key
+                                         + compression.get_policy().name + "direct")
             install_mock.assert_called_with(
                 path_to_requirements=os.path.join(working_directory, "bla", "python", "requirements.txt"),
                 path_to_target_directory=os.path.join(working_directory, "bla", "python")
@@ -119,6 +143,7 @@ class DependenciesTestCases(unittest.TestCase):
         with tempfile.TemporaryDirectory() as working_directory, \
             tempfile.TemporaryDirectory() as assertion_directory, \
             patch(self.module + "util.hash_string") as hash_mock, \
+            patch(self.module + "resolve_distributions", return_value=None), \
             patch(self.module + "install_dependencies") as install_mock, \
             patch(self.module + "LOGGER.warning") as warning_logger:
 
@@ -133,7 +158,8 @@ class DependenciesTestCases(unittest.TestCase):
                 output_directory_path=working_directory
             )
 
-            hash_mock.assert_called_with(requirements)
+            hash_mock.assert_called_with(requirements + util.get_environment_tag() + slimming.get_profile().key
+                                         + compression.get_policy().name + "direct")
             install_mock.assert_called_with(
                 path_to_requirements=os.path.join(working_directory, "bla", "requirements.txt"),
                 path_to_target_directory=os.path.join(working_directory, "bla")
@@ -150,11 +176,135 @@ class DependenciesTestCases(unittest.TestCase):
                 )
             )
 
+    def test_create_zipped_dependencies_from_distributions(self):
+        """Asserts resolved distributions are installed once and assembled into the zip"""
+
+        def fake_build_wheels(path_to_requirements, with_dependencies=True):
+            self.assertFalse(with_dependencies)
+            with open(path_to_requirements) as handle:
+                requirement = handle.read().split("\n")[-1]
+            name, version = requirement.split("==")
+            wheel_path = os.path.join(os.path.dirname(path_to_requirements), f"{name}-{version}-py3-none-any.whl")
+            with zipfile.ZipFile(wheel_path, "w") as wheel_zip:
+                wheel_zip.writestr(f"{name}/__init__.py", requirement)
+                wheel_zip.writestr(f"{name}-{version}.dist-info/WHEEL", "Wheel-Version: 1.0")
+            return [wheel_path]
+
+        distributions = [
+            target_module.Distribution("certifi", "2020.6.20", "certifi==2020.6.20", "key-certifi"),
+            target_module.Distribution("pytz", "2020.1", "pytz==2020.1", "key-pytz"),
+        ]
+
+        with tempfile.TemporaryDirectory() as working_directory, \
+            tempfile.TemporaryDirectory() as assertion_directory, \
+            patch(self.module + "resolve_distributions", return_value=distributions), \
+            patch(self.module + "build_wheels", side_effect=fake_build_wheels) as wheel_mock, \
+            patch(self.module + "install_wheels") as install_mock:
+
+            output_path = target_module.create_zipped_dependencies(
+                requirements_information="--index-url https://example.com\ncertifi\npytz",
+                output_directory_path=working_directory,
+                prefix_in_zip="python"
+            )
+
+            self.assertEqual(2, wheel_mock.call_count)
+            # The wheels are copied into the archives without pip
+            install_mock.assert_not_called()
+
+            shutil.unpack_archive(output_path, assertion_directory)
+            for path in ["requirements.txt", "certifi/__init__.py", "pytz/__init__.py",
+                         "pytz-2020.1.dist-info/INSTALLER", "pytz-2020.1.dist-info/RECORD"]:
+                self.assertTrue(os.path.exists(os.path.join(assertion_directory, "python", path)))
+
+            with open(os.path.join(assertion_directory, "python", "pytz", "__init__.py")) as handle:
+                self.assertEqual("pytz==2020.1", handle.read())
+
+            # A different set of requirements only installs the new distribution
+            distributions.append(target_module.Distribution("six", "1.15.0", "six==1.15.0", "key-six"))
+
+            target_module.create_zipped_dependencies(
+                requirements_information="certifi\npytz\nsix",
+                output_directory_path=working_directory
+            )
+
+            self.assertEqual(3, wheel_mock.call_count)
+
+    def test_create_zipped_distribution_with_pip(self):
+        """Asserts distributions are installed with pip if direct installs are disabled"""
+
+        def fake_install(wheel_paths, path_to_target_directory, path_to_requirements=None):
+            self.assertEqual(["wheelhouse/pytz-2020.1-py3-none-any.whl"], wheel_paths)
+            pathlib.Path(os.path.join(path_to_target_directory, "pytz")).mkdir()
+            with open(os.path.join(path_to_target_directory, "pytz", "__init__.py"), "w") as handle:
+                handle.write("pytz")
+
+        distribution = target_module.Distribution("pytz", "2020.1", "pytz==2020.1", "key-pytz")
+
+        with tempfile.TemporaryDirectory() as working_directory, \
+            patch.dict(os.environ, {"LAMBDA_BUNDLER_DIRECT_INSTALL": "false"}), \
+            patch(self.module + "build_wheels", return_value=["wheelhouse/pytz-2020.1-py3-none-any.whl"]), \
+            patch(self.module + "install_wheels", side_effect=fake_install) as install_mock:
+
+            output_path = target_module.create_or_return_zipped_distribution(distribution, "pytz", working_directory)
+
+            install_mock.assert_called_once()
+            with zipfile.ZipFile(output_path) as zip_file:
+                self.assertEqual(["pytz/__init__.py"], zip_file.namelist())
+
+    def test_resolve_distributions(self):
+        """Asserts resolve_distributions parses the installation report of pip"""
+
+        report = {"install": [
+            {
+                "metadata": {"name": "pytz", "version": "2020.1"},
+                "download_info": {
+                    "url": "https://example.com/pytz-2020.1-py2.py3-none-any.whl",
+                    "archive_info": {"hash": "sha256=abc"}
+                },
+                "is_direct": False
+            },
+            {
+                "metadata": {"name": "Flask", "version": "1.1.2"},
+                "download_info": {
+                    "url": "https://github.com/pallets/flask",
+                    "vcs_info": {"vcs": "git", "commit_id": "123"}
+                },
+                "is_direct": True
+            },
+            {
+                "metadata": {"name": "local", "version": "0.1"},
+                "download_info": {"url": "file:///src/local", "dir_info": {}},
+                "is_direct": True
+            }
+        ]}
+
+        def fake_pip(call, **_):
+            with open(call[call.index("--report") + 1], "w") as handle:
+                json.dump(report, handle)
+
+        with patch(self.module + "subprocess.check_output", side_effect=fake_pip) as pip_mock, \
+            patch(self.module + "_get_pip_environment", return_value={"PIP_INDEX_URL": "https://index"}):
+            distributions = target_module.resolve_distributions("requirements.txt")
+
+        # pip resolves with the same environment it installs with
+        self.assertEqual({"PIP_INDEX_URL": "https://index"}, pip_mock.call_args[1]["env"])
+
+        self.assertEqual(["Flask", "local", "pytz"], [distribution.name for distribution in distributions])
+        self.assertEqual("Flask @ git+https://github.com/pallets/flask@123", distributions[0].requirement)
+        self.assertIsNone(distributions[1].cache_key)
+        self.assertEqual("pytz==2020.1", distributions[2].requirement)
+        self.assertIsNotNone(distributions[2].cache_key)
+
+        with patch(self.module + "subprocess.check_output") as pip_mock:
+            pip_mock.side_effect = target_module.subprocess.CalledProcessError(2, "pip")
+            self.assertIsNone(target_module.resolve_distributions("requirements.txt"))
+
     def test_create_or_return_zipped_dependencies(self):
         """Assert that create_or_return_zipped_dependencies works as intended"""
 
         with patch(self.module + "util.hash_string") as hash_mock, \
-            patch(self.module + "os.path.exists") as exists_mock, \
+            patch(self.module + "cache.is_valid_artifact") as exists_mock, \
+            patch(self.module + "cache.record_access") as access_mock, \
             patch(self.module + "create_zipped_dependencies") as zip_mock:
 
             hash_mock.return_value = "a"
@@ -169,6 +319,7 @@ class DependenciesTestCases(unittest.TestCase):
             )
 
             self.assertEqual("/some_path/a.zip", result)
+            access_mock.assert_called_once_with("/some_path/a.zip", hit=True)
 
             # Create new
             exists_mock.return_value = False
@@ -219,14 +370,50 @@ class DependenciesTestCases(unittest.TestCase):
 
             self.assertTrue(os.path.exists(os.path.join(assertion_directory, "lambda", "handler.py")))
 
+    def test_build_lambda_package_without_dependencies_is_cached(self):
+        """Assert build_lambda_without_dependencies only zips code again after it changed"""
+
+        with tempfile.TemporaryDirectory() as source_directory, \
+            tempfile.TemporaryDirectory() as build_directory, \
+            patch(self.module + "util.get_build_dir") as gbd_mock:
+
+            gbd_mock.return_value = build_directory
+
+            pathlib.Path(os.path.join(source_directory, "lambda")).mkdir()
+            handler_path = os.path.join(source_directory, "lambda", "handler.py")
+            with open(handler_path, "w") as handle:
+                handle.write("test-content")
+
+            code_directories = [os.path.join(source_directory, "lambda")]
+
+            first_archive = target_module.build_lambda_package_without_dependencies(code_directories)
+
+            with patch(self.module + "archive.write_hashed_sources") as archive_mock:
+                second_archive = target_module.build_lambda_package_without_dependencies(code_directories)
+                archive_mock.assert_not_called()
+
+            self.assertEqual(first_archive, second_archive)
+
+            with open(handler_path, "w") as handle:
+                handle.write("changed-content")
+
+            third_archive = target_module.build_lambda_package_without_dependencies(code_directories)
+
+            self.assertNotEqual(first_archive, third_archive)
+            self.assertTrue(os.path.exists(third_archive))
+
     def test_build_lambda_package_with_dependencies(self):
         """Assert that build_lambda_package_with_dependencies orchestrates the correct subroutines"""
 
-        with patch(self.module + "collect_and_merge_requirements") as cam_mock, \
+        with tempfile.TemporaryDirectory() as build_directory, \
+                patch(self.module + "collect_and_merge_requirements") as cam_mock, \
                 patch(self.module + "create_or_return_zipped_dependencies") as create_dep_mock, \
                 patch(self.module + "util.hash_string") as hash_mock, \
+                patch(self.module + "util.get_build_dir", return_value=build_directory), \
                 patch(self.module + "shutil.copyfile") as copy_mock, \
-                patch(self.module + "util.extend_zip") as extend_mock:
+                patch(self.module + "archive.extend_zip") as extend_mock, \
+                patch(self.module + "cache.publish") as publish_mock, \
+                patch(self.module + "cache.record_access"):
 
             cam_mock.return_value = "collected_requirements"
             create_dep_mock.return_value = "dependencies.zip"
@@ -240,28 +427,122 @@ class DependenciesTestCases(unittest.TestCase):
             cam_mock.assert_called_with("d", "e")
             create_dep_mock.assert_called_with(
                 requirements_information="collected_requirements",
-                output_directory_path=ANY
+                output_directory_path=ANY,
+                workers=None,
+                size_budget=None
             )
             hash_mock.assert_called_with("abcde")
             copy_mock.assert_called_once()
             extend_mock.assert_called_once()
+            publish_mock.assert_called_once_with(copy_mock.call_args[1]["dst"], result)
 
             self.assertTrue(result.endswith("hashed.zip"))
 
 
     def test_install_dependencies(self):
-        """Assert install_dependencies uses subprocess_output to install dependencies"""
+        """Assert install_dependencies installs the wheels from the wheelhouse"""
 
         # NOTE: This is not a complete test of the install, that's what we do with integration tests.
 
-        with patch(self.module + "subprocess.check_output") as subprocess_mock:
+        with patch(self.module + "build_wheels") as wheel_mock, \
+            patch(self.module + "subprocess.check_output") as subprocess_mock:
+
+            wheel_mock.return_value = ["wheelhouse/pytz-2020.1-py2.py3-none-any.whl"]
 
             target_module.install_dependencies(
                 path_to_requirements="abc",
                 path_to_target_directory="def"
             )
 
+            wheel_mock.assert_called_once_with("abc", True)
             subprocess_mock.assert_called_once()
+            call = subprocess_mock.call_args[0][0]
+            self.assertIn("--no-index", call)
+            self.assertEqual("wheelhouse/pytz-2020.1-py2.py3-none-any.whl", call[-1])
+
+    def test_build_wheels(self):
+        """Assert new wheels are added to the wheelhouse and existing ones are kept"""
+
+        def fake_pip(call, **_):
+            wheel_directory = call[call.index("-w") + 1]
+            for wheel_name in ["pytz-2020.1-py2.py3-none-any.whl", "six-1.15.0-py2.py3-none-any.whl"]:
+                with open(os.path.join(wheel_directory, wheel_name), "w") as handle:
+                    handle.write("new")
+
+        with tempfile.TemporaryDirectory() as build_directory, \
+            patch.dict(os.environ, {"LAMBDA_BUNDLER_BUILD_DIR": build_directory, "LAMBDA_BUNDLER_OFFLINE": "true"}), \
+            patch(self.module + "subprocess.check_output", side_effect=fake_pip) as pip_mock:
+
+            wheelhouse = os.path.join(build_directory, "wheelhouse")
+            pathlib.Path(wheelhouse).mkdir()
+            with open(os.path.join(wheelhouse, "six-1.15.0-py2.py3-none-any.whl"), "w") as handle:
+                handle.write("existing")
+
+            wheel_paths = target_module.build_wheels("requirements.txt", with_dependencies=False)
+
+            call = pip_mock.call_args[0][0]
+            self.assertEqual(wheelhouse, call[call.index("--find-links") + 1])
+            self.assertIn("--no-index", call)
+            self.assertIn("--no-deps", call)
+
+            self.assertEqual(
+                [os.path.join(wheelhouse, "pytz-2020.1-py2.py3-none-any.whl"),
+                 os.path.join(wheelhouse, "six-1.15.0-py2.py3-none-any.whl")],
+                wheel_paths
+            )
+            self.assertEqual(
+                ["pytz-2020.1-py2.py3-none-any.whl", "six-1.15.0-py2.py3-none-any.whl"],
+                sorted(os.listdir(wheelhouse))
+            )
+            with open(wheel_paths[1]) as handle:
+                self.assertEqual("existing", handle.read())
+
+    def test_build_wheels_for_target(self):
+        """Assert wheels for a target are downloaded and a missing wheel fails clearly"""
+
+        target_environment = {
+            "LAMBDA_BUNDLER_TARGET_PLATFORMS": "manylinux2014_aarch64",
+            "LAMBDA_BUNDLER_TARGET_PYTHON_VERSION": "3.12"
+        }
+
+        def fake_pip(call, **_):
+            wheel_directory = call[call.index("-d") + 1]
+            with open(os.path.join(wheel_directory, "pyyaml-6.0.1-cp312-cp312-manylinux2014_aarch64.whl"), "w") as handle:
+                handle.write("new")
+
+        with tempfile.TemporaryDirectory() as build_directory, \
+            patch.dict(os.environ, dict(target_environment, LAMBDA_BUNDLER_BUILD_DIR=build_directory)), \
+            patch(self.module + "subprocess.check_output", side_effect=fake_pip) as pip_mock:
+
+            wheel_paths = target_module.build_wheels("requirements.txt")
+
+            call = pip_mock.call_args[0][0]
+            self.assertEqual("download", call[3])
+            self.assertIn("--only-binary=:all:", call)
+            self.assertEqual("manylinux2014_aarch64", call[call.index("--platform") + 1])
+            self.assertEqual("3.12", call[call.index("--python-version") + 1])
+            self.assertEqual(
+                [os.path.join(build_directory, "wheelhouse", "pyyaml-6.0.1-cp312-cp312-manylinux2014_aarch64.whl")],
+                wheel_paths
+            )
+
+            pip_mock.side_effect = target_module.subprocess.CalledProcessError(
+                1, "pip", output=b"ERROR: No matching distribution found for docopt==0.6.2\n"
+            )
+            with self.assertRaisesRegex(target_module.targets.NoCompatibleWheelError, "docopt"):
+                target_module.build_wheels("requirements.txt")
+
+    def test_target_is_part_of_the_key(self):
+        """Assert dependencies for different targets don't share an archive"""
+
+        with patch.dict(os.environ, {"LAMBDA_BUNDLER_TARGET_PLATFORMS": "manylinux2014_x86_64"}):
+            x86_64_key = target_module.get_dependencies_key("pyyaml")
+        with patch.dict(os.environ, {"LAMBDA_BUNDLER_TARGET_PLATFORMS": "manylinux2014_aarch64"}):
+            aarch64_key = target_module.get_dependencies_key("pyyaml")
+        with patch.dict(os.environ, {"LAMBDA_BUNDLER_TARGET_PLATFORMS": ""}):
+            native_key = target_module.get_dependencies_key("pyyaml")
+
+        self.assertEqual(3, len({x86_64_key, aarch64_key, native_key}))
 
 if __name__ == "__main__":
     unittest.main()
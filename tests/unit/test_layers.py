@@ -0,0 +1,108 @@
+"""Tests for the lambda_bundler.layers module."""
+import unittest
+
+import lambda_bundler.dependencies as dependencies
+import lambda_bundler.layers as target_module
+
+def _distribution(name, version="1.0", requires=()):
+    return dependencies.Distribution(name, version, f"{name}=={version}", f"key-{name}-{version}", requires)
+
+class LayersTestCases(unittest.TestCase):
+    """Test cases for the planning of layers"""
+
+    def setUp(self):
+        self.module = "lambda_bundler.layers."
+
+    def test_choose_shared_distributions(self):
+        """Asserts distributions most sets contain in the same version are shared"""
+
+        distribution_sets = [
+            [_distribution("boto3"), _distribution("requests"), _distribution("pandas")],
+            [_distribution("boto3"), _distribution("requests", "2.0")],
+            [_distribution("boto3"), _distribution("requests")],
+            [_distribution("six")],
+        ]
+
+        self.assertEqual(
+            [_distribution("boto3"), _distribution("requests")],
+            target_module.choose_shared_distributions(distribution_sets)
+        )
+        self.assertEqual(
+            [_distribution("boto3")],
+            target_module.choose_shared_distributions(distribution_sets, min_share=0.75)
+        )
+        # A single function has nothing to share with
+        self.assertEqual([], target_module.choose_shared_distributions(distribution_sets[:1], min_share=0.1))
+
+    def test_get_closures(self):
+        """Asserts distributions that depend on each other are grouped"""
+
+        boto3 = _distribution("boto3", requires=("botocore", "s3transfer"))
+        s3transfer = _distribution("s3transfer", requires=("botocore",))
+        botocore = _distribution("botocore", requires=("urllib3",))
+        pytz = _distribution("pytz", requires=("not-installed",))
+
+        self.assertEqual(
+            [[boto3, botocore, s3transfer], [pytz]],
+            target_module.get_closures([pytz, s3transfer, botocore, boto3])
+        )
+
+    def test_pack_layers(self):
+        """Asserts closures stay together, are split when too large and the number of layers is limited"""
+
+        sizes = {
+            _distribution("boto3", requires=("botocore",)): (10, 40),
+            _distribution("botocore"): (31, 120),
+            _distribution("numpy"): (40, 150),
+            _distribution("pytz"): (5, 20),
+        }
+        size_budget = target_module.budget.SizeBudget(50, 400)
+
+        layers = target_module.pack_layers(sizes, size_budget=size_budget)
+        self.assertEqual(
+            [["boto3", "botocore", "pytz"], ["numpy"]],
+            [[distribution.name for distribution in layer.distributions] for layer in layers]
+        )
+        self.assertEqual((46, 180), (layers[0].compressed_bytes, layers[0].uncompressed_bytes))
+
+        # The closure of boto3 doesn't fit into a layer anymore
+        layers = target_module.pack_layers(sizes, size_budget=target_module.budget.SizeBudget(40, None))
+        self.assertEqual(
+            [["boto3", "pytz"], ["botocore"], ["numpy"]],
+            [[distribution.name for distribution in layer.distributions] for layer in layers]
+        )
+
+        with self.assertRaises(target_module.budget.BudgetExceededError):
+            target_module.pack_layers(sizes, max_layers=2, size_budget=target_module.budget.SizeBudget(40, None))
+
+        with self.assertRaises(target_module.budget.BudgetExceededError):
+            target_module.pack_layers(sizes, size_budget=target_module.budget.SizeBudget(35, None))
+
+        # A function and all its layers share the uncompressed limit, more layers don't help
+        with self.assertRaises(target_module.budget.BudgetExceededError) as context:
+            target_module.pack_layers(sizes, size_budget=target_module.budget.SizeBudget(50, 300))
+        self.assertEqual(330, context.exception.uncompressed_bytes)
+
+    def test_pack_layers_default_budget(self):
+        """Asserts each layer gets the compressed limit of Lambda if the budget has none"""
+
+        mebibyte = 1024 * 1024
+        sizes = {
+            _distribution(f"package{index}"): (40 * mebibyte, 45 * mebibyte)
+            for index in range(5)
+        }
+
+        layers = target_module.pack_layers(sizes, size_budget=target_module.budget.SizeBudget(None, None))
+        self.assertEqual([1, 1, 1, 1, 1], [len(layer.distributions) for layer in layers])
+
+        self.assertEqual(
+            target_module.budget.SizeBudget(target_module.budget.LAMBDA_MAX_ZIPPED_BYTES, 100),
+            target_module.get_layer_budget(target_module.budget.SizeBudget(None, 100))
+        )
+        self.assertEqual(
+            target_module.budget.SizeBudget(10, None),
+            target_module.get_layer_budget(target_module.budget.SizeBudget(10, None))
+        )
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""Tests for the lambda_bundler.requirements module."""
+import os
+import tempfile
+import unittest
+
+import lambda_bundler.requirements as target_module
+
+class RequirementsTestCases(unittest.TestCase):
+    """Test cases for the requirements module"""
+
+    def test_normalize_requirement(self):
+        """Asserts different spellings of a requirement are normalized to the same one"""
+
+        self.assertEqual("requests==2.31.0", target_module.normalize_requirement("Requests == 2.31.0"))
+        self.assertEqual(
+            'foo-bar[a,b]<2,>=1; python_version < "3.8"',
+            target_module.normalize_requirement("Foo_Bar [B,a] >=1, <2 ; python_version<'3.8'")
+        )
+        self.assertEqual(
+            "pytz==2020.1 --hash sha256:a --hash sha256:b",
+            target_module.normalize_requirement("pytz==2020.1 --hash=sha256:b --hash=sha256:a")
+        )
+
+        # Paths aren't PEP 508 requirements and stay as they are
+        self.assertEqual("./local", target_module.normalize_requirement("./local"))
+
+    def test_parse_requirements_with_includes(self):
+        """Asserts included files are parsed recursively relative to the including file"""
+
+        with tempfile.TemporaryDirectory() as directory:
+
+            os.mkdir(os.path.join(directory, "nested"))
+            with open(os.path.join(directory, "nested", "base.txt"), "w") as handle:
+                handle.write("-r ../requirements.txt\n--extra-index-url https://example.com\nsix\n")
+            with open(os.path.join(directory, "constraints.txt"), "w") as handle:
+                handle.write("six==1.15.0\n")
+            with open(os.path.join(directory, "requirements.txt"), "w") as handle:
+                handle.write("-r nested/base.txt\n-c constraints.txt\npytz \\\n  >=2020.1\n")
+
+            with open(os.path.join(directory, "requirements.txt")) as handle:
+                parsed = target_module.parse_requirements(handle.read(), directory)
+
+            # The cycle between the files ends after the second include, merging removes the duplicates
+            merged = target_module.merge_parsed_requirements(parsed)
+            self.assertEqual(["--extra-index-url https://example.com", "pytz>=2020.1", "six"], merged[:1] + merged[2:])
+            self.assertTrue(merged[1].startswith(f"-c {os.path.join(directory, 'constraints.txt')}  # "))
+
+            # The constraints are part of the output, so changing them changes it
+            with open(os.path.join(directory, "constraints.txt"), "w") as handle:
+                handle.write("six==1.16.0\n")
+
+            with open(os.path.join(directory, "requirements.txt")) as handle:
+                self.assertNotEqual(parsed, target_module.parse_requirements(handle.read(), directory))
+
+    def test_merge_parsed_requirements(self):
+        """Asserts duplicates are combined and options end up in the header"""
+
+        parsed_1 = target_module.parse_requirements("requests>=2\nflask\n-i https://example.com")
+        parsed_2 = target_module.parse_requirements("requests[socks]==2.31.0\nFlask\n./local")
+
+        self.assertEqual(
+            ["--index-url https://example.com", "./local", "flask", "requests[socks]==2.31.0,>=2"],
+            target_module.merge_parsed_requirements(parsed_1, parsed_2)
+        )
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""Tests for the lambda_bundler.slimming module."""
+import os
+import pathlib
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+import lambda_bundler.slimming as target_module
+
+class SlimmingTestCases(unittest.TestCase):
+    """Test cases for the slimming stage"""
+
+    def setUp(self):
+        self.module = "lambda_bundler.slimming."
+
+    def _create_installation(self, directory):
+        files = {
+            "pytz/__init__.py": "import pytz",
+            "pytz/__pycache__/__init__.cpython-38.pyc": "bytecode",
+            "pytz/tests/test_tz.py": "assert True",
+            "pytz/__init__.pyi": "stub",
+            "pytz-2020.1.dist-info/METADATA": "Name: pytz",
+            "pytz-2020.1.dist-info/RECORD": "pytz/__init__.py",
+        }
+        for path, content in files.items():
+            pathlib.Path(os.path.join(directory, os.path.dirname(path))).mkdir(parents=True, exist_ok=True)
+            with open(os.path.join(directory, path), "w") as handle:
+                handle.write(content)
+
+    def _list_files(self, directory):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), directory).replace(os.sep, "/")
+            for root, _, file_names in os.walk(directory) for name in file_names
+        )
+
+    def test_safe_profile(self):
+        """Asserts the safe profile removes bytecode and the RECORD"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            self._create_installation(directory)
+
+            report = target_module.slim_directory(directory, target_module.SAFE)
+
+            self.assertEqual(
+                ["pytz-2020.1.dist-info/METADATA", "pytz/__init__.py", "pytz/__init__.pyi", "pytz/tests/test_tz.py"],
+                self._list_files(directory)
+            )
+            self.assertEqual((2, len("bytecode") + len("pytz/__init__.py"), 0), report)
+
+    def test_aggressive_profile(self):
+        """Asserts the aggressive profile removes tests and stubs as well"""
+
+        with tempfile.TemporaryDirectory() as directory, \
+            patch(self.module + "shutil.which", return_value=None):
+            self._create_installation(directory)
+
+            report = target_module.slim_directory(directory, target_module.AGGRESSIVE)
+
+            self.assertEqual(["pytz-2020.1.dist-info/METADATA", "pytz/__init__.py"], self._list_files(directory))
+            self.assertEqual(4, report.files_removed)
+
+    def test_is_excluded(self):
+        """Asserts archive entries are excluded like the files in a directory"""
+
+        self.assertTrue(target_module.is_excluded("pytz/tests/test_tz.py", target_module.AGGRESSIVE))
+        self.assertTrue(target_module.is_excluded("pytz-2020.1.dist-info/RECORD", target_module.SAFE))
+        self.assertFalse(target_module.is_excluded("pytz/tests/test_tz.py", target_module.SAFE))
+        self.assertFalse(target_module.is_excluded("pytz/__init__.py", target_module.AGGRESSIVE))
+
+    def test_get_profile(self):
+        """Asserts the profile is read from the environment"""
+
+        with patch.dict(os.environ, clear=True):
+            self.assertEqual(target_module.NONE, target_module.get_profile())
+
+        with patch.dict(os.environ, {target_module.SLIMMING_PROFILE_ENV: "Safe",
+                                     target_module.SLIMMING_EXCLUDE_ENV: "*.md, docs"}):
+            profile = target_module.get_profile()
+            self.assertEqual("safe", profile.name)
+            self.assertEqual(("*.md", "docs"), profile.exclude_patterns[-2:])
+            self.assertNotEqual(target_module.SAFE.key, profile.key)
+
+        with patch.dict(os.environ, {target_module.SLIMMING_PROFILE_ENV: "extreme"}), \
+            self.assertRaises(ValueError):
+            target_module.get_profile()
+
+if __name__ == "__main__":
+    unittest.main()
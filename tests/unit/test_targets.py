@@ -0,0 +1,74 @@
+"""Tests for the lambda_bundler.targets module."""
+import os
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+import lambda_bundler.targets as target_module
+
+class TargetsTestCases(unittest.TestCase):
+    """Test cases for the targets module"""
+
+    def setUp(self):
+        self.module = "lambda_bundler.targets."
+
+    def test_get_target(self):
+        """Asserts the target is taken from the environment and there is none by default"""
+
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertIsNone(target_module.get_target())
+            self.assertIsNone(target_module.get_target_tag())
+
+        with patch.dict(os.environ, {
+                "LAMBDA_BUNDLER_TARGET_PLATFORMS": "manylinux2014_aarch64, manylinux_2_28_aarch64",
+                "LAMBDA_BUNDLER_TARGET_PYTHON_VERSION": "3.12"
+        }):
+            target = target_module.get_target()
+            self.assertEqual(
+                target_module.Target("3.12", "cp", (), ("manylinux2014_aarch64", "manylinux_2_28_aarch64")), target
+            )
+            self.assertEqual("cp3.12-default-manylinux2014_aarch64.manylinux_2_28_aarch64", target.tag)
+
+            with patch.dict(os.environ, target_module.create_target("3.11", ["manylinux2014_x86_64"]).as_settings()):
+                self.assertEqual("cp3.11-default-manylinux2014_x86_64", target_module.get_target_tag())
+
+        with patch.dict(os.environ, {"LAMBDA_BUNDLER_TARGET_PYTHON_VERSION": "three"}):
+            with self.assertRaises(ValueError):
+                target_module.get_target()
+
+        with self.assertRaises(ValueError):
+            target_module.create_target(platforms=["manylinux2014_x86_64.whl"])
+
+        # pip installs for the version of the build then, so hosts with other versions don't share archives
+        with patch(self.module + "sys.version_info", MagicMock(major=3, minor=9)):
+            self.assertEqual(
+                "cp3.9-default-manylinux2014_x86_64",
+                target_module.create_target(platforms=["manylinux2014_x86_64"]).tag
+            )
+
+    def test_get_pip_options(self):
+        """Asserts pip only installs wheels for the target"""
+
+        target = target_module.create_target("3.12", ["manylinux2014_x86_64"], abis=["cp312", "abi3"])
+
+        self.assertEqual(
+            ["--only-binary=:all:", "--implementation", "cp", "--python-version", "3.12",
+             "--abi", "cp312", "--abi", "abi3", "--platform", "manylinux2014_x86_64"],
+            target.get_pip_options()
+        )
+
+    def test_check_pip_output(self):
+        """Asserts a missing wheel is reported with the requirement and the target"""
+
+        target = target_module.create_target("3.12", ["manylinux2014_aarch64"])
+        output = "ERROR: Could not find a version that satisfies the requirement docopt==0.6.2 (from versions: none)\n" \
+            "ERROR: No matching distribution found for docopt==0.6.2\n"
+
+        with self.assertRaisesRegex(target_module.NoCompatibleWheelError, "'docopt==0.6.2'.*manylinux2014_aarch64"):
+            target_module.check_pip_output(output, target)
+
+        # Other failures are left to the caller
+        target_module.check_pip_output("ERROR: Could not install packages due to an OSError", target)
+
+if __name__ == "__main__":
+    unittest.main()
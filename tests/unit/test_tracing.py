@@ -0,0 +1,102 @@
+"""Tests for the lambda_bundler.tracing module."""
+import os
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+import lambda_bundler.archive as archive
+import lambda_bundler.tracing as target_module
+import lambda_bundler.util as util
+
+class TracingTestCases(unittest.TestCase):
+    """Test cases for the tracing module"""
+
+    def setUp(self):
+        self.module = "lambda_bundler.tracing."
+
+    def test_span_notifies_listeners(self):
+        """Asserts listeners receive finished spans with their attributes"""
+
+        spans = []
+        target_module.add_listener(spans.append)
+        try:
+            with target_module.span("hash", directory="src") as attributes:
+                attributes["files"] = 3
+
+            with self.assertRaises(KeyError), target_module.span("install"):
+                raise KeyError("requests")
+        finally:
+            target_module.remove_listener(spans.append)
+
+        with target_module.span("unobserved"):
+            pass
+
+        self.assertEqual(["hash", "install"], [span.name for span in spans])
+        self.assertEqual({"directory": "src", "files": 3}, spans[0].attributes)
+        self.assertEqual(os.getpid(), spans[0].process_id)
+        self.assertGreaterEqual(spans[0].duration, 0)
+        self.assertEqual("KeyError", spans[1].attributes["error"])
+
+    def test_failing_listener(self):
+        """Asserts a failing listener doesn't break the build"""
+
+        def fail(_):
+            raise ValueError("broken")
+
+        target_module.add_listener(fail)
+        try:
+            with self.assertLogs("lambda_bundler", "WARNING"), target_module.span("build"):
+                pass
+        finally:
+            target_module.remove_listener(fail)
+
+    def test_chrome_trace_export(self):
+        """Asserts the stages of a build are exported as Chrome trace events"""
+
+        with tempfile.TemporaryDirectory() as source_directory, \
+            tempfile.TemporaryDirectory() as trace_directory:
+
+            with open(os.path.join(source_directory, "handler.py"), "w") as handle:
+                handle.write("value = 1\n" * 100)
+
+            trace_path = os.path.join(trace_directory, "trace.json")
+            with target_module.trace_to(trace_path):
+                archive.zip_directory(source_directory, os.path.join(trace_directory, "first.zip"))
+
+            # Additional events are appended to the trace
+            with patch.dict(os.environ, {"LAMBDA_BUNDLER_TRACE_FILE": trace_path}):
+                archive.zip_directory(source_directory, os.path.join(trace_directory, "second.zip"))
+
+            # The settings of a session trace to a file as well
+            with util.activate({"LAMBDA_BUNDLER_TRACE_FILE": trace_path}):
+                archive.zip_directory(source_directory, os.path.join(trace_directory, "third.zip"))
+
+            events = target_module.load_trace(trace_path)
+
+        self.assertEqual(["compress", "compress", "compress"], [event["name"] for event in events])
+        self.assertEqual("X", events[0]["ph"])
+        self.assertEqual(1, events[0]["args"]["files"])
+        self.assertEqual(1000, events[0]["args"]["bytes"])
+        self.assertLessEqual(events[0]["ts"] + events[0]["dur"], events[1]["ts"])
+
+    def test_traced(self):
+        """Asserts decorated functions are wrapped in a span"""
+
+        spans = []
+
+        @target_module.traced("add")
+        def add(first, second):
+            return first + second
+
+        target_module.add_listener(spans.append)
+        try:
+            self.assertEqual(3, add(1, 2))
+        finally:
+            target_module.remove_listener(spans.append)
+
+        self.assertEqual("add", spans[0].name)
+        self.assertEqual("add", add.__name__)
+
+if __name__ == "__main__":
+    unittest.main()
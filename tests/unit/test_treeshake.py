@@ -0,0 +1,83 @@
+"""Tests for the lambda_bundler.treeshake module."""
+import os
+import pathlib
+import tempfile
+import unittest
+import zipfile
+
+import lambda_bundler.treeshake as target_module
+import lambda_bundler.util as util
+
+class TreeshakeTestCases(unittest.TestCase):
+    """Test cases for the import analysis"""
+
+    def test_get_module_name(self):
+        """Asserts module names are derived from the paths in the archive"""
+
+        self.assertEqual(("pytz", True), target_module.get_module_name("pytz/__init__.py"))
+        self.assertEqual(("pytz.tzinfo", False), target_module.get_module_name("pytz/tzinfo.py"))
+        self.assertEqual(
+            ("yaml._yaml", False),
+            target_module.get_module_name("yaml/_yaml.cpython-38-x86_64-linux-gnu.so")
+        )
+        self.assertIsNone(target_module.get_module_name("pytz/zoneinfo/UTC"))
+        self.assertIsNone(target_module.get_module_name("pytz-2020.1.dist-info/METADATA"))
+
+    def test_find_imports(self):
+        """Asserts absolute, relative and dynamic imports are found"""
+
+        source = b"\n".join([
+            b"import os.path",
+            b"from . import tzinfo",
+            b"from .lazy import LazyDict",
+            b"import importlib",
+            b"def load():",
+            b"    return importlib.import_module('pytz.reference')",
+        ])
+
+        imports = target_module.find_imports(target_module.Module("pytz", True, None), source)
+
+        self.assertTrue({"os.path", "pytz", "pytz.tzinfo", "pytz.lazy", "pytz.lazy.LazyDict",
+                         "importlib", "pytz.reference"} <= imports)
+        self.assertEqual(
+            {"pytz", "pytz.tzinfo"},
+            target_module.find_imports(target_module.Module("pytz.lazy", False, None), b"from . import tzinfo")
+        )
+
+    def test_shake_dependencies(self):
+        """Asserts only reachable modules and their data are kept"""
+
+        with tempfile.TemporaryDirectory() as directory:
+
+            path_to_zip = os.path.join(directory, "dependencies.zip")
+            with zipfile.ZipFile(path_to_zip, "w") as zip_file:
+                zip_file.writestr("used/__init__.py", "from .core import run")
+                zip_file.writestr("used/core.py", "import helper")
+                zip_file.writestr("used/data/config.json", "{}")
+                zip_file.writestr("used/unused.py", "import unused_package")
+                zip_file.writestr("helper.py", "")
+                zip_file.writestr("unused_package/__init__.py", "")
+                zip_file.writestr("unused_package/data.json", "{}")
+                zip_file.writestr("plugin/__init__.py", "")
+                zip_file.writestr("used-1.0.dist-info/METADATA", "Name: used")
+
+            code_directory = os.path.join(directory, "lambda")
+            pathlib.Path(code_directory).mkdir()
+            with open(os.path.join(code_directory, "handler.py"), "w") as handle:
+                handle.write("import used\n")
+
+            code_entries = list(util.walk_sources([code_directory], []))
+
+            keep = target_module.shake_dependencies(path_to_zip, code_entries, ["lambda.handler"], ["plugin"])
+
+            self.assertEqual(
+                {"used/__init__.py", "used/core.py", "used/data/config.json", "helper.py",
+                 "plugin/__init__.py", "used-1.0.dist-info/METADATA"},
+                keep
+            )
+
+            with self.assertRaises(ValueError):
+                target_module.shake_dependencies(path_to_zip, code_entries, ["lambda.missing"])
+
+if __name__ == "__main__":
+    unittest.main()
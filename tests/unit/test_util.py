@@ -1,8 +1,8 @@
 """Tests for the lambda_bundler.util module."""
 import os
 import pathlib
-import shutil
 import tempfile
+import threading
 import unittest
 
 from unittest.mock import patch
@@ -47,51 +47,56 @@ class UtilTestCases(unittest.TestCase):
 
         self.assertEqual(expected_result, actual_result)
 
-    def test_extend_zip(self):
-        """Asserts that extend_zip works as intended"""
+    def test_hash_file(self):
+        """Asserts hash_file returns the sha256 hexdigest of the file content"""
 
-        with tempfile.TemporaryDirectory() as source_directory, \
-            tempfile.TemporaryDirectory() as target_directory, \
-            tempfile.TemporaryDirectory() as assertion_directory:
+        with tempfile.TemporaryDirectory() as input_directory:
 
-            directories_in_source = ["src/lambda", "tests"]
+            path = os.path.join(input_directory, "file")
+            with open(path, "w") as handle:
+                handle.write("test")
 
-            for directory in directories_in_source:
-                pathlib.Path(os.path.join(source_directory, directory)).mkdir(parents=True, exist_ok=True)
+            self.assertEqual(target_module.hash_string("test"), target_module.hash_file(path))
 
-            pathlib.Path(os.path.join(source_directory, "initial")).mkdir(parents=True, exist_ok=True)
-            with open(os.path.join(source_directory, "initial", "test.txt"), "w") as handle:
-                handle.write("test-content")
+    def test_walk_sources(self):
+        """Asserts walk_sources honors the exclude patterns and reports empty directories"""
 
-            with open(os.path.join(source_directory, "src", "lambda", "handler.py"), "w") as handle:
-                handle.write("test-content")
+        with tempfile.TemporaryDirectory() as source_directory:
 
-            zip_path = os.path.join(target_directory, "target")
-            shutil.make_archive(zip_path, "zip", os.path.join(source_directory, "initial"))
+            for directory in ["src/lambda", "src/__pycache__", "src/empty", "tests"]:
+                pathlib.Path(os.path.join(source_directory, directory)).mkdir(parents=True)
 
-            # Verify the test setup was ok
-            self.assertTrue(os.path.exists(zip_path + ".zip"))
+            for file_name in ["src/lambda/handler.py", "src/__pycache__/a.pyc", "src/b.py", "src/a.txt"]:
+                with open(os.path.join(source_directory, file_name), "w") as handle:
+                    handle.write("test-content")
 
-            target_module.extend_zip(
-                path_to_zip=zip_path + ".zip",
+            entries = list(target_module.walk_sources(
                 code_directories=[
                     os.path.join(source_directory, "src"),
                     os.path.join(source_directory, "tests")
-                ]
+                ],
+                exclude_patterns=["__pycache__", "*.txt"]
+            ))
+
+            self.assertEqual(
+                ["src/b.py", "src/empty/", "src/lambda/handler.py", "tests/"],
+                [entry.arcname for entry in entries]
             )
+            self.assertEqual([False, True, False, True], [entry.is_directory for entry in entries])
 
-            # Verify the zip still exists
-            self.assertTrue(os.path.exists(zip_path + ".zip"))
+    def test_walk_directory(self):
+        """Asserts walk_directory returns archive names relative to the directory"""
 
-            # Extract the zip
-            shutil.unpack_archive(zip_path + ".zip", assertion_directory)
+        with tempfile.TemporaryDirectory() as source_directory:
 
-            # Assert that our code directories exist
-            self.assertTrue(os.path.exists(os.path.join(assertion_directory, "src", "lambda", "handler.py")))
-            self.assertTrue(os.path.exists(os.path.join(assertion_directory, "tests")))
+            pathlib.Path(os.path.join(source_directory, "python", "empty")).mkdir(parents=True)
+            with open(os.path.join(source_directory, "python", "a.py"), "w") as handle:
+                handle.write("test-content")
 
-            # Assert that the content of our initial zip is there as well
-            self.assertTrue(os.path.exists(os.path.join(assertion_directory, "test.txt")))
+            self.assertEqual(
+                ["python/a.py", "python/empty/"],
+                [entry.arcname for entry in target_module.walk_directory(source_directory)]
+            )
 
     def test_get_build_dir(self):
         """Assert that get_build_dir works with the environment variable"""
@@ -112,6 +117,22 @@ class UtilTestCases(unittest.TestCase):
         if backup_env is not None:
             os.environ[target_module.BUILD_DIR_ENV] = backup_env
 
+    def test_get_in_memory_build_dir(self):
+        """Assert the build directory is in shared memory if it's enabled and available"""
+
+        with patch.dict(os.environ, {target_module.IN_MEMORY_BUILD_DIR_ENV: "true"}), \
+            patch(self.module + "os.access", return_value=True), \
+            patch(self.module + "os.path.isdir") as isdir_mock:
+            os.environ.pop(target_module.BUILD_DIR_ENV, None)
+
+            isdir_mock.return_value = True
+            self.assertEqual(os.path.join("/dev/shm", "lambda_bundler_builds"), target_module.get_build_dir())
+
+            isdir_mock.return_value = False
+            self.assertEqual(
+                os.path.join(tempfile.gettempdir(), "lambda_bundler_builds"), target_module.get_build_dir()
+            )
+
     def test_return_empty_if_skip_install(self):
         """Assert the decorator works as expected."""
 
@@ -139,5 +160,51 @@ class UtilTestCases(unittest.TestCase):
         if prev is not None:
             os.environ["LAMBDA_BUNDLER_SKIP_INSTALL"] = prev
 
+    def test_file_cache(self):
+        """Asserts files are read once until they change and reads are recorded"""
+
+        with tempfile.TemporaryDirectory() as input_directory:
+
+            path = os.path.join(input_directory, "requirements.txt")
+            with open(path, "w") as handle:
+                handle.write("pytz")
+
+            file_cache = target_module.FileCache()
+            with patch(self.module + "_read_file", wraps=target_module._read_file) as read_mock:
+                with file_cache.record_reads() as reads:
+                    self.assertEqual("pytz", file_cache.read(path))
+                    self.assertEqual("pytz", file_cache.read(path))
+                self.assertEqual(1, read_mock.call_count)
+                self.assertEqual({path: target_module.FileCache.get_stat_key(path)}, reads)
+
+                with open(path, "w") as handle:
+                    handle.write("pytz==2020.1")
+                self.assertEqual("pytz==2020.1", file_cache.read(path))
+                self.assertEqual(2, read_mock.call_count)
+
+            self.assertEqual(target_module.hash_string("pytz==2020.1"), file_cache.hash(path))
+            self.assertIsNone(target_module.FileCache.get_stat_key(os.path.join(input_directory, "missing")))
+
+    def test_activate(self):
+        """Asserts active settings replace the environment in their thread and bound functions"""
+
+        with patch.dict(os.environ, {"LAMBDA_BUNDLER_BUILD_DIR": "/environment"}):
+            results = {}
+
+            with target_module.activate({"LAMBDA_BUNDLER_BUILD_DIR": "/session"}):
+                self.assertEqual("/session", target_module.get_build_dir())
+                bound = target_module.bind_active(target_module.get_build_dir)
+                unbound = threading.Thread(target=lambda: results.setdefault("unbound", target_module.get_build_dir()))
+                unbound.start()
+                unbound.join()
+
+            thread = threading.Thread(target=lambda: results.setdefault("bound", bound()))
+            thread.start()
+            thread.join()
+
+            self.assertEqual({"unbound": "/environment", "bound": "/session"}, results)
+            self.assertEqual("/environment", target_module.get_build_dir())
+            self.assertEqual({}, target_module.get_active_settings())
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,109 @@
+"""Tests for the lambda_bundler.watch module."""
+import json
+import os
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+import lambda_bundler.bundler as bundler
+import lambda_bundler.watch as target_module
+
+class WatchTestCases(unittest.TestCase):
+    """Test cases for the watch module"""
+
+    def setUp(self):
+        self.module = "lambda_bundler.watch."
+
+    def test_load_config(self):
+        """Asserts functions and layers are loaded with paths relative to the config"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bundler.json")
+            with open(path, "w") as handle:
+                json.dump({
+                    "layers": {"shared": {"requirement_files": ["layer/requirements.txt"]}},
+                    "functions": {"api": {"code_directories": ["src"], "exclude_patterns": ["*.pyc"]}}
+                }, handle)
+
+            specs = target_module.load_config(path)
+
+            self.assertEqual(
+                bundler.LayerSpec([os.path.join(directory, "layer", "requirements.txt")]), specs["shared"]
+            )
+            self.assertEqual(
+                bundler.PackageSpec([os.path.join(directory, "src")], exclude_patterns=["*.pyc"]), specs["api"]
+            )
+
+            with open(path, "w") as handle:
+                json.dump({"functions": {"api": {"requirement_files": []}}}, handle)
+
+            with self.assertRaises(ValueError):
+                target_module.load_config(path)
+
+    def test_is_affected(self):
+        """Asserts only changes of the sources of a spec affect it"""
+
+        layer = bundler.LayerSpec(["/project/requirements.txt"])
+        package = bundler.PackageSpec(["/project/src"], ["/project/requirements.txt"], exclude_patterns=["*.md"])
+
+        self.assertTrue(target_module.is_affected(layer, "/project/requirements.txt"))
+        self.assertFalse(target_module.is_affected(layer, "/project/src/handler.py"))
+
+        self.assertTrue(target_module.is_affected(package, "/project/requirements.txt"))
+        self.assertTrue(target_module.is_affected(package, "/project/src/handler.py"))
+        self.assertTrue(target_module.is_affected(package, "/project/src"))
+        self.assertFalse(target_module.is_affected(package, "/project/src/README.md"))
+        self.assertFalse(target_module.is_affected(package, "/project/src/__pycache__/handler.cpython-38.pyc"))
+        self.assertFalse(target_module.is_affected(package, "/project/src2/handler.py"))
+
+    def test_watchers(self):
+        """Asserts the watchers report created, changed and deleted files"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "handler.py")
+            with open(path, "w") as handle:
+                handle.write("a = 1")
+
+            for polling in [True, False]:
+                watcher = target_module.create_watcher([directory], polling=polling)
+                if isinstance(watcher, target_module.PollingWatcher):
+                    watcher.interval = 0.01
+                try:
+                    self.assertEqual(set(), watcher.wait(0.05))
+
+                    with open(path, "w") as handle:
+                        handle.write("a = 22")
+                    self.assertIn(path, target_module.collect_changes(watcher, 0.05, timeout=2))
+
+                    package_directory = os.path.join(directory, type(watcher).__name__)
+                    os.makedirs(package_directory)
+                    new_path = os.path.join(package_directory, "module.py")
+                    with open(new_path, "w") as handle:
+                        handle.write("b = 2")
+                    self.assertIn(new_path, target_module.collect_changes(watcher, 0.05, timeout=2))
+
+                    os.remove(new_path)
+                    self.assertIn(new_path, target_module.collect_changes(watcher, 0.05, timeout=2))
+                finally:
+                    watcher.close()
+
+    def test_build_specs(self):
+        """Asserts failed builds are reported without stopping the others"""
+
+        specs = {
+            "layer": bundler.LayerSpec(["requirements.txt"]),
+            "function": bundler.PackageSpec(["src"])
+        }
+        messages = []
+
+        with patch(self.module + "bundler.BuildSession.build_layer_package") as layer_mock, \
+             patch(self.module + "bundler.BuildSession.build_lambda_package") as package_mock:
+            layer_mock.side_effect = RuntimeError("pip failed")
+            package_mock.return_value = "function.zip"
+
+            self.assertEqual({"function": "function.zip"}, target_module.build_specs(specs, specs, messages.append))
+
+        layer_mock.assert_called_once_with(requirement_files=["requirements.txt"], workers=None, size_budget=None)
+        self.assertIn("Failed to build layer: pip failed", messages)
+        self.assertTrue(messages[1].startswith("Built function in"))
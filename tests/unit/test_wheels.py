@@ -0,0 +1,115 @@
+"""Tests for the lambda_bundler.wheels module."""
+import csv
+import io
+import os
+import tempfile
+import unittest
+import zipfile
+
+import lambda_bundler.slimming as slimming
+import lambda_bundler.wheels as target_module
+
+class WheelsTestCases(unittest.TestCase):
+    """Test cases for the wheel installer"""
+
+    def setUp(self):
+        self.module = "lambda_bundler.wheels."
+
+    def _create_wheel(self, directory, files):
+        path = os.path.join(directory, "demo-1.0-py3-none-any.whl")
+        files = dict(files)
+        files["demo-1.0.dist-info/WHEEL"] = "Wheel-Version: 1.0\nRoot-Is-Purelib: true\n"
+        files["demo-1.0.dist-info/RECORD"] = "\n".join(
+            f"{name},sha256=abc,{len(content)}" for name, content in files.items()
+        )
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as wheel_zip:
+            for name, content in files.items():
+                wheel_zip.writestr(name, content)
+        return path
+
+    def test_parse_wheel_name(self):
+        """Asserts the tags of a wheel name are split"""
+
+        wheel_name = target_module.parse_wheel_name(
+            "/wheelhouse/numpy-1.19.0-1-cp38-cp38-manylinux2010_x86_64.manylinux2014_x86_64.whl"
+        )
+
+        self.assertEqual("numpy", wheel_name.name)
+        self.assertEqual("1.19.0", wheel_name.version)
+        self.assertEqual("1", wheel_name.build)
+        self.assertEqual(("cp38",), wheel_name.python_tags)
+        self.assertEqual(("manylinux2010_x86_64", "manylinux2014_x86_64"), wheel_name.platform_tags)
+
+        with self.assertRaises(ValueError):
+            target_module.parse_wheel_name("numpy-1.19.0.tar.gz")
+
+    def test_install_wheel(self):
+        """Asserts the wheel is installed like pip would, without its data directory and with a new RECORD"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            wheel_path = self._create_wheel(directory, {
+                "demo/__init__.py": "import demo",
+                "demo/tests/test_demo.py": "assert True",
+                "demo-1.0.data/platlib/_demo.so": "binary",
+                "demo-1.0.data/data/share/demo.txt": "data",
+            })
+            path_to_zip = os.path.join(directory, "demo.zip")
+
+            target_module.install_wheel(wheel_path, path_to_zip, include=lambda name: "/tests/" not in name)
+
+            with zipfile.ZipFile(path_to_zip) as zip_file:
+                self.assertIsNone(zip_file.testzip())
+                self.assertEqual(
+                    ["_demo.so", "demo-1.0.dist-info/INSTALLER", "demo-1.0.dist-info/RECORD",
+                     "demo-1.0.dist-info/WHEEL", "demo/__init__.py", "share/demo.txt"],
+                    sorted(zip_file.namelist())
+                )
+                self.assertEqual(b"binary", zip_file.read("_demo.so"))
+                record = list(csv.reader(io.StringIO(zip_file.read("demo-1.0.dist-info/RECORD").decode("utf-8"))))
+
+            self.assertIn(["_demo.so", "sha256=abc", "6"], record)
+            self.assertIn(["demo-1.0.dist-info/RECORD", "", ""], record)
+            self.assertNotIn("demo/tests/test_demo.py", [row[0] for row in record])
+
+    def test_install_wheel_with_profile(self):
+        """Asserts the files a slimming profile excludes are left out and reported"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            wheel_path = self._create_wheel(directory, {
+                "demo/__init__.py": "import demo",
+                "demo/tests/test_demo.py": "assert True",
+                "demo/tests/conftest.py": "",
+            })
+            path_to_zip = os.path.join(directory, "demo.zip")
+            profile = slimming.SlimmingProfile("demo", ("tests",), False)
+
+            with self.assertLogs("lambda_bundler", level="INFO") as logs:
+                target_module.install_wheel(wheel_path, path_to_zip, profile=profile)
+
+            with zipfile.ZipFile(path_to_zip) as zip_file:
+                self.assertNotIn("demo/tests/test_demo.py", zip_file.namelist())
+                self.assertIn("demo/__init__.py", zip_file.namelist())
+
+            self.assertIn(
+                "with the demo profile removed 2 files with 11 bytes and stripped 0 bytes from binaries",
+                "\n".join(logs.output)
+            )
+
+    def test_unsupported_wheels(self):
+        """Asserts wheels that need pip are rejected before anything is written"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            path_to_zip = os.path.join(directory, "demo.zip")
+
+            wheel_path = self._create_wheel(directory, {"demo-1.0.data/scripts/demo": "#!python"})
+            with self.assertRaises(target_module.UnsupportedWheelError):
+                target_module.install_wheel(wheel_path, path_to_zip)
+
+            wheel_path = self._create_wheel(directory, {"../demo.py": "import os"})
+            with self.assertRaises(target_module.UnsupportedWheelError):
+                target_module.install_wheel(wheel_path, path_to_zip)
+
+            self.assertFalse(os.path.exists(path_to_zip))
+
+if __name__ == "__main__":
+    unittest.main()